@@ -0,0 +1,74 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure memory allocated per harvest with and without a BufferPool
+
+Records spans into a batch and reports the peak memory traced while the
+batch is flushed and its payload encoded and compressed, in steady state
+after the pooled buffers have grown to the payload size. Each combination
+of pooling, chunked encoding (``max_pause_ms``) and encoded batches is
+measured, since the pool only holds the compressed output.
+
+Usage::
+
+    $ python benchmarks/bench_buffer_pool.py
+"""
+
+import tracemalloc
+
+from newrelic_telemetry_sdk import Span, SpanBatch, SpanClient
+from newrelic_telemetry_sdk.buffers import BufferPool
+
+SPANS = 50_000
+HARVESTS = 5
+SPAN_LIST = [Span("request", {"n": i}, trace_id="trace") for i in range(SPANS)]
+
+CONFIGURATIONS = (
+    ("no pool", False, False, None),
+    ("pool", False, True, None),
+    ("pool, chunked", False, True, 5),
+    ("encoded, no pool", True, False, None),
+    ("encoded, pool", True, True, None),
+)
+
+
+def harvest_peaks(encode, pool, max_pause_ms):
+    batch = SpanBatch(encode=encode)
+    client = SpanClient("benchmark", buffer_pool=pool, max_pause_ms=max_pause_ms)
+    peaks = []
+    for _ in range(HARVESTS):
+        for span in SPAN_LIST:
+            batch.record(span)
+
+        tracemalloc.start()
+        payload = client._create_payload(*batch.flush())
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        if pool is not None:
+            pool.release(payload)
+        del payload
+    client.close()
+    return peaks
+
+
+def main():
+    print(f"{SPANS:,} spans per harvest")
+    for label, encode, pooled, max_pause_ms in CONFIGURATIONS:
+        peaks = harvest_peaks(encode, BufferPool() if pooled else None, max_pause_ms)
+        print(f"{label:<18} first {peaks[0] / 1e6:6.2f} MB  steady state {min(peaks[1:]) / 1e6:6.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare record and harvest costs of SpanBatch with and without encode
+
+The harvest time is the time spent flushing the batch and creating the
+compressed payload, which is the pause seen by the harvester thread.
+
+Usage::
+
+    $ python benchmarks/bench_encode.py
+"""
+
+import time
+
+from newrelic_telemetry_sdk import Span, SpanBatch, SpanClient
+
+SPANS = 20_000
+TAGS = {"service.name": "bench", "db.statement": "SELECT * FROM users WHERE id = ?", "http.status_code": 200}
+
+
+def main():
+    client = SpanClient("benchmark")
+    spans = [Span("query", TAGS, trace_id="trace", parent_id="parent", duration_ms=1) for _ in range(SPANS)]
+
+    for encode in (False, True):
+        batch = SpanBatch(encode=encode)
+
+        start = time.perf_counter()
+        for span in spans:
+            batch.record(span)
+        recorded = time.perf_counter()
+        client._create_payload(*batch.flush())
+        harvested = time.perf_counter()
+
+        label = "encode=True" if encode else "encode=False"
+        print(
+            f"{label:<14} record {(recorded - start) / SPANS * 1e6:6.2f} us/span"
+            f"  harvest {(harvested - recorded) * 1000:8.2f} ms"
+        )
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure application thread latency while a large payload is created
+
+An application thread repeatedly sleeps for 1ms and records how late it
+wakes up, while the main thread creates the payload for a large batch of
+spans. Lateness beyond a few hundred microseconds is time spent waiting for
+the GIL.
+
+Usage::
+
+    $ python benchmarks/bench_harvest_latency.py
+"""
+
+import statistics
+import threading
+import time
+
+from newrelic_telemetry_sdk import Span, SpanClient
+
+SPANS = 100_000
+TAGS = {"service.name": "bench", "db.statement": "SELECT * FROM users WHERE id = ?", "http.status_code": 200}
+
+
+def app_thread(stop, delays):
+    while not stop.is_set():
+        start = time.perf_counter()
+        time.sleep(0.001)
+        delays.append(time.perf_counter() - start - 0.001)
+
+
+def measure(client, spans):
+    stop = threading.Event()
+    delays = []
+    thread = threading.Thread(target=app_thread, args=(stop, delays))
+    thread.start()
+    time.sleep(0.05)
+
+    start = time.perf_counter()
+    client._create_payload(spans, None)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    thread.join()
+    return elapsed, delays
+
+
+def main():
+    spans = [Span("query", TAGS, trace_id="trace", parent_id="parent", duration_ms=1) for _ in range(SPANS)]
+
+    for max_pause_ms in (None, 20, 5, 1):
+        client = SpanClient("benchmark", max_pause_ms=max_pause_ms)
+        # Warm up the adaptive chunk size
+        client._create_payload(spans[:10_000], None)
+        elapsed, delays = measure(client, spans)
+        client.close()
+
+        quantiles = statistics.quantiles(delays, n=100)
+        print(
+            f"max_pause_ms={max_pause_ms!s:<5} payload {elapsed * 1000:7.1f} ms"
+            f"  app delay p50 {quantiles[49] * 1000:6.2f} ms"
+            f"  p99 {quantiles[98] * 1000:6.2f} ms"
+            f"  max {max(delays) * 1000:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the caller side cost of logger.info with NewRelicLogHandler
+
+Usage::
+
+    $ python benchmarks/bench_log_handler.py
+"""
+
+import io
+import logging
+import timeit
+
+from newrelic_telemetry_sdk import LogRecordBatch, NewRelicLogFormatter, NewRelicLogHandler
+
+NUMBER = 50_000
+REPEAT = 5
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+def main():
+    batch = LogRecordBatch(capacity=NUMBER * REPEAT)
+
+    formatted = logging.StreamHandler(io.StringIO())
+    formatted.setFormatter(NewRelicLogFormatter())
+
+    cases = (
+        ("NullHandler", logging.NullHandler()),
+        ("StreamHandler + NewRelicLogFormatter", formatted),
+        ("NewRelicLogHandler", NewRelicLogHandler(batch)),
+    )
+
+    for label, handler in cases:
+        logger = make_logger(f"bench.{type(handler).__name__}", handler)
+
+        def log(logger=logger):
+            logger.info("Request %s completed in %d ms", "/index", 12, extra={"customer": 42})
+
+        elapsed = min(timeit.repeat(log, number=NUMBER, repeat=REPEAT))
+        print(f"{label:<40} {elapsed / NUMBER * 1e9:8.0f} ns/call")
+
+        # Discard buffered records between runs without converting them
+        batch._records.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure gzip throughput with and without compression threads
+
+Usage::
+
+    $ python benchmarks/bench_parallel_gzip.py
+"""
+
+import os
+import time
+
+from newrelic_telemetry_sdk import Span, SpanClient
+from newrelic_telemetry_sdk.compact import encode
+
+SPANS = 200_000
+REPEAT = 3
+
+
+def main():
+    spans = [
+        Span("request", {"http.url": f"https://example.com/users/{i}", "n": i}, trace_id="trace") for i in range(SPANS)
+    ]
+    payload = b"[" + b",".join(encode(span) for span in spans) + b"]"
+    size_mb = len(payload) / 1e6
+    print(f"payload: {size_mb:.1f} MB, {os.cpu_count()} CPUs")
+
+    for threads in (None, 2, 4, 8):
+        client = SpanClient("benchmark", compression_threads=threads)
+        elapsed = float("inf")
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            compressed = client._compress(payload)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        client.close()
+        print(
+            f"compression_threads={threads!s:<5} {size_mb / elapsed:7.1f} MB/s"
+            f"  ratio {len(payload) / len(compressed):5.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure Prometheus exposition parsing time for 100,000 series
+
+Generate an exposition file with counters, gauges and histograms totalling
+100,000 series, and record it into a metric batch twice: the first scrape
+stores the state of every series and the second records the counter and
+histogram increases. Each scrape must finish within ``MAX_SECONDS`` seconds,
+otherwise the benchmark exits with a failure status.
+
+Then serve the exposition from several local HTTP endpoints and report the
+time taken to scrape all of them concurrently.
+
+Usage::
+
+    $ python benchmarks/bench_prometheus.py
+"""
+
+import http.server
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+
+from newrelic_telemetry_sdk import MetricBatch
+from newrelic_telemetry_sdk.prometheus import PrometheusScraper
+
+COUNTERS = 50_000
+GAUGES = 28_000
+HISTOGRAMS = 2_000
+BUCKETS = ("0.005", "0.01", "0.05", "0.1", "0.5", "1", "5", "10", "+Inf")
+MAX_SECONDS = 5.0
+ENDPOINTS = 4
+
+
+def exposition(scrape):
+    lines = ["# HELP http_requests_total Requests handled.", "# TYPE http_requests_total counter"]
+    lines.extend(
+        f'http_requests_total{{route="/route/{index // 10}",status="{200 + index % 10}"}} {index * (scrape + 1)}'
+        for index in range(COUNTERS)
+    )
+
+    lines.append("# TYPE queue_depth gauge")
+    lines.extend(f'queue_depth{{queue="queue-{index}"}} {index % 97}' for index in range(GAUGES))
+
+    lines.append("# TYPE request_seconds histogram")
+    for index in range(HISTOGRAMS):
+        labels = f'route="/route/{index}"'
+        lines.extend(
+            f'request_seconds_bucket{{{labels},le="{bound}"}} {(position + 1) * (scrape + 1)}'
+            for position, bound in enumerate(BUCKETS)
+        )
+        lines.append(f"request_seconds_sum{{{labels}}} {2.5 * (scrape + 1)}")
+        lines.append(f"request_seconds_count{{{labels}}} {len(BUCKETS) * (scrape + 1)}")
+    return "\n".join(lines) + "\n"
+
+
+def series_count(text):
+    return sum(1 for line in text.splitlines() if line and not line.startswith("#"))
+
+
+def bench_parse(directory):
+    scraper = PrometheusScraper(MetricBatch(), [])
+    slowest = 0.0
+    for scrape in range(2):
+        path = directory / f"scrape-{scrape}.prom"
+        text = exposition(scrape)
+        path.write_text(text)
+
+        with path.open() as lines:
+            start = time.perf_counter()
+            scraper.record(lines, "http://localhost:9100/metrics")
+            elapsed = time.perf_counter() - start
+
+        metrics = len(scraper.batch.flush()[0])
+        slowest = max(slowest, elapsed)
+        print(f"scrape {scrape}       {series_count(text):,} series in {elapsed:6.3f}s  {metrics:,} metrics recorded")
+    return slowest
+
+
+def serve(text):
+    data = text.encode()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_scrape():
+    text = exposition(0)
+    servers = [serve(text) for _ in range(ENDPOINTS)]
+    urls = ["http://{}:{}/metrics".format(*server.server_address) for server in servers]
+    scraper = PrometheusScraper(MetricBatch(), urls)
+    try:
+        start = time.perf_counter()
+        scraper.scrape()
+        elapsed = time.perf_counter() - start
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    print(f"endpoints={ENDPOINTS}  {ENDPOINTS * series_count(text):,} series scraped in {elapsed:6.3f}s")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        slowest = bench_parse(pathlib.Path(directory))
+    bench_scrape()
+
+    if slowest > MAX_SECONDS:
+        print(f"FAILED: a scrape took {slowest:.3f}s, more than {MAX_SECONDS}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
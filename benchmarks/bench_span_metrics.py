@@ -0,0 +1,58 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the per-span cost of deriving metrics with SpanMetrics
+
+Compares SpanMetrics.record with recording the same count and duration
+metrics through record_count and record_summary, which build the metric
+identities on every call, and reports the overhead SpanMetrics adds to
+SpanBatch.record. SpanMetrics.record also checks the span for errors.
+
+Usage::
+
+    $ python benchmarks/bench_span_metrics.py
+"""
+
+import timeit
+
+from newrelic_telemetry_sdk import MetricBatch, Span, SpanBatch
+from newrelic_telemetry_sdk.span_metrics import SpanMetrics
+
+NUMBER = 200_000
+
+
+def main():
+    span = Span("query", {"db": "users", "host": "localhost"}, duration_ms=5)
+    metric_batch = MetricBatch()
+
+    def manual():
+        tags = {"span.name": "query", "db": "users"}
+        metric_batch.record_count("span.count", 1, tags)
+        metric_batch.record_summary("span.duration", 5, tags)
+
+    cases = (
+        ("SpanBatch.record", SpanBatch().record),
+        ("SpanBatch.record with SpanMetrics", SpanBatch(metrics=SpanMetrics(metric_batch, ("db",))).record),
+        ("SpanMetrics.record", SpanMetrics(metric_batch, ("db",)).record),
+    )
+
+    elapsed = min(timeit.repeat(manual, number=NUMBER, repeat=5))
+    print(f"{'record_count + record_summary':<36} {elapsed / NUMBER * 1e9:8.0f} ns/span")
+    for label, record in cases:
+        elapsed = min(timeit.repeat(lambda record=record: record(span), number=NUMBER, repeat=5))
+        print(f"{label:<36} {elapsed / NUMBER * 1e9:8.0f} ns/span")
+
+
+if __name__ == "__main__":
+    main()
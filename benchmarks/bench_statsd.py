@@ -0,0 +1,104 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure StatsD parsing throughput and sustained packets per second
+
+First, parse a mix of StatsD lines in process. Then send single line
+datagrams from several sender processes to a listener on localhost for a
+few seconds, and report how many datagrams per second the listener received
+and how many were lost, for one socket and for several ``SO_REUSEPORT``
+sockets.
+
+Usage::
+
+    $ python benchmarks/bench_statsd.py
+"""
+
+import multiprocessing
+import socket
+import time
+
+from newrelic_telemetry_sdk import MetricBatch
+from newrelic_telemetry_sdk.statsd import StatsdListener, StatsdParser
+
+LINES = (
+    b"http.requests:1|c|#status:200,route:/users",
+    b"http.latency:12.5|ms|#route:/users",
+    b"queue.depth:42|g|#queue:default",
+    b"http.requests:1|c|@0.5|#status:500,route:/orders",
+    b"users.active:u123|s",
+)
+PARSE_LINES = 500_000
+SEND_SECONDS = 3
+SENDERS = 4
+
+
+def bench_parse():
+    parser = StatsdParser(MetricBatch())
+    data = b"\n".join(LINES * 20)
+    repeats = PARSE_LINES // (len(LINES) * 20)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        parser.parse(data)
+    elapsed = time.perf_counter() - start
+    print(f"parse          {PARSE_LINES / elapsed:12,.0f} lines/s")
+
+
+def send(address, stop_at, sent):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        count = 0
+        lines = LINES
+        while time.monotonic() < stop_at:
+            for line in lines:
+                sock.sendto(line, address)
+            count += len(lines)
+        sent.put(count)
+
+
+def bench_listener(sockets):
+    batch = MetricBatch()
+    listener = StatsdListener(batch, port=0, sockets=sockets, receive_buffer_size=1 << 22)
+    listener.start()
+
+    sent = multiprocessing.Queue()
+    stop_at = time.monotonic() + SEND_SECONDS
+    senders = [multiprocessing.Process(target=send, args=(listener.address, stop_at, sent)) for _ in range(SENDERS)]
+    for sender in senders:
+        sender.start()
+    total_sent = sum(sent.get() for _ in senders)
+    for sender in senders:
+        sender.join()
+
+    # Let the listener drain the receive buffers
+    time.sleep(0.5)
+    listener.stop()
+    batch.flush()
+
+    received = listener.received
+    print(
+        f"sockets={sockets}      {received / SEND_SECONDS:12,.0f} packets/s received"
+        f"  sent {total_sent:,}  lost {1 - received / total_sent:6.1%}"
+    )
+
+
+def main():
+    bench_parse()
+    bench_listener(1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        bench_listener(4)
+
+
+if __name__ == "__main__":
+    main()
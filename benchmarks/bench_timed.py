@@ -0,0 +1,72 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the per-call overhead of MetricBatch.timed and SpanBatch.timed
+
+Usage::
+
+    $ python benchmarks/bench_timed.py
+"""
+
+import time
+import timeit
+
+from newrelic_telemetry_sdk import MetricBatch, SpanBatch
+
+NUMBER = 200_000
+TAGS = {"host": "localhost", "route": "/"}
+
+
+def noop():
+    pass
+
+
+def main():
+    metric_batch = MetricBatch()
+    span_batch = SpanBatch()
+
+    def manual():
+        start = time.time()
+        noop()
+        metric_batch.record_summary("manual", (time.time() - start) * 1000, TAGS)
+
+    timer = metric_batch.timed("context", TAGS)
+
+    def context():
+        with timer:
+            noop()
+
+    span_timer = span_batch.timed("span", TAGS)
+
+    def span_context():
+        with span_timer:
+            noop()
+
+    cases = (
+        ("baseline (bare call)", noop),
+        ("time.time + record_summary", manual),
+        ("MetricBatch.timed decorator", metric_batch.timed("decorator", TAGS)(noop)),
+        ("MetricBatch.timed context manager", context),
+        ("SpanBatch.timed decorator", span_batch.timed("span", TAGS)(noop)),
+        ("SpanBatch.timed context manager", span_context),
+    )
+
+    for label, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=NUMBER, repeat=5))
+        print(f"{label:<36} {elapsed / NUMBER * 1e9:8.0f} ns/call")
+        span_batch.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the per-span overhead of Tracer against manually linked spans
+
+Usage::
+
+    $ python benchmarks/bench_tracer.py
+"""
+
+import timeit
+
+from newrelic_telemetry_sdk import CompactSpan, Span, SpanBatch
+from newrelic_telemetry_sdk.tracer import Tracer
+
+NUMBER = 100_000
+
+
+def main():
+    span_batch = SpanBatch()
+    root = Span("root")
+
+    def manual():
+        with Span("child", trace_id=root["trace.id"], parent_id=root["id"]) as span:
+            pass
+        span_batch.record(span)
+
+    tracer = Tracer(span_batch)
+    compact_tracer = Tracer(span_batch, span_cls=CompactSpan)
+
+    def traced():
+        with tracer.start_span("child"):
+            pass
+
+    def compact_traced():
+        with compact_tracer.start_span("child"):
+            pass
+
+    cases = (
+        ("manual Span + record", manual),
+        ("Tracer.start_span", traced),
+        ("Tracer.start_span (CompactSpan)", compact_traced),
+    )
+
+    for label, fn in cases:
+        with tracer.start_span("root"):
+            elapsed = min(timeit.repeat(fn, number=NUMBER, repeat=5))
+        print(f"{label:<36} {elapsed / NUMBER * 1e9:8.0f} ns/span")
+        span_batch.flush()
+
+
+if __name__ == "__main__":
+    main()
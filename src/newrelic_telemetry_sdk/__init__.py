@@ -12,14 +12,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from newrelic_telemetry_sdk.batch import EventBatch, SpanBatch
+from newrelic_telemetry_sdk.batch import EventBatch, LogRecordBatch, SpanBatch, TailSamplingSpanBatch, TopKEventBatch
+from newrelic_telemetry_sdk.buffers import BufferPool
 from newrelic_telemetry_sdk.client import EventClient, HTTPError, LogClient, MetricClient, SpanClient
+from newrelic_telemetry_sdk.compact import (
+    CompactCountMetric,
+    CompactEvent,
+    CompactGaugeMetric,
+    CompactLog,
+    CompactSpan,
+    CompactSummaryMetric,
+)
 from newrelic_telemetry_sdk.event import Event
 from newrelic_telemetry_sdk.harvester import Harvester
-from newrelic_telemetry_sdk.log import Log, NewRelicLogFormatter
+from newrelic_telemetry_sdk.log import Log, NewRelicLogFormatter, NewRelicLogHandler
 from newrelic_telemetry_sdk.metric import CountMetric, GaugeMetric, SummaryMetric
 from newrelic_telemetry_sdk.metric_batch import MetricBatch
-from newrelic_telemetry_sdk.span import Span
+from newrelic_telemetry_sdk.rate_limit import LogRateLimiter
+from newrelic_telemetry_sdk.rollup import EventRollup
+from newrelic_telemetry_sdk.sampling import EventSampler, HeadSampler
+from newrelic_telemetry_sdk.shared_metric_batch import SharedMemoryMetricBatch
+from newrelic_telemetry_sdk.span import NOOP_SPAN, Span
+from newrelic_telemetry_sdk.span_metrics import SpanMetrics
+from newrelic_telemetry_sdk.tracer import Tracer
 
 try:
     from newrelic_telemetry_sdk.version import __version__, __version_tuple__
@@ -29,20 +44,39 @@ except ImportError:  # pragma: no cover
 
 
 __all__ = (
+    "NOOP_SPAN",
+    "BufferPool",
+    "CompactCountMetric",
+    "CompactEvent",
+    "CompactGaugeMetric",
+    "CompactLog",
+    "CompactSpan",
+    "CompactSummaryMetric",
     "CountMetric",
     "Event",
     "EventBatch",
     "EventClient",
+    "EventRollup",
+    "EventSampler",
     "GaugeMetric",
     "HTTPError",
     "Harvester",
+    "HeadSampler",
     "Log",
     "LogClient",
+    "LogRateLimiter",
+    "LogRecordBatch",
     "MetricBatch",
     "MetricClient",
     "NewRelicLogFormatter",
+    "NewRelicLogHandler",
+    "SharedMemoryMetricBatch",
     "Span",
     "SpanBatch",
     "SpanClient",
+    "SpanMetrics",
     "SummaryMetric",
+    "TailSamplingSpanBatch",
+    "TopKEventBatch",
+    "Tracer",
 )
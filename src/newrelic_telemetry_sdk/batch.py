@@ -11,7 +11,29 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import collections
+import contextlib
+import functools
+import heapq
+import operator
+import random
 import threading
+import time
+
+from newrelic_telemetry_sdk import fork
+from newrelic_telemetry_sdk.compact import CompactMapping, EncodedItems, encode
+from newrelic_telemetry_sdk.event import Event
+from newrelic_telemetry_sdk.log import Log, LogRecordSnapshot
+from newrelic_telemetry_sdk.rate_limit import TokenBucket
+from newrelic_telemetry_sdk.span import NOOP_SPAN, Span, _is_error
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
 
 
 class Batch:
@@ -31,6 +53,17 @@ class Batch:
             self._common = {"attributes": tags}
         else:
             self._common = None
+        self._encoded = None
+        self._encoded_count = 0
+        fork.register(self)
+
+    def _after_fork(self):
+        # Data recorded before the fork is sent by the parent process
+        self._lock = self.LOCK_CLS()
+        self._batch = []
+        if self._encoded is not None:
+            self._encoded = bytearray()
+        self._encoded_count = 0
 
     def record(self, item):
         """Merge an item into the batch
@@ -58,28 +91,779 @@ class Batch:
         common = self._common and self._common.copy()
         return batch, common
 
+    def _record_encoded(self, item):
+        # Encoding happens before taking the lock so threads encode in parallel
+        data = encode(item)
+        with self._lock:
+            if self._encoded_count:
+                self._encoded += b","
+            self._encoded += data
+            self._encoded_count += 1
+
+    def _flush_encoded(self):
+        with self._lock:
+            # The encoded items are handed over without copying them
+            items = EncodedItems(self._encoded, self._encoded_count)
+            self._encoded = bytearray()
+            self._encoded_count = 0
+
+        common = self._common and self._common.copy()
+        return items, common
+
 
 class SpanBatch(Batch):
     """Aggregates spans, providing a record / flush interface.
 
+    When ``compress`` is enabled, consecutive sibling spans with the same
+    trace, parent, name and attributes are collapsed until the next flush.
+    Only spans without children of their own are collapsed: a group is
+    flushed as separate spans when a child of one of its spans was recorded
+    before the flush, in any order. Each group is
+    flushed as a single span starting when the first span started and ending
+    when the last span ended, with ``composite.count``,
+    ``composite.duration.sum.ms``, ``composite.duration.min.ms`` and
+    ``composite.duration.max.ms`` attributes. Spans which are not repeated
+    are flushed unchanged.
+
+    When ``encode`` is enabled, spans are encoded as JSON when they are
+    recorded rather than when the batch is sent, spreading the cost of
+    serialization over time. Flush then returns :class:`EncodedItems
+    <newrelic_telemetry_sdk.compact.EncodedItems>` which clients send without
+    encoding the spans again. Encoded spans cannot be compressed, and are not
+    factored by a client's ``common_attributes``. Spans must not be modified
+    after they are recorded.
+
     :param tags: (optional) A dictionary of tags to attach to all flushes.
     :type tags: dict
+    :param compress: (optional) Collapse repeated sibling spans.
+        Default: False
+    :type compress: bool
+    :param metrics: (optional) Derives metrics from every recorded span.
+    :type metrics: SpanMetrics
+    :param encode: (optional) Encode spans when they are recorded.
+        Default: False
+    :type encode: bool
+
+    Usage::
+
+        >>> batch = SpanBatch(compress=True)
+        >>> for _ in range(3):
+        ...     batch.record(Span("query", trace_id="t", parent_id="p", duration_ms=5))
+        >>> (span,), _ = batch.flush()
+        >>> span["attributes"]["composite.count"]
+        3
     """
 
+    def __init__(self, tags=None, *, compress=False, metrics=None, encode=False):
+        if compress and encode:
+            msg = "Encoded spans cannot be compressed"
+            raise ValueError(msg)
+        super().__init__(tags)
+        self._siblings = {} if compress else None
+        self._parents = set()
+        self.metrics = metrics
+        if encode:
+            self._encoded = bytearray()
+
+    def _after_fork(self):
+        super()._after_fork()
+        if self._siblings is not None:
+            self._siblings = {}
+            self._parents = set()
+
+    def record(self, item):
+        """Merge a span into the batch
+
+        The shared :data:`NOOP_SPAN <newrelic_telemetry_sdk.span.NOOP_SPAN>`
+        is discarded.
+
+        :param item: The span to merge into the batch.
+        :type item: Span
+        """
+        if item is NOOP_SPAN:
+            return
+
+        if self.metrics is not None:
+            self.metrics.record(item)
+
+        if self._encoded is not None:
+            self._record_encoded(item)
+        elif self._siblings is None:
+            super().record(item)
+        else:
+            self._record_compressed(item)
+
+    @staticmethod
+    def _compression_key(attributes):
+        try:
+            return frozenset(item for item in attributes.items() if item[0] != "duration.ms")
+        except TypeError:
+            return None
+
+    def _record_compressed(self, item):
+        fields = item.to_dict() if isinstance(item, CompactMapping) else item
+        trace_id = fields["trace.id"]
+        attributes = fields["attributes"]
+        parent_id = attributes.get("parent.id")
+        identity = self._compression_key(attributes) if parent_id else None
+        start = fields["timestamp"]
+        duration = attributes.get("duration.ms") or 0
+        end = start + duration
+
+        with self._lock:
+            siblings = self._siblings
+            key = (trace_id, parent_id)
+            if parent_id:
+                self._parents.add(key)
+            if (trace_id, fields["id"]) in self._parents:
+                # Spans with children are never collapsed
+                identity = None
+
+            entry = siblings.get(key)
+            if identity is not None and entry is not None and entry[1] == identity:
+                entry[2] += 1
+                entry[3] += duration
+                entry[4] = min(entry[4], duration)
+                entry[5] = max(entry[5], duration)
+                entry[6] = max(entry[6], end)
+                entry[7].append(item)
+            else:
+                entry = [item, identity, 1, duration, duration, duration, end, [item]]
+                self._batch.append(entry)
+                if identity is not None:
+                    siblings[key] = entry
+                else:
+                    siblings.pop(key, None)
+
+    @staticmethod
+    def _composite(entry):
+        span, _, count, duration_sum, duration_min, duration_max, end, _ = entry
+        fields = span.to_dict() if isinstance(span, CompactMapping) else span
+        attributes = dict(fields["attributes"])
+        attributes.pop("duration.ms", None)
+        attributes["composite.count"] = count
+        attributes["composite.duration.sum.ms"] = duration_sum
+        attributes["composite.duration.min.ms"] = duration_min
+        attributes["composite.duration.max.ms"] = duration_max
+        start = fields["timestamp"]
+        return Span(
+            attributes["name"],
+            attributes,
+            guid=fields["id"],
+            trace_id=fields["trace.id"],
+            parent_id=attributes.get("parent.id"),
+            start_time_ms=start,
+            duration_ms=end - start,
+        )
+
+    @staticmethod
+    def _has_children(span, parents):
+        fields = span.to_dict() if isinstance(span, CompactMapping) else span
+        return (fields["trace.id"], fields["id"]) in parents
+
+    def flush(self):
+        """Flush all items from the batch
+
+        This method returns all items in the batch and a common block
+        representing any tags if applicable.
+
+        The batch is cleared as part of this operation.
+
+        :returns: A tuple of (items, common)
+        :rtype: tuple
+        """
+        if self._encoded is not None:
+            return self._flush_encoded()
+
+        if self._siblings is None:
+            return super().flush()
+
+        with self._lock:
+            entries = self._batch
+            parents = self._parents
+            self._batch = []
+            self._siblings.clear()
+            self._parents = set()
+
+        items = []
+        for entry in entries:
+            members = entry[7]
+            if len(members) == 1:
+                items.append(members[0])
+            elif any(self._has_children(member, parents) for member in members):
+                # A child recorded after its parent was collapsed would be
+                # orphaned by the composite span
+                items.extend(members)
+            else:
+                items.append(self._composite(entry))
+
+        common = self._common and self._common.copy()
+        return tuple(items), common
+
+    def timed(self, name, tags=None):
+        """Times a block of code or function, recording a span
+
+        The returned timer can be used as either a context manager or a
+        decorator. Each timed call records a :class:`Span
+        <newrelic_telemetry_sdk.span.Span>` into this batch with a duration
+        measured by :func:`time.perf_counter_ns`.
+
+        A timer used as a context manager holds the start time of the block
+        it is timing and must not be shared across threads. Decorated
+        functions may be called concurrently.
+
+        :param name: The name of the span.
+        :type name: str
+        :param tags: (optional) A set of tags that can be used to filter
+            the span in the New Relic UI.
+        :type tags: dict
+
+        :rtype: SpanTimer
+
+        Usage::
+
+            >>> batch = SpanBatch()
+            >>> @batch.timed("work")
+            ... def work():
+            ...     pass
+            >>> work()
+            >>> len(batch.flush()[0])
+            1
+        """
+        return SpanTimer(self, name, tags)
+
+
+class TailSamplingSpanBatch(SpanBatch):
+    """Aggregates spans, keeping or dropping whole traces.
+
+    Recorded spans are held per ``trace.id`` until the trace completes or
+    times out. A trace completes when its root span (a span without a
+    ``parent.id``) is recorded. The trace is then kept if any of these
+    policies match:
+
+    * any span has an ``error`` attribute set to a true value, or has an
+      ``error.class`` or ``error.message`` attribute
+    * any span has a ``duration.ms`` of at least ``latency_threshold_ms``
+    * the trace is chosen at random with probability ``sample_rate``,
+      limited to ``max_sampled_per_second`` traces per second
+
+    Kept traces are returned by the next flush. Pending traces are held
+    across flushes until they complete or time out. Decisions are
+    remembered for a while so spans arriving after their trace was decided
+    follow the same decision.
+
+    Memory is bounded by ``max_traces`` and ``max_spans``. When either limit
+    is reached, the oldest pending traces are decided early.
+
+    :param tags: (optional) A dictionary of tags to attach to all flushes.
+    :type tags: dict
+    :param trace_timeout: (optional) Seconds to wait for a trace to complete
+        before deciding it. Default: 30
+    :type trace_timeout: int or float
+    :param latency_threshold_ms: (optional) Keep traces with a span lasting
+        at least this many milliseconds. Default: None (disabled)
+    :type latency_threshold_ms: int or float
+    :param sample_rate: (optional) The probability of keeping a trace which
+        matches no other policy. Default: 0.0
+    :type sample_rate: float
+    :param max_sampled_per_second: (optional) The maximum number of traces
+        per second kept by ``sample_rate``. Default: None (no limit)
+    :type max_sampled_per_second: int or float
+    :param keep_errors: (optional) Keep traces with errors. Default: True
+    :type keep_errors: bool
+    :param max_traces: (optional) The maximum number of pending traces.
+        Default: 10000
+    :type max_traces: int
+    :param max_spans: (optional) The maximum number of pending spans.
+        Default: 100000
+    :type max_spans: int
+    :param max_decisions: (optional) The number of trace decisions remembered
+        for spans arriving late. Default: 10000
+    :type max_decisions: int
+    :param metrics: (optional) Derives metrics from every recorded span,
+        including spans of traces which are dropped.
+    :type metrics: SpanMetrics
+
+    Usage::
+
+        >>> batch = TailSamplingSpanBatch(latency_threshold_ms=100)
+        >>> batch.record(Span("child", trace_id="t", parent_id="root", duration_ms=150))
+        >>> batch.record(Span("root", trace_id="t", guid="root", duration_ms=200))
+        >>> len(batch.flush()[0])
+        2
+    """
+
+    def __init__(
+        self,
+        tags=None,
+        *,
+        trace_timeout=30,
+        latency_threshold_ms=None,
+        sample_rate=0.0,
+        max_sampled_per_second=None,
+        keep_errors=True,
+        max_traces=10000,
+        max_spans=100000,
+        max_decisions=10000,
+        metrics=None,
+    ):
+        super().__init__(tags, metrics=metrics)
+        self.trace_timeout = trace_timeout
+        self.latency_threshold_ms = latency_threshold_ms
+        self.sample_rate = sample_rate
+        self.keep_errors = keep_errors
+        self.max_traces = max_traces
+        self.max_spans = max_spans
+        self.max_decisions = max_decisions
+        self._sampled_budget = None if max_sampled_per_second is None else TokenBucket(max_sampled_per_second)
+        self._pending = collections.OrderedDict()
+        self._pending_spans = 0
+        self._decisions = collections.OrderedDict()
+
+    def should_keep(self, spans, now):
+        """Decide whether to keep a trace
+
+        Subclasses may override this method to implement other policies. It
+        is called with the batch lock held.
+
+        :param spans: The spans of the trace recorded so far.
+        :type spans: list
+        :param now: The current time in seconds from a monotonic clock.
+        :type now: float
+
+        :rtype: bool
+        """
+        threshold = self.latency_threshold_ms
+        for span in spans:
+            attributes = span["attributes"]
+            if self.keep_errors and _is_error(attributes):
+                return True
+            if threshold is not None and attributes.get("duration.ms", 0) >= threshold:
+                return True
+
+        if self.sample_rate and random.random() < self.sample_rate:  # noqa: S311
+            budget = self._sampled_budget
+            return budget is None or budget.consume(1, now)
+
+        return False
+
+    def _decide(self, trace_id, now):
+        spans, _ = self._pending.pop(trace_id)
+        self._pending_spans -= len(spans)
+
+        keep = self.should_keep(spans, now)
+        if keep:
+            self._batch.extend(spans)
+
+        decisions = self._decisions
+        decisions[trace_id] = keep
+        if len(decisions) > self.max_decisions:
+            decisions.popitem(last=False)
+
+    def record(self, item):
+        """Merge a span into the batch
+
+        :param item: The span to merge into the batch.
+        :type item: Span
+        """
+        if item is NOOP_SPAN:
+            return
+
+        if self.metrics is not None:
+            self.metrics.record(item)
+
+        trace_id = item["trace.id"]
+        is_root = not item["attributes"].get("parent.id")
+        now = time.monotonic()
+
+        with self._lock:
+            decision = self._decisions.get(trace_id)
+            if decision is not None:
+                if decision:
+                    self._batch.append(item)
+                return
+
+            pending = self._pending
+            trace = pending.get(trace_id)
+            if trace is None:
+                trace = pending[trace_id] = ([], now)
+            trace[0].append(item)
+            self._pending_spans += 1
+
+            if is_root:
+                self._decide(trace_id, now)
+
+            while pending and (len(pending) > self.max_traces or self._pending_spans > self.max_spans):
+                self._decide(next(iter(pending)), now)
+
+    def _after_fork(self):
+        # Pending traces are decided by the parent process
+        self._pending.clear()
+        self._pending_spans = 0
+        super()._after_fork()
+
+    def flush(self):
+        """Flush all kept spans from the batch
+
+        Pending traces which have timed out are decided before flushing.
+
+        :returns: A tuple of (items, common)
+        :rtype: tuple
+        """
+        now = time.monotonic()
+        deadline = now - self.trace_timeout
+        with self._lock:
+            pending = self._pending
+            while pending:
+                trace_id, (_, first_seen) = next(iter(pending.items()))
+                if first_seen > deadline:
+                    break
+                self._decide(trace_id, now)
+
+        return super().flush()
+
 
 class LogBatch(Batch):
     """Aggregates logs, providing a record / flush interface.
 
+    When ``dedup`` is enabled, logs sharing a logger name, level, message and
+    error class are collapsed until the next flush. Each group is flushed as
+    its first log with additional ``occurrences``, ``first.timestamp`` and
+    ``last.timestamp`` attributes. Logs that occur only once are flushed
+    unchanged.
+
+    When a ``rate_limiter`` is provided, logs over its limits are discarded
+    before they are recorded. Summaries of the suppressed logs are included
+    in the next flush.
+
+    When ``encode`` is enabled, logs are encoded as JSON when they are
+    recorded and flush returns :class:`EncodedItems
+    <newrelic_telemetry_sdk.compact.EncodedItems>`, as with
+    :class:`SpanBatch`. Encoded logs cannot be deduplicated.
+
+    :param tags: (optional) A dictionary of tags to attach to all flushes.
+    :type tags: dict
+    :param dedup: (optional) Collapse repeated logs. Default: False
+    :type dedup: bool
+    :param rate_limiter: (optional) Limits applied to every recorded log.
+    :type rate_limiter: LogRateLimiter
+    :param encode: (optional) Encode logs when they are recorded.
+        Default: False
+    :type encode: bool
+    """
+
+    def __init__(self, tags=None, *, dedup=False, rate_limiter=None, encode=False):
+        if dedup and encode:
+            msg = "Encoded logs cannot be deduplicated"
+            raise ValueError(msg)
+        super().__init__(tags)
+        self._duplicates = {} if dedup else None
+        self.rate_limiter = rate_limiter
+        if encode:
+            self._encoded = bytearray()
+
+    def _after_fork(self):
+        super()._after_fork()
+        if self._duplicates is not None:
+            self._duplicates = {}
+
+    @staticmethod
+    def _dedup_key(item):
+        attributes = item.get("attributes") or {}
+        key = (
+            attributes.get("logger.name"),
+            attributes.get("log.level"),
+            item.get("message"),
+            attributes.get("error.class"),
+        )
+        try:
+            hash(key)
+        except TypeError:
+            # Messages and attributes may be any object, including unhashable
+            # ones, which are compared by their string form
+            key = tuple(value if _is_hashable(value) else str(value) for value in key)
+        return key
+
+    def _record_duplicate(self, key, item, timestamp, capacity=None):
+        with self._lock:
+            entry = self._duplicates.get(key)
+            if entry is None:
+                if capacity is not None and len(self._batch) >= capacity:
+                    return False
+                entry = self._duplicates[key] = [item, 1, timestamp, timestamp]
+                self._batch.append(entry)
+            else:
+                entry[1] += 1
+                entry[3] = max(entry[3], timestamp)
+        return True
+
+    def record(self, item):
+        """Merge an item into the batch
+
+        :param item: The log to merge into the batch.
+        :type item: Log
+        """
+        if self.rate_limiter is not None and not self.rate_limiter.allow_log(item):
+            return
+
+        if self._encoded is not None:
+            self._record_encoded(item)
+        elif self._duplicates is None:
+            super().record(item)
+        else:
+            self._record_duplicate(self._dedup_key(item), item, item["timestamp"])
+
+    def _drain_duplicates(self):
+        with self._lock:
+            entries = self._batch
+            self._batch = []
+            self._duplicates.clear()
+        return entries
+
+    @staticmethod
+    def _collapse(log, count, first_timestamp, last_timestamp):
+        if count == 1:
+            return log
+        attributes = dict(log.get("attributes") or ())
+        attributes["occurrences"] = count
+        attributes["first.timestamp"] = int(first_timestamp)
+        attributes["last.timestamp"] = int(last_timestamp)
+        return Log(log["message"], log["timestamp"], **attributes)
+
+    def flush(self):
+        """Flush all items from the batch
+
+        This method returns all items in the batch and a common block
+        representing any tags if applicable.
+
+        The batch is cleared as part of this operation.
+
+        :returns: A tuple of (items, common)
+        :rtype: tuple
+        """
+        if self._encoded is not None:
+            if self.rate_limiter is not None:
+                for summary in self.rate_limiter.summaries():
+                    self._record_encoded(summary)
+            return self._flush_encoded()
+
+        if self._duplicates is None:
+            items, common = super().flush()
+        else:
+            items = tuple(self._collapse(*entry) for entry in self._drain_duplicates())
+            common = self._common and self._common.copy()
+
+        if self.rate_limiter is not None:
+            items += tuple(self.rate_limiter.summaries())
+
+        return items, common
+
+
+class LogRecordBatch(LogBatch):
+    """Buffers :class:`logging.LogRecord` objects, converting them at flush.
+
+    Recording a log record only appends it to a bounded buffer, holding the
+    batch lock for the append alone. The records
+    are converted to :class:`Log <newrelic_telemetry_sdk.log.Log>` objects when
+    the batch is flushed, typically on a :class:`Harvester
+    <newrelic_telemetry_sdk.harvester.Harvester>` thread.
+
+    When the buffer is full, records are dropped according to the overflow
+    policy and counted in :attr:`dropped`. The count of records dropped
+    between flushes is reported as a log in the next flush.
+
+    When ``dedup`` is enabled, records are collapsed on their logger name,
+    level, unformatted message and error class before any formatting takes
+    place, so only the first record of each group is formatted. The capacity
+    then limits the number of distinct groups and the overflow policy is
+    always ``"drop_newest"``.
+
     :param tags: (optional) A dictionary of tags to attach to all flushes.
     :type tags: dict
+    :param capacity: (optional) The maximum number of records buffered
+        between flushes. Default: 10000
+    :type capacity: int
+    :param overflow: (optional) Either ``"drop_newest"`` to discard records
+        recorded while the buffer is full or ``"drop_oldest"`` to discard the
+        oldest buffered record. Default: ``"drop_newest"``
+    :type overflow: str
+    :param snapshot: (optional) When True, only the fields needed to create
+        a log are copied from each record into a :class:`LogRecordSnapshot
+        <newrelic_telemetry_sdk.log.LogRecordSnapshot>` when it is recorded,
+        so the record itself is not retained until the next flush.
+        Default: False
+    :type snapshot: bool
+    :param dedup: (optional) Collapse repeated records. Default: False
+    :type dedup: bool
+    :param rate_limiter: (optional) Limits applied to every recorded record.
+        Records over the limits are discarded before they are buffered.
+    :type rate_limiter: LogRateLimiter
+
+    :ivar dropped: The total number of records dropped by this batch. This
+        count is not updated under lock and may be approximate when records
+        are dropped by several threads at once.
+    :vartype dropped: int
     """
 
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
+
+    def __init__(
+        self, tags=None, capacity=10000, overflow=DROP_NEWEST, *, snapshot=False, dedup=False, rate_limiter=None
+    ):
+        if overflow not in (self.DROP_NEWEST, self.DROP_OLDEST):
+            msg = f"Invalid overflow policy: {overflow!r}"
+            raise ValueError(msg)
+        super().__init__(tags, dedup=dedup, rate_limiter=rate_limiter)
+        self.capacity = capacity
+        self.overflow = overflow
+        self.snapshot = snapshot
+        self.dropped = 0
+        self._flushed_dropped = 0
+        maxlen = capacity if overflow == self.DROP_OLDEST else None
+        self._records = collections.deque(maxlen=maxlen)
+
+    def _after_fork(self):
+        super()._after_fork()
+        self._records = collections.deque(maxlen=self._records.maxlen)
+        self.dropped = self._flushed_dropped = 0
+
+    def record(self, item):
+        """Buffer a log record
+
+        This method never blocks on formatting or I/O.
+
+        :param item: The log record to buffer.
+        :type item: logging.LogRecord or LogRecordSnapshot
+        """
+        if self.rate_limiter is not None and not self.rate_limiter.allow_record(item):
+            return
+
+        if self._duplicates is not None:
+            key = self._record_key(item)
+            if self.snapshot:
+                item = LogRecordSnapshot(item)
+            if not self._record_duplicate(key, item, item.created * 1000, self.capacity):
+                self.dropped += 1
+            return
+
+        if self.snapshot:
+            item = LogRecordSnapshot(item)
+        with self._lock:
+            records = self._records
+            if len(records) >= self.capacity:
+                self.dropped += 1
+                if self.overflow == self.DROP_NEWEST:
+                    return
+            records.append(item)
+
+    @staticmethod
+    def _record_key(record):
+        msg = record.msg
+        if not isinstance(msg, str):
+            # Messages may be any object, including unhashable ones
+            msg = str(msg)
+        exc_info = record.exc_info
+        return (record.name, record.levelname, msg, exc_info and exc_info[0])
+
+    @staticmethod
+    def _convert(record):
+        try:
+            return Log.from_record(record)
+        except Exception:  # noqa: BLE001
+            return None
+
+    def flush(self):
+        """Flush all buffered records from the batch as logs
+
+        This method converts all buffered records into logs and returns them
+        with a common block representing any tags if applicable.
+
+        The batch is cleared as part of this operation.
+
+        :returns: A tuple of (items, common)
+        :rtype: tuple
+        """
+        if self._duplicates is None:
+            records = self._records
+            popleft = records.popleft
+            entries = [(popleft(), 1, None, None) for _ in range(len(records))]
+        else:
+            entries = self._drain_duplicates()
+
+        convert = self._convert
+        collapse = self._collapse
+        items = []
+        for record, count, first_timestamp, last_timestamp in entries:
+            log = convert(record)
+            if log is None:
+                self.dropped += count
+            else:
+                items.append(collapse(log, count, first_timestamp, last_timestamp))
+
+        with self._lock:
+            dropped = self.dropped - self._flushed_dropped
+            self._flushed_dropped += dropped
+
+        if dropped:
+            items.append(
+                Log(
+                    f"{dropped} log records were dropped by the New Relic log batch",
+                    **{"log.level": "WARNING", "logger.name": __name__, "dropped.count": dropped},
+                )
+            )
+
+        if self.rate_limiter is not None:
+            items.extend(self.rate_limiter.summaries())
+
+        common = self._common and self._common.copy()
+        return tuple(items), common
+
 
 class EventBatch(Batch):
-    """Aggregates events, providing a record / flush interface."""
+    """Aggregates events, providing a record / flush interface.
+
+    Events with a type matching one of the ``rollups`` are rolled up into
+    metrics. Only the events returned by the rollup, if any, are recorded.
+    Other events are sampled by the ``sampler``, if one is provided. The
+    sampler's rates are adjusted each time the batch is flushed.
+
+    :param rollups: (optional) The rollups applied to recorded events.
+    :type rollups: list
+    :param sampler: (optional) The sampler applied to events which are not
+        rolled up.
+    :type sampler: EventSampler
+
+    Usage::
+
+        >>> from newrelic_telemetry_sdk import Event, EventRollup, MetricBatch
+        >>> metric_batch = MetricBatch()
+        >>> batch = EventBatch(rollups=[EventRollup(metric_batch, "PageView")])
+        >>> batch.record(Event("PageView"))
+        >>> batch.record(Event("Purchase"))
+        >>> len(batch.flush()[0])
+        1
+    """
 
-    def __init__(self):
+    def __init__(self, *, rollups=None, sampler=None):
         super().__init__()
+        self._rollups = {rollup.event_type: rollup for rollup in rollups or ()}
+        self.sampler = sampler
+
+    def record(self, item):
+        """Merge an event into the batch
+
+        :param item: The event to merge into the batch.
+        :type item: Event
+        """
+        rollup = self._rollups.get(item["eventType"]) if self._rollups else None
+        if rollup is not None:
+            item = rollup.record(item)
+        elif self.sampler is not None:
+            item = self.sampler.sample(item)
+
+        if item is not None:
+            super().record(item)
 
     def flush(self):
         """Flush all items from the batch
@@ -91,5 +875,211 @@ class EventBatch(Batch):
         :returns: A tuple of (items,)
         :rtype: tuple
         """
+        if self.sampler is not None:
+            self.sampler.adjust()
+
         items, _ = super().flush()
         return (items,)
+
+
+class _SpaceSaving:
+    """Approximate heavy hitters of a weighted stream
+
+    Estimates never undercount and overcount by at most the key's error.
+    Keys not tracked have a true weight of at most ``floor``.
+    """
+
+    __slots__ = ("capacity", "errors", "floor", "total", "weights")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.weights = {}
+        self.errors = {}
+        self.floor = 0
+        self.total = 0
+
+    def add(self, key, weight):
+        weights = self.weights
+        current = weights.get(key)
+        self.total += weight
+        if current is not None:
+            weights[key] = current + weight
+            return
+
+        weights[key] = self.floor + weight
+        if self.floor:
+            self.errors[key] = self.floor
+
+        # Evicting in bulk once the table doubles keeps the cost per key O(1)
+        if len(weights) > 2 * self.capacity:
+            self._evict()
+
+    def _evict(self):
+        largest = heapq.nlargest(self.capacity + 1, self.weights.items(), key=operator.itemgetter(1))
+        self.floor = max(self.floor, largest.pop()[1])
+        errors = self.errors
+        self.weights = dict(largest)
+        self.errors = {key: errors[key] for key, _ in largest if key in errors}
+
+    def top(self, k):
+        errors = self.errors
+        return [
+            (key, weight, errors.get(key, 0))
+            for key, weight in heapq.nlargest(k, self.weights.items(), key=operator.itemgetter(1))
+        ]
+
+
+class TopKEventBatch(Batch):
+    """Summarizes events as the top values of an attribute
+
+    Instead of holding every event, the batch keeps a fixed size table per
+    event type estimating the heaviest values of the ``key`` attribute, by
+    number of events or by the sum of the ``value`` attribute. Memory does
+    not depend on the number of distinct values and recording an event takes
+    amortized constant time.
+
+    On flush, the ``k`` heaviest values of each event type are returned as
+    events of type ``<eventType>TopK`` with these attributes:
+
+    * the ``key`` attribute holding the value
+    * ``rank``: the position of the value, starting at 1
+    * ``count`` or ``<value>.sum``: the estimated weight, which is never below
+      the true weight
+    * ``count.error`` or ``<value>.sum.error``: the most the estimate may
+      exceed the true weight
+    * ``count.total`` or ``<value>.sum.total``: the total weight of all events
+      of the type
+
+    Events without the ``key`` attribute, or with a non-numeric ``value``
+    attribute, are ignored.
+
+    :param key: The attribute to summarize.
+    :type key: str
+    :param k: (optional) The number of values reported per event type.
+        Default: 100
+    :type k: int
+    :param value: (optional) A numeric attribute to sum. Default: None
+        (count events)
+    :type value: str
+    :param capacity: (optional) The number of values tracked per event type.
+        Larger tables give smaller errors. Default: 10 * k
+    :type capacity: int
+
+    Usage::
+
+        >>> from newrelic_telemetry_sdk import Event
+        >>> batch = TopKEventBatch("url", k=1)
+        >>> for url in ("/", "/", "/login"):
+        ...     batch.record(Event("PageView", {"url": url}))
+        >>> (top,), = batch.flush()
+        >>> top["eventType"], top["url"], top["count"], top["count.error"]
+        ('PageViewTopK', '/', 2, 0)
+    """
+
+    def __init__(self, key, k=100, value=None, capacity=None):
+        super().__init__()
+        self.key = key
+        self.k = k
+        self.value = value
+        self.capacity = max(capacity or 10 * k, k)
+        self._weight_name = "count" if value is None else f"{value}.sum"
+        self._tables = {}
+
+    def _after_fork(self):
+        super()._after_fork()
+        self._tables = {}
+
+    def record(self, item):
+        """Merge an event into the batch
+
+        :param item: The event to merge into the batch.
+        :type item: Event
+        """
+        fields = item if isinstance(item, dict) else item.to_dict()
+        key = fields.get(self.key)
+        if key is None:
+            return
+
+        if self.value is None:
+            weight = 1
+        else:
+            weight = fields.get(self.value)
+            if not isinstance(weight, (int, float)) or isinstance(weight, bool):
+                return
+
+        event_type = fields["eventType"]
+        with self._lock:
+            table = self._tables.get(event_type)
+            if table is None:
+                table = self._tables[event_type] = _SpaceSaving(self.capacity)
+            with contextlib.suppress(TypeError):
+                # Unhashable values cannot be counted
+                table.add(key, weight)
+
+    def flush(self):
+        """Flush the top values of each event type
+
+        The batch is cleared as part of this operation.
+
+        :returns: A tuple of (items,)
+        :rtype: tuple
+        """
+        with self._lock:
+            tables = self._tables
+            self._tables = {}
+
+        weight_name = self._weight_name
+        now = int(time.time() * 1000)
+        items = []
+        for event_type, table in tables.items():
+            for rank, (key, weight, error) in enumerate(table.top(self.k), 1):
+                tags = {
+                    self.key: key,
+                    "rank": rank,
+                    weight_name: weight,
+                    f"{weight_name}.error": error,
+                    f"{weight_name}.total": table.total,
+                }
+                items.append(Event(f"{event_type}TopK", tags, now))
+        return (tuple(items),)
+
+
+class SpanTimer:
+    """Records a span for each timed block or call
+
+    Instances are created by :meth:`SpanBatch.timed`.
+    """
+
+    __slots__ = ("_name", "_record", "_start", "_tags")
+
+    def __init__(self, batch, name, tags=None):
+        self._record = batch.record
+        self._name = name
+        self._tags = tags and dict(tags)
+        self._start = None
+
+    def _record_span(self, start):
+        elapsed_ms = (time.perf_counter_ns() - start) / 1e6
+        end_time_ms = time.time() * 1000
+        self._record(Span(self._name, self._tags, start_time_ms=end_time_ms - elapsed_ms, duration_ms=elapsed_ms))
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc, value, tb):
+        self._record_span(self._start)
+
+    def __call__(self, wrapped):
+        record_span = self._record_span
+        perf_counter_ns = time.perf_counter_ns
+
+        @functools.wraps(wrapped)
+        def wrapper(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return wrapped(*args, **kwargs)
+            finally:
+                record_span(start)
+
+        return wrapper
@@ -0,0 +1,137 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from newrelic_telemetry_sdk import fork
+
+
+class PayloadBuffer:
+    """A reusable bytearray which keeps its capacity across payloads
+
+    Writes overwrite the buffer in place from the start, only growing the
+    underlying bytearray when a payload is larger than any before it.
+
+    Usage::
+
+        >>> buffer = PayloadBuffer()
+        >>> buffer.write(b"hello ")
+        >>> buffer.write(b"world")
+        >>> bytes(buffer.view())
+        b'hello world'
+    """
+
+    __slots__ = ("data", "size")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.size = 0
+
+    def write(self, chunk):
+        """Append bytes to the payload
+
+        :param chunk: The bytes to append.
+        :type chunk: bytes
+        """
+        start = self.size
+        end = start + len(chunk)
+        # Assigning a slice of the same length copies in place; a shorter
+        # slice at the end grows the bytearray
+        self.data[start:end] = chunk
+        self.size = end
+
+    def view(self):
+        """Return a memoryview of the payload written so far
+
+        The buffer cannot grow while the view is held. Views are released
+        when the buffer is returned to its pool.
+
+        :rtype: memoryview
+        """
+        return memoryview(self.data)[: self.size]
+
+
+class BufferPool:
+    """A pool of reusable payload buffers
+
+    Clients given a pool write compressed payloads into pooled buffers and
+    pass them to urllib3 as a :class:`memoryview`, returning the buffer to
+    the pool once the request completes. In steady state, the compressed
+    output of each harvest reuses the same memory. Only the compressed
+    output is pooled: the JSON encoding of a payload is still allocated,
+    unless items are encoded in chunks with ``max_pause_ms`` or the batch
+    records in encoded mode.
+
+    A pool may be shared by several clients.
+
+    :param max_buffers: (optional) The number of idle buffers kept.
+        Default: 4
+    :type max_buffers: int
+    :param max_buffer_size: (optional) Buffers which grew larger than this
+        many bytes are discarded rather than kept. Default: 64 MiB
+    :type max_buffer_size: int
+
+    Usage::
+
+        >>> pool = BufferPool()
+        >>> buffer = pool.acquire()
+        >>> buffer.write(b"payload")
+        >>> view = buffer.view()
+        >>> pool.release(view)
+        >>> pool.acquire() is buffer
+        True
+    """
+
+    def __init__(self, max_buffers=4, max_buffer_size=1 << 26):
+        self.max_buffers = max_buffers
+        self.max_buffer_size = max_buffer_size
+        self._lock = threading.Lock()
+        self._idle = []
+        self._in_use = {}
+        fork.register(self)
+
+    def _after_fork(self):
+        # Buffers used by threads of the parent process are never released
+        self._lock = threading.Lock()
+        self._in_use = {}
+
+    def acquire(self):
+        """Take a buffer from the pool, creating one if none are idle
+
+        :rtype: PayloadBuffer
+        """
+        with self._lock:
+            buffer = self._idle.pop() if self._idle else PayloadBuffer()
+            buffer.size = 0
+            self._in_use[id(buffer.data)] = buffer
+        return buffer
+
+    def release(self, view):
+        """Return the buffer backing a view to the pool
+
+        The view is released and must not be used afterwards. Views which
+        are not backed by a buffer from this pool are ignored.
+
+        :param view: A view returned by :meth:`PayloadBuffer.view`.
+        :type view: memoryview
+        """
+        data = view.obj
+        view.release()
+        with self._lock:
+            buffer = self._in_use.get(id(data))
+            if buffer is None or buffer.data is not data:
+                return
+            del self._in_use[id(data)]
+            if len(self._idle) < self.max_buffers and len(data) <= self.max_buffer_size:
+                self._idle.append(buffer)
@@ -12,14 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
 import json
 import logging
+import time
 import uuid
 import zlib
 
 import urllib3
 from urllib3.util import parse_url
 
+from newrelic_telemetry_sdk import fork
+from newrelic_telemetry_sdk.compact import EncodedItems, encode, serialize
+
 try:
     from urllib.request import getproxies
 except ImportError:
@@ -77,6 +82,94 @@ class HTTPResponse(urllib3.HTTPResponse):
 # No longer a subclass, kept for backwards compatibility
 HTTPSConnectionPool = urllib3.HTTPSConnectionPool
 
+_MISSING = object()
+_INITIAL_CHUNK_SIZE = 256
+_MAX_CHUNK_SIZE = 65536
+_BUFFER_SLICE_SIZE = 65536
+
+
+def _factor_common(payload_type, names, items, common):
+    """Group items by the values of the common attributes
+
+    Returns a list of payload objects. Each group of two or more items
+    sharing values gets its own common block holding those values; all
+    other items are sent unchanged with the original common block.
+    """
+    groups = {}
+    for item in items:
+        attributes = item.get("attributes")
+        key = tuple(attributes.get(name, _MISSING) for name in names) if attributes else None
+        try:
+            group = groups.setdefault(key, [])
+        except TypeError:
+            # Unhashable attribute values are never factored
+            group = groups.setdefault(None, [])
+        group.append(item)
+
+    payload = []
+    ungrouped = groups.pop(None, [])
+    for key, group in groups.items():
+        shared = {name: value for name, value in zip(names, key) if value is not _MISSING}
+        if len(group) < 2 or not shared:  # noqa: PLR2004
+            ungrouped.extend(group)
+            continue
+
+        factored = []
+        for item in group:
+            to_dict = getattr(item, "to_dict", None)
+            factored_item = to_dict() if to_dict else dict(item)
+            factored_item["attributes"] = {
+                name: value for name, value in factored_item["attributes"].items() if name not in shared
+            }
+            factored.append(factored_item)
+
+        group_common = dict(common) if common else {}
+        group_common["attributes"] = dict(group_common.get("attributes") or {}, **shared)
+        payload.append({payload_type: factored, "common": group_common})
+
+    if ungrouped:
+        remainder = {payload_type: ungrouped}
+        if common:
+            remainder["common"] = common
+        payload.insert(0, remainder)
+
+    return payload
+
+
+def _frame(payload_type, common):
+    """Return the JSON written before and after the items of a payload"""
+    if not payload_type:
+        # Events are sent as a plain list
+        return b"[", b"]"
+    prefix = f'[{{"{payload_type}":['.encode()
+    if common:
+        return prefix, b'],"common":' + encode(common) + b"}]"
+    return prefix, b"]}]"
+
+
+def _encode_payload(payload_type, common_attributes, items, common):
+    """Encode the JSON body of a payload, returning it as a tuple of chunks
+
+    Items are grouped by the values of ``common_attributes`` when given.
+    Events have no payload type: they are sent as a plain list, without a
+    common block.
+    """
+    if isinstance(items, EncodedItems):
+        prefix, suffix = _frame(payload_type, common)
+        return prefix, items.data, suffix
+
+    if not payload_type:
+        payload = items
+    elif common_attributes:
+        payload = _factor_common(payload_type, common_attributes, items, common)
+    else:
+        payload = {payload_type: items}
+        if common:
+            payload["common"] = common
+        payload = [payload]
+
+    return (json.dumps(payload, separators=(",", ":"), default=serialize).encode("utf-8"),)
+
 
 class Client:
     """HTTP Client for interacting with New Relic APIs
@@ -90,6 +183,29 @@ class Client:
     :type host: str
     :param port: (optional) Override the port for the client. Default: 443
     :type port: int
+    :param common_attributes: (optional) Attribute names to hoist into
+        ``common`` blocks. Items sharing the same values for these attributes
+        are sent as a group with the shared attributes in the group's common
+        block rather than on every item. :attr:`COMMON_ATTRIBUTES` lists
+        suitable defaults. Ignored by the :class:`EventClient`.
+    :type common_attributes: tuple
+    :param max_pause_ms: (optional) When set, payloads are encoded in chunks
+        sized to take about this many milliseconds each, and other threads
+        are allowed to run between chunks. This bounds how long sending a
+        large batch holds the GIL. Not applied to payloads factored by
+        ``common_attributes``. Default: None (encode in one call)
+    :type max_pause_ms: int or float
+    :param compression_threads: (optional) When set, payloads larger than
+        :attr:`COMPRESSION_CHUNK_SIZE` are split into chunks compressed in
+        parallel on a pool of this many threads. Each chunk becomes a gzip
+        member; the concatenated members form a valid gzip body.
+        Default: None (compress on the sending thread)
+    :type compression_threads: int
+    :param buffer_pool: (optional) A pool of reusable buffers where
+        compressed payloads are written. Payloads are then passed to urllib3
+        as a :class:`memoryview`. Default: None (allocate a new bytes object
+        for each payload)
+    :type buffer_pool: BufferPool
     :param \\**connection_pool_kwargs: Configuration options for urllib3.HTTPSConnectionPool.
         See https://urllib3.readthedocs.io/en/stable/reference/urllib3.connectionpool.html#urllib3.HTTPSConnectionPool
 
@@ -107,12 +223,32 @@ class Client:
     HOST = ""
     PATH = "/"
     HEADERS = urllib3.make_headers(keep_alive=True, accept_encoding=True, user_agent=USER_AGENT)
-
-    def __init__(self, license_key, host=None, port=443, **connection_pool_kwargs):
+    COMMON_ATTRIBUTES = ("service.name", "host", "host.name", "logger.name", "thread.name")
+    COMPRESSION_CHUNK_SIZE = 1 << 20
+
+    def __init__(
+        self,
+        license_key,
+        host=None,
+        port=443,
+        *,
+        common_attributes=None,
+        max_pause_ms=None,
+        compression_threads=None,
+        buffer_pool=None,
+        **connection_pool_kwargs,
+    ):
         if not license_key:
             msg = f"Invalid license key: {license_key}"
             raise ValueError(msg)
 
+        self._common_attributes = tuple(common_attributes) if common_attributes else None
+        self._max_pause = None if max_pause_ms is None else max_pause_ms / 1000.0
+        self._chunk_size = _INITIAL_CHUNK_SIZE
+        self._buffer_pool = buffer_pool
+        self._compression_threads = compression_threads
+        self._compression_executor = self._create_compression_executor()
+
         host = host or self.HOST
         headers = self.HEADERS.copy()
         headers.update({"Api-Key": license_key, "Content-Encoding": "gzip", "Content-Type": "application/json"})
@@ -138,8 +274,25 @@ class Client:
 
         merged_connection_pool_kwargs["headers"] = headers
 
+        self._pool_kwargs = merged_connection_pool_kwargs
         self._pool = self.POOL_CLS(**merged_connection_pool_kwargs)
         self._headers = self._pool.headers
+        fork.register(self)
+
+    def _create_compression_executor(self):
+        if not self._compression_threads:
+            return None
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._compression_threads, thread_name_prefix="NewRelicCompression"
+        )
+
+    def _after_fork(self):
+        # Inherited connections are shared with the parent process and the
+        # inherited compression threads are not running. Both are dropped
+        # without closing them, since their locks may be held.
+        self._pool = self.POOL_CLS(**self._pool_kwargs)
+        self._headers = self._pool.headers
+        self._compression_executor = self._create_compression_executor()
 
     def _parse_proxy_settings(self, connection_pool_kwargs=None):
         """
@@ -194,25 +347,105 @@ class Client:
     def close(self):
         """Close all open connections and disable internal connection pool."""
         self._pool.close()
+        if self._compression_executor is not None:
+            self._compression_executor.shutdown(wait=False)
 
     @staticmethod
-    def _compress_payload(payload):
+    def _compress_payload(*chunks):
         level = zlib.Z_DEFAULT_COMPRESSION
         compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
-        payload = compressor.compress(payload)
+        payload = b"".join([compressor.compress(chunk) for chunk in chunks])
         payload += compressor.flush()
         return payload
 
-    def _create_payload(self, items, common):
-        payload = {self.PAYLOAD_TYPE: items}
-        if common:
-            payload["common"] = common
+    def _compress_into_buffer(self, chunks):
+        """Compress chunks into a pooled buffer, returning a memoryview"""
+        buffer = self._buffer_pool.acquire()
+        level = zlib.Z_DEFAULT_COMPRESSION
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            # Feeding the compressor in slices keeps its output objects small
+            view = memoryview(chunk)
+            for start in range(0, len(view), _BUFFER_SLICE_SIZE):
+                buffer.write(compressor.compress(view[start : start + _BUFFER_SLICE_SIZE]))
+        buffer.write(compressor.flush())
+        return buffer.view()
+
+    def _compress(self, *chunks):
+        executor = self._compression_executor
+        if executor is None:
+            if self._buffer_pool is not None:
+                return self._compress_into_buffer(chunks)
+            return self._compress_payload(*chunks)
+
+        payload = b"".join(chunks)
+        size = self.COMPRESSION_CHUNK_SIZE
+        if len(payload) < 2 * size:
+            return self._compress_payload(payload)
+
+        # zlib releases the GIL while compressing, so members are compressed
+        # in parallel
+        view = memoryview(payload)
+        members = executor.map(self._compress_payload, [view[i : i + size] for i in range(0, len(view), size)])
+        return b"".join(members)
+
+    def _encode_chunks(self, items):
+        """Encode items in chunks, yielding the GIL between chunks
+
+        Yields the comma separated JSON of each chunk. The chunk size adapts
+        so that encoding a chunk takes about max_pause seconds; the size is
+        kept for the next payload.
+        """
+        max_pause = self._max_pause
+        size = self._chunk_size
+        items = items if isinstance(items, (list, tuple)) else tuple(items)
+        start = 0
+        while start < len(items):
+            began = time.perf_counter()
+            chunk = json.dumps(items[start : start + size], separators=(",", ":"), default=serialize)
+            elapsed = time.perf_counter() - began
+            start += size
+            yield chunk[1:-1].encode("utf-8")
+
+            if elapsed > 0:
+                size = min(max(int(size * max_pause / elapsed), 1), _MAX_CHUNK_SIZE)
+            # Release the GIL so application threads can run
+            time.sleep(0)
+        self._chunk_size = size
+
+    def _compress_chunks(self, prefix, chunks, suffix):
+        if self._buffer_pool is not None:
+            return self._compress_into_buffer(self._frame_chunks(prefix, chunks, suffix))
+
+        if self._compression_executor is not None:
+            return self._compress(prefix, b",".join([chunk for chunk in chunks if chunk]), suffix)
+
+        level = zlib.Z_DEFAULT_COMPRESSION
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        payload = [compressor.compress(chunk) for chunk in self._frame_chunks(prefix, chunks, suffix)]
+        payload.append(compressor.flush())
+        return b"".join(payload)
+
+    @staticmethod
+    def _frame_chunks(prefix, chunks, suffix):
+        yield prefix
+        separator = b""
+        for chunk in chunks:
+            if chunk:
+                yield separator
+                yield chunk
+                separator = b","
+        yield suffix
 
-        payload = json.dumps([payload], separators=(",", ":"))
-        if not isinstance(payload, bytes):
-            payload = payload.encode("utf-8")
+    def _create_payload(self, items, common):
+        if self._max_pause is not None and not (self.PAYLOAD_TYPE and self._common_attributes):
+            # Items are framed without building the whole payload object
+            prefix, suffix = _frame(self.PAYLOAD_TYPE, common)
+            if isinstance(items, EncodedItems):
+                return self._compress(prefix, items.data, suffix)
+            return self._compress_chunks(prefix, self._encode_chunks(items), suffix)
 
-        return self._compress_payload(payload)
+        return self._compress(*_encode_payload(self.PAYLOAD_TYPE, self._common_attributes, items, common))
 
     def send(self, item, timeout=None):
         """Send a single item
@@ -236,6 +469,14 @@ class Client:
         :type timeout: int
         :rtype: HTTPResponse
         """
+        payload = self._create_payload(items, common)
+        return self._send_payload(payload, timeout=timeout)
+
+    def _submit_payload(self, executor, items, common=None):
+        """Create a payload on an executor, returning a future"""
+        return executor.submit(_create_payload, self.PAYLOAD_TYPE, self._common_attributes, items, common)
+
+    def _send_payload(self, payload, timeout=None):
         # Specifying the headers argument overrides any base headers existing
         # in the pool, so we must copy all existing headers
         headers = self._headers.copy()
@@ -243,8 +484,11 @@ class Client:
         # Generate a unique request ID for this request
         headers["x-request-id"] = str(uuid.uuid4())
 
-        payload = self._create_payload(items, common)
-        urllib3_response = self._pool.urlopen("POST", self.PATH, body=payload, headers=headers, timeout=timeout)
+        try:
+            urllib3_response = self._pool.urlopen("POST", self.PATH, body=payload, headers=headers, timeout=timeout)
+        finally:
+            if self._buffer_pool is not None and isinstance(payload, memoryview):
+                self._buffer_pool.release(payload)
         if not isinstance(urllib3_response, urllib3.HTTPResponse):
             exc_msg = f"Expected urllib3.HTTPResponse, got {type(urllib3_response)}"
             raise TypeError(exc_msg)
@@ -252,6 +496,11 @@ class Client:
         return HTTPResponse(urllib3_response)
 
 
+def _create_payload(payload_type, common_attributes, items, common):
+    """Create a compressed payload without a client, for use in worker processes"""
+    return Client._compress_payload(*_encode_payload(payload_type, common_attributes, items, common))
+
+
 class SpanClient(Client):
     """HTTP Client for interacting with the New Relic Span API
 
@@ -327,13 +576,8 @@ class EventClient(Client):
 
     HOST = "insights-collector.newrelic.com"
     PATH = "/v1/accounts/events"
-
-    def _create_payload(self, items, common):  # noqa: ARG002
-        payload = json.dumps(items)
-        if not isinstance(payload, bytes):
-            payload = payload.encode("utf-8")
-
-        return self._compress_payload(payload)
+    # Events are sent as a plain list rather than under a payload type
+    PAYLOAD_TYPE = ""
 
     def send_batch(self, items, timeout=None):
         """Send a batch of items
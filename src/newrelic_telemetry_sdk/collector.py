@@ -0,0 +1,443 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local collector for processes too short lived to run a harvester
+
+The collector is a daemon listening on a Unix domain socket. Processes
+forward spans, events, logs and metrics to it with a
+:class:`ForwardingClient`, which costs one socket write per batch. The
+collector aggregates the data into batches and sends them to New Relic with
+the SDK clients and harvesters, reusing one set of connections for every
+process on the host.
+
+Run the collector with::
+
+    NEW_RELIC_LICENSE_KEY=... python -m newrelic_telemetry_sdk.collector
+
+Each forwarded batch is sent as one frame: a header holding the kind of data
+as an unsigned byte and the body length as a 32 bit unsigned integer, both
+big endian, followed by a JSON body with ``items`` and ``common`` keys in the
+format the New Relic APIs accept.
+"""
+
+import argparse
+import json
+import logging
+import os
+import pathlib
+import selectors
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+
+from newrelic_telemetry_sdk.batch import EventBatch, LogBatch, SpanBatch
+from newrelic_telemetry_sdk.client import EventClient, LogClient, MetricClient, SpanClient
+from newrelic_telemetry_sdk.compact import EncodedItems, encode
+from newrelic_telemetry_sdk.harvester import Harvester
+from newrelic_telemetry_sdk.metric_batch import MetricBatch
+
+_logger = logging.getLogger(__name__)
+
+_FRAME_HEADER = struct.Struct(">BI")
+_KINDS = {"spans": 1, "events": 2, "logs": 3, "metrics": 4}
+
+#: The environment variable overriding the default socket path
+SOCKET_PATH_ENVIRONMENT_VARIABLE = "NEW_RELIC_COLLECTOR_SOCKET"
+
+#: The largest frame accepted by the collector, in bytes
+MAX_FRAME_SIZE = 1 << 26
+
+
+def _private_directory():
+    directory = os.environ.get("XDG_RUNTIME_DIR")
+    if directory:
+        return pathlib.Path(directory)
+    return pathlib.Path(tempfile.gettempdir(), f"newrelic-telemetry-sdk-{os.getuid()}")
+
+
+def _create_private_directory(directory):
+    directory.mkdir(mode=0o700, exist_ok=True)
+    info = directory.lstat()
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        msg = f"{directory} is not a directory private to the current user"
+        raise PermissionError(msg)
+
+
+def default_socket_path():
+    """Return the socket path used when none is given
+
+    The socket is placed in a directory only the current user can access:
+    ``$XDG_RUNTIME_DIR`` when it is set, otherwise a directory named after
+    the user ID in the temporary directory.
+
+    :rtype: str
+    """
+    path = os.environ.get(SOCKET_PATH_ENVIRONMENT_VARIABLE)
+    return path or str(_private_directory() / "newrelic-telemetry-sdk.sock")
+
+
+class ForwardedResponse:
+    """The response returned for batches written to the collector socket"""
+
+    __slots__ = ()
+
+    status = 202
+    ok = True
+
+
+_FORWARDED = ForwardedResponse()
+
+
+class ForwardingClient:
+    """Forwards batches to a local collector over a Unix domain socket
+
+    This client has the same ``send`` and ``send_batch`` interface as the New
+    Relic HTTP clients, so it can be used with a :class:`Harvester
+    <newrelic_telemetry_sdk.harvester.Harvester>`. Each batch is written to
+    the collector with a single socket write and is not acknowledged.
+
+    Batches are only written to a socket owned by the expected user, so
+    data is not sent to a socket created by another user at the same path.
+
+    :param kind: The kind of data forwarded: "spans", "events", "logs" or
+        "metrics".
+    :type kind: str
+    :param path: (optional) The path of the collector socket. Defaults to
+        :func:`default_socket_path`.
+    :type path: str
+    :param timeout: (optional) A timeout in seconds for connecting to and
+        writing to the collector. Default: 5
+    :type timeout: int or float
+    :param owner: (optional) The user ID which must own the socket.
+        Defaults to the current user ID.
+    :type owner: int
+
+    :raises ValueError: if the kind is not supported
+
+    Usage::
+
+        >>> client = ForwardingClient("metrics", path="/tmp/collector.sock")
+        >>> client.kind
+        'metrics'
+    """
+
+    def __init__(self, kind, path=None, timeout=5, *, owner=None):
+        if kind not in _KINDS:
+            msg = f"Invalid kind: {kind!r}"
+            raise ValueError(msg)
+        self.kind = kind
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+        self.owner = os.getuid() if owner is None else owner
+
+    def _frame(self, items, common):
+        if isinstance(items, EncodedItems):
+            body = b'{"items":[' + items.data + b'],"common":' + encode(common) + b"}"
+        else:
+            body = encode({"items": items, "common": common})
+        return _FRAME_HEADER.pack(_KINDS[self.kind], len(body)) + body
+
+    def send(self, item, timeout=None):
+        """Forward a single item
+
+        :param item: The item to forward.
+        :param timeout: (optional) Overrides the client timeout.
+        :type timeout: int or float
+
+        :rtype: ForwardedResponse
+        """
+        return self.send_batch((item,), timeout=timeout)
+
+    def send_batch(self, items, common=None, timeout=None):
+        """Forward a batch of items
+
+        :param items: An iterable of items to forward.
+        :param common: (optional) The common block flushed with the items.
+        :type common: dict
+        :param timeout: (optional) Overrides the client timeout.
+        :type timeout: int or float
+
+        :raises OSError: if the collector cannot be reached
+        :raises PermissionError: if the socket is owned by another user
+        :rtype: ForwardedResponse
+        """
+        frame = self._frame(items, common)
+        owner = os.stat(self.path).st_uid
+        if owner != self.owner:
+            msg = f"{self.path} is owned by user ID {owner}, expected {self.owner}"
+            raise PermissionError(msg)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout if timeout is None else timeout)
+            sock.connect(self.path)
+            sock.sendall(frame)
+        return _FORWARDED
+
+    def close(self):
+        """Do nothing, since connections are closed after each batch"""
+
+
+class _FrameHandler(socketserver.StreamRequestHandler):
+    timeout = 10
+
+    def handle(self):
+        read = self.rfile.read
+        header = read(_FRAME_HEADER.size)
+        while len(header) == _FRAME_HEADER.size:
+            kind, length = _FRAME_HEADER.unpack(header)
+            if length > MAX_FRAME_SIZE:
+                _logger.warning("Dropping connection sending a %d byte frame.", length)
+                return
+            body = read(length)
+            if len(body) < length:
+                return
+            self.server.receive(kind, body)
+            header = read(_FRAME_HEADER.size)
+
+
+def _merge_attributes(item, common):
+    attributes = common and common.get("attributes")
+    if attributes:
+        item["attributes"] = {**attributes, **(item.get("attributes") or {})}
+    return item
+
+
+def _remove_stale_socket(path):
+    if not path.is_socket():
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        probe.settimeout(1.0)
+        try:
+            probe.connect(str(path))
+        except ConnectionRefusedError:
+            # Nothing is listening: the socket was left by a collector which
+            # exited without removing it
+            path.unlink(missing_ok=True)
+        except OSError:
+            # Binding reports the address as in use
+            pass
+
+
+class Collector(socketserver.ThreadingUnixStreamServer):
+    """Receives forwarded data on a Unix domain socket and sends it to New Relic
+
+    A batch and a harvester are created for each client given. Data of kinds
+    without a client is dropped. The harvesters are started when the
+    collector is created, and stopped, sending any remaining data, when the
+    collector is closed.
+
+    Common attributes of forwarded batches are merged into each item, since
+    the collector combines batches from many processes.
+
+    :param path: (optional) The path of the socket. A stale socket left at
+        this path by a collector which exited is replaced. Defaults to
+        :func:`default_socket_path`, whose directory is created if needed.
+    :type path: str
+    :param span_client: (optional) The client sending spans.
+    :type span_client: SpanClient
+    :param event_client: (optional) The client sending events.
+    :type event_client: EventClient
+    :param log_client: (optional) The client sending logs.
+    :type log_client: LogClient
+    :param metric_client: (optional) The client sending metrics.
+    :type metric_client: MetricClient
+    :param harvest_interval: (optional) The interval in seconds at which
+        data is sent. Default: 5
+    :type harvest_interval: int or float
+    :param mode: (optional) The permissions of the socket. Data written to
+        the socket is sent with the collector's license key, so by default
+        only the user running the collector may connect. Default: 0o600
+    :type mode: int
+
+    :raises OSError: if another collector is listening on ``path``
+    :raises PermissionError: if the directory of the default socket path is
+        not private to the current user
+
+    Usage::
+
+        >>> import os, tempfile, threading
+        >>> path = os.path.join(tempfile.mkdtemp(), "collector.sock")
+        >>> collector = Collector(path)
+        >>> thread = threading.Thread(target=collector.serve_forever)
+        >>> thread.start()
+        >>> collector.shutdown()
+        >>> collector.server_close()
+        >>> thread.join()
+    """
+
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(
+        self,
+        path=None,
+        *,
+        span_client=None,
+        event_client=None,
+        log_client=None,
+        metric_client=None,
+        harvest_interval=5,
+        mode=0o600,
+    ):
+        if not path:
+            path = default_socket_path()
+            if not os.environ.get(SOCKET_PATH_ENVIRONMENT_VARIABLE):
+                _create_private_directory(pathlib.Path(path).parent)
+        _remove_stale_socket(pathlib.Path(path))
+
+        self.mode = mode
+        super().__init__(path, _FrameHandler, bind_and_activate=False)
+        try:
+            self.server_bind()
+            self.server_activate()
+        except BaseException:
+            # server_close would remove the socket of another collector
+            self.socket.close()
+            raise
+        self.path = path
+        self.batches = {}
+        self.harvesters = []
+        for kind, client, batch in (
+            ("spans", span_client, SpanBatch()),
+            ("events", event_client, EventBatch()),
+            ("logs", log_client, LogBatch()),
+            ("metrics", metric_client, MetricBatch()),
+        ):
+            if client is not None:
+                self.batches[_KINDS[kind]] = batch
+                self.harvesters.append(Harvester(client, batch, harvest_interval))
+
+        for harvester in self.harvesters:
+            harvester.start()
+
+    def server_bind(self):
+        """Bind the socket, creating it with the collector's permissions
+
+        The umask is set while binding, so the socket never exists with
+        broader permissions.
+        """
+        umask = os.umask(0o777 & ~self.mode)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def receive(self, kind, body):
+        """Record the items of one frame into the batch of its kind
+
+        :param kind: The kind of data in the frame.
+        :type kind: int
+        :param body: The JSON body of the frame.
+        :type body: bytes
+        """
+        batch = self.batches.get(kind)
+        if batch is None:
+            return
+
+        try:
+            message = json.loads(body)
+            items = message["items"]
+            common = message.get("common")
+            if isinstance(batch, MetricBatch):
+                self._record_metrics(batch, items, common)
+            elif kind == _KINDS["events"]:
+                for item in items:
+                    batch.record(item)
+            else:
+                for item in items:
+                    batch.record(_merge_attributes(item, common))
+        except Exception:
+            _logger.exception("Dropping a malformed frame.")
+
+    @staticmethod
+    def _record_metrics(batch, items, common):
+        for item in items:
+            tags = _merge_attributes(item, common).get("attributes")
+            typ = item.get("type")
+            identity = batch.create_identity(item["name"], tags, typ)
+            if typ == "summary":
+                batch._merge_summary_values(identity, item["value"])
+            elif typ == "count":
+                batch._merge_count(identity, item["value"])
+            else:
+                batch.record_gauge(item["name"], item["value"], tags)
+
+    def server_close(self):
+        """Close the socket and stop the harvesters, sending any remaining data
+
+        Connections waiting to be accepted are handled before the socket is
+        closed, so batches written before the collector was shut down are
+        sent.
+        """
+        with selectors.DefaultSelector() as selector:
+            selector.register(self, selectors.EVENT_READ)
+            while selector.select(0):
+                self._handle_request_noblock()
+        super().server_close()
+        pathlib.Path(self.path).unlink(missing_ok=True)
+        for harvester in self.harvesters:
+            harvester.stop()
+
+
+def main(argv=None):
+    """Run a collector until it is interrupted
+
+    The license key is read from the ``NEW_RELIC_LICENSE_KEY`` environment
+    variable.
+
+    :param argv: (optional) Command line arguments. Defaults to
+        :data:`sys.argv`.
+    :type argv: list
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m newrelic_telemetry_sdk.collector", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument(
+        "--socket", help=f"the socket path (default: ${SOCKET_PATH_ENVIRONMENT_VARIABLE} or {default_socket_path()})"
+    )
+    parser.add_argument("--harvest-interval", type=float, default=5, help="seconds between harvests (default: 5)")
+    parser.add_argument(
+        "--mode", type=lambda value: int(value, 8), default=0o600, help="the socket permissions in octal (default: 600)"
+    )
+    args = parser.parse_args(argv)
+
+    license_key = os.environ.get("NEW_RELIC_LICENSE_KEY")
+    if not license_key:
+        parser.error("the NEW_RELIC_LICENSE_KEY environment variable is required")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    collector = Collector(
+        args.socket,
+        span_client=SpanClient(license_key),
+        event_client=EventClient(license_key),
+        log_client=LogClient(license_key),
+        metric_client=MetricClient(license_key),
+        harvest_interval=args.harvest_interval,
+        mode=args.mode,
+    )
+    _logger.info("Collector listening on %s", collector.path)
+    try:
+        collector.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import json
+import random
+import time
+from collections.abc import Mapping
+
+from newrelic_telemetry_sdk.log import Log
+from newrelic_telemetry_sdk.metric import DEFAULT
+
+
+def _format_id(value):
+    if isinstance(value, int):
+        return f"{value:016x}"
+    return value
+
+
+class CompactMapping(Mapping):
+    """Base type for slot based telemetry objects
+
+    Compact objects store their fields as attributes rather than in a dict.
+    The wire format is only built when the object is serialized by a client
+    or iterated as a mapping. Subclasses look up single keys from their
+    attributes.
+    """
+
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def to_dict(self):
+        """Build the wire format representation of this object
+
+        :rtype: dict
+        """
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class CompactSpan(CompactMapping):
+    """A slot based variant of :class:`Span <newrelic_telemetry_sdk.span.Span>`
+
+    Identifiers are stored as integers and only formatted as hex when
+    serialized. An attributes dict is only allocated when tags are provided.
+
+    :param name: The name of the span.
+    :type name: str
+    :param tags: (optional) A set of tags that can be used to filter this span
+        in the New Relic UI.
+    :type tags: dict
+    :param guid: (optional) A random, unique identifier used to locate exactly
+        1 span in New Relic.
+    :type guid: str
+    :param trace_id: (optional) A random identifier representing a group of
+        spans known as a "trace".
+    :type trace_id: str
+    :param parent_id: (optional) The guid of the span that called this span.
+    :type parent_id: str
+    :param start_time_ms: (optional) A unix timestamp in milliseconds
+        representing the start time of the span. Defaults to time.time() * 1000
+    :type start_time_ms: int
+    :param duration_ms: (optional) Total duration of the span in milliseconds.
+    :type duration_ms: int
+
+    Usage::
+
+        >>> with CompactSpan("span_name") as span:
+        ...     pass
+        >>> span["attributes"]["name"]
+        'span_name'
+    """
+
+    __slots__ = ("_guid", "_trace_id", "duration_ms", "name", "parent_id", "tags", "timestamp")
+
+    def __init__(
+        self, name, tags=None, *, guid=None, trace_id=None, parent_id=None, start_time_ms=None, duration_ms=None
+    ):
+        self._guid = guid or random.getrandbits(64)
+        self._trace_id = trace_id or random.getrandbits(64)
+        self.timestamp = int(start_time_ms or (time.time() * 1000))
+        self.name = name
+        self.tags = dict(tags) if tags else None
+        self.parent_id = parent_id
+        self.duration_ms = None if duration_ms is None else int(duration_ms)
+
+    @property
+    def guid(self):
+        """Span ID"""
+        return _format_id(self._guid)
+
+    @property
+    def trace_id(self):
+        """Trace ID"""
+        return _format_id(self._trace_id)
+
+    def finish(self, finish_time_ms=None):
+        """Record the duration on this span.
+
+        :param finish_time_ms: (optional) Timestamp in milliseconds. Defaults
+            to time.time() * 1000
+        :type finish_time_ms: int
+        """
+        finish_time_ms = int(finish_time_ms or (time.time() * 1000))
+        self.duration_ms = finish_time_ms - self.timestamp
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, tb):
+        self.finish()
+
+    def _attributes(self):
+        attributes = dict(self.tags) if self.tags else {}
+        attributes["name"] = self.name
+        if self.duration_ms is not None:
+            attributes["duration.ms"] = self.duration_ms
+        if self.parent_id:
+            attributes["parent.id"] = self.parent_id
+        return attributes
+
+    def __getitem__(self, key):
+        if key == "id":
+            return _format_id(self._guid)
+        if key == "trace.id":
+            return _format_id(self._trace_id)
+        if key == "timestamp":
+            return self.timestamp
+        if key == "attributes":
+            return self._attributes()
+        raise KeyError(key)
+
+    def to_dict(self):
+        """Build the wire format representation of this span
+
+        :rtype: dict
+        """
+        return {
+            "id": _format_id(self._guid),
+            "trace.id": _format_id(self._trace_id),
+            "timestamp": self.timestamp,
+            "attributes": self._attributes(),
+        }
+
+
+class CompactEvent(CompactMapping):
+    """A slot based variant of :class:`Event <newrelic_telemetry_sdk.event.Event>`
+
+    :param event_type: The type of event to report
+    :type event_type: str
+    :param tags: (optional) A set of tags that can be used to filter this
+        event in the New Relic UI.
+    :type tags: dict
+    :param timestamp_ms: (optional) A unix timestamp in milliseconds
+        representing the timestamp in ms at which the event occurred. Defaults to
+        time.time() * 1000
+    :type timestamp_ms: int
+
+    Usage::
+
+        >>> event = CompactEvent("Purchase", {"amount": 1}, timestamp_ms=1000)
+        >>> sorted(event.items())
+        [('amount', 1), ('eventType', 'Purchase'), ('timestamp', 1000)]
+    """
+
+    __slots__ = ("event_type", "tags", "timestamp_ms")
+
+    def __init__(self, event_type, tags=None, timestamp_ms=None):
+        self.event_type = event_type
+        self.tags = dict(tags) if tags else None
+        self.timestamp_ms = int(timestamp_ms or (time.time() * 1000))
+
+    def __getitem__(self, key):
+        if key == "eventType":
+            return self.event_type
+        if key == "timestamp":
+            return self.timestamp_ms
+        if self.tags:
+            return self.tags[key]
+        raise KeyError(key)
+
+    def to_dict(self):
+        """Build the wire format representation of this event
+
+        :rtype: dict
+        """
+        event = dict(self.tags) if self.tags else {}
+        event["eventType"] = self.event_type
+        event["timestamp"] = self.timestamp_ms
+        return event
+
+
+class CompactLog(CompactMapping):
+    """A slot based variant of :class:`Log <newrelic_telemetry_sdk.log.Log>`
+
+    :param message: The log message.
+    :type message: str
+    :param timestamp: (optional) The unix timestamp in milliseconds indicating
+        when the log message was generated. Defaults to now.
+    :type timestamp: int
+    :param \\**attributes: Additional attribute name=value pairs provided as keyword
+        arguments.
+
+    Usage::
+
+        >>> log = CompactLog("Hello World", timestamp=1000)
+        >>> dict(log)
+        {'message': 'Hello World', 'timestamp': 1000}
+    """
+
+    __slots__ = ("attributes", "message", "timestamp")
+
+    def __init__(self, message, timestamp=None, **attributes):
+        self.message = message
+        self.timestamp = int(timestamp or (time.time() * 1000))
+        self.attributes = attributes or None
+
+    @classmethod
+    def from_record(cls, record):
+        """Convert a logging.LogRecord into a CompactLog
+
+        :param record: The LogRecord to convert.
+        :type record: logging.LogRecord
+        """
+        return cls(**Log.extract_record_data(record))
+
+    def __getitem__(self, key):
+        if key == "message":
+            return self.message
+        if key == "timestamp":
+            return self.timestamp
+        if key == "attributes" and self.attributes:
+            return self.attributes
+        raise KeyError(key)
+
+    def to_dict(self):
+        """Build the wire format representation of this log
+
+        :rtype: dict
+        """
+        log = {"message": self.message, "timestamp": self.timestamp}
+        if self.attributes:
+            log["attributes"] = self.attributes
+        return log
+
+
+class CompactMetric(CompactMapping):
+    """Base type for slot based metrics
+
+    Includes common attribute definitions for compact metrics.
+    """
+
+    __slots__ = ("interval_ms", "name", "start_time_ms", "tags", "value")
+
+    TYPE = None
+
+    def __init__(self, name, value, interval_ms, tags=None, end_time_ms=DEFAULT):
+        self.name = name
+        self.value = value
+        self.interval_ms = interval_ms = None if interval_ms is None else int(interval_ms)
+
+        if end_time_ms is DEFAULT:
+            end_time_ms = time.time() * 1000.0
+        if end_time_ms is not None:
+            self.start_time_ms = int(end_time_ms) - (interval_ms or 0)
+        else:
+            self.start_time_ms = None
+
+        self.tags = dict(tags) if tags else None
+
+    @property
+    def end_time_ms(self):
+        """Metric end timestamp"""
+        if self.start_time_ms is not None:
+            return self.start_time_ms + (self.interval_ms or 0)
+        return None
+
+    def _wire_value(self):
+        return self.value
+
+    def __getitem__(self, key):
+        if key == "name":
+            return self.name
+        if key == "value":
+            return self._wire_value()
+        if key == "interval.ms" and self.interval_ms is not None:
+            return self.interval_ms
+        if key == "timestamp" and self.start_time_ms is not None:
+            return self.start_time_ms
+        if key == "attributes" and self.tags:
+            return self.tags
+        if key == "type" and self.TYPE:
+            return self.TYPE
+        raise KeyError(key)
+
+    def to_dict(self):
+        """Build the wire format representation of this metric
+
+        :rtype: dict
+        """
+        metric = {"name": self.name, "value": self._wire_value()}
+        if self.interval_ms is not None:
+            metric["interval.ms"] = self.interval_ms
+        if self.start_time_ms is not None:
+            metric["timestamp"] = self.start_time_ms
+        if self.tags:
+            metric["attributes"] = self.tags
+        if self.TYPE:
+            metric["type"] = self.TYPE
+        return metric
+
+
+class CompactGaugeMetric(CompactMetric):
+    """A slot based variant of :class:`GaugeMetric <newrelic_telemetry_sdk.metric.GaugeMetric>`
+
+    :param name: The name of the metric.
+    :type name: str
+    :param value: The metric value.
+    :type value: int or float
+    :param tags: (optional) A set of tags that can be used to filter this
+        metric in the New Relic UI.
+    :type tags: dict
+    :param end_time_ms: (optional) A unix timestamp in milliseconds representing the
+        end time of the metric. Defaults to time.time() * 1000
+    :type end_time_ms: int
+    """
+
+    __slots__ = ()
+
+    def __init__(self, name, value, tags=None, end_time_ms=DEFAULT):
+        super().__init__(name, value, None, tags, end_time_ms)
+
+
+class CompactCountMetric(CompactMetric):
+    """A slot based variant of :class:`CountMetric <newrelic_telemetry_sdk.metric.CountMetric>`
+
+    :param name: The name of the metric.
+    :type name: str
+    :param value: The metric count value.
+    :type value: int or float
+    :param interval_ms: The interval of time in milliseconds over which the
+        metric was recorded.
+    :type interval_ms: int
+    :param tags: (optional) A set of tags that can be used to filter this
+        metric in the New Relic UI.
+    :type tags: dict
+    :param end_time_ms: (optional) A unix timestamp in milliseconds representing the
+        end time of the metric. Defaults to time.time() * 1000
+    :type end_time_ms: int
+    """
+
+    __slots__ = ()
+
+    TYPE = "count"
+
+
+class CompactSummaryMetric(CompactMetric):
+    """A slot based variant of :class:`SummaryMetric <newrelic_telemetry_sdk.metric.SummaryMetric>`
+
+    The summary value is held as a ``(count, sum, min, max)`` tuple and only
+    expanded into a dict when serialized.
+
+    :param name: The name of the metric.
+    :type name: str
+    :param count: The count in the summary metric.
+    :type count: int
+    :param sum: The sum in the summary metric.
+    :type sum: int or float
+    :param min: The minimum value in the summary metric.
+    :type min: int or float
+    :param max: The maximum value in the summary metric.
+    :type max: int or float
+    :param interval_ms: The interval of time in milliseconds over which the
+        metric was recorded.
+    :type interval_ms: int
+    :param tags: (optional) A set of tags that can be used to filter this
+        metric in the New Relic UI.
+    :type tags: dict
+    :param end_time_ms: (optional) A unix timestamp in milliseconds representing the
+        end time of the metric. Defaults to time.time() * 1000
+    :type end_time_ms: int
+
+    Usage::
+
+        >>> metric = CompactSummaryMetric('response_time',
+        ...     count=1, sum=0.2, min=0.2, max=0.2, interval_ms=1)
+        >>> sorted(metric["value"].items())
+        [('count', 1), ('max', 0.2), ('min', 0.2), ('sum', 0.2)]
+    """
+
+    __slots__ = ()
+
+    TYPE = "summary"
+
+    def __init__(self, name, count, sum, min, max, *, interval_ms, tags=None, end_time_ms=DEFAULT):  # noqa: A002
+        super().__init__(name, (count, sum, min, max), interval_ms, tags, end_time_ms)
+
+    def _wire_value(self):
+        count, sum_, min_, max_ = self.value
+        return {"count": count, "sum": sum_, "min": min_, "max": max_}
+
+
+def serialize(obj):
+    """JSON encoder hook serializing compact objects to their wire format
+
+    This function is suitable for use as the ``default`` argument of
+    :func:`json.dumps`.
+
+    :raises TypeError: if the object is not a compact telemetry object
+    """
+    if isinstance(obj, CompactMapping):
+        return obj.to_dict()
+    exc_msg = f"Object of type {type(obj).__name__} is not JSON serializable"
+    raise TypeError(exc_msg)
+
+
+def encode(item):
+    """Encode a telemetry object in its compact JSON wire format
+
+    :param item: The object to encode.
+    :type item: dict or CompactMapping
+
+    :rtype: bytes
+    """
+    return json.dumps(item, separators=(",", ":"), default=serialize).encode("utf-8")
+
+
+class EncodedItems:
+    """A sequence of telemetry objects already encoded as JSON
+
+    Batches recording in encoded mode return this object from flush in place
+    of a tuple of items. ``data`` holds the comma separated encoded items,
+    which clients embed in the payload without encoding them again. Iterating
+    decodes the items.
+
+    :param data: The comma separated JSON encoded items.
+    :type data: bytes or bytearray
+    :param count: The number of items.
+    :type count: int
+
+    Usage::
+
+        >>> items = EncodedItems(b'{"a":1},{"b":2}', 2)
+        >>> len(items), list(items)
+        (2, [{'a': 1}, {'b': 2}])
+    """
+
+    __slots__ = ("count", "data")
+
+    def __init__(self, data, count):
+        self.data = data
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(json.loads(b"[" + self.data + b"]"))
+
+    def __repr__(self):
+        return f"EncodedItems(<{len(self.data)} bytes>, {self.count})"
@@ -0,0 +1,122 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keeps SDK objects usable in processes forked after they were created
+
+Pre-fork servers such as gunicorn with ``--preload`` create batches, clients
+and harvesters in a parent process and then fork workers. A forked child
+only has the thread which called :func:`os.fork`, so locks held by other
+threads in the parent are never released, harvester threads are not
+running and connection pools hold sockets shared with the parent.
+
+Batches, clients, harvesters and the other SDK objects holding locks
+register themselves here. In each forked child, :func:`reinit` runs before
+:func:`os.fork` returns and calls each registered object's ``_after_fork``
+method in the order the objects were created:
+
+* Locks are replaced with new, unlocked ones.
+* Batches are cleared. Data recorded before the fork is sent by the parent.
+* Clients drop inherited connections and compression threads.
+* Harvesters which were running in the parent are restarted the first time
+  their batch's lock is acquired, which every recording path does, or when
+  they are stopped.
+"""
+
+import itertools
+import logging
+import os
+import weakref
+
+_logger = logging.getLogger(__name__)
+
+# Objects are reinitialized in the order they were created, so objects are
+# reinitialized after the objects they were given, such as a rate limiter
+# given to a batch or a batch given to a harvester.
+_INSTANCES = weakref.WeakValueDictionary()
+_COUNTER = itertools.count()
+
+
+def register(obj):
+    """Reinitialize an object in forked children
+
+    :param obj: An object with an ``_after_fork`` method, called in each
+        forked child.
+    """
+    _INSTANCES[next(_COUNTER)] = obj
+
+
+class _NotifyingLock:
+    """Stands in for an object's lock until the lock is first acquired"""
+
+    __slots__ = ("_callback", "_lock", "_owner")
+
+    def __init__(self, owner, lock, callback):
+        self._owner = owner
+        self._lock = lock
+        self._callback = callback
+
+    def _notify(self):
+        if self._owner._lock is self:
+            self._owner._lock = self._lock
+        self._callback()
+
+    def acquire(self, *args, **kwargs):
+        self._notify()
+        return self._lock.acquire(*args, **kwargs)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self._notify()
+        return self._lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._lock.__exit__(*exc_info)
+
+
+def call_on_acquire(obj, callback):
+    """Call a function the next time an object's lock is acquired
+
+    The object's ``_lock`` attribute is replaced by a lock which calls
+    ``callback``, without holding the lock, then restores the original lock.
+    ``callback`` may be called more than once when several threads acquire
+    the lock at the same time.
+
+    :param obj: An object with a ``_lock`` attribute.
+    :param callback: A function called without arguments.
+    """
+    obj._lock = _NotifyingLock(obj, obj._lock, callback)
+
+
+def _reinit_one(obj):
+    try:
+        obj._after_fork()
+    except Exception:
+        _logger.exception("Failed to reinitialize %r after fork.", obj)
+
+
+def reinit():
+    """Reinitialize every registered object
+
+    This is called automatically in the child after :func:`os.fork`. It only
+    needs to be called directly when a process is forked without running
+    the :func:`os.register_at_fork` hooks.
+    """
+    for obj in list(_INSTANCES.values()):
+        _reinit_one(obj)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reinit)
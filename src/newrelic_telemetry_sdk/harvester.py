@@ -16,8 +16,13 @@ import logging
 import threading
 import time
 
+from newrelic_telemetry_sdk import fork
+
 _logger = logging.getLogger(__name__)
 
+_INITIAL_ITEM_COST_MS = 0.01
+_ITEM_COST_WEIGHT = 0.2
+
 
 class Harvester(threading.Thread):
     """Report data to New Relic at a fixed interval
@@ -38,6 +43,24 @@ class Harvester(threading.Thread):
     :param harvest_interval: (optional) The interval in seconds at which data
         will be reported. (default 5)
     :type harvest_interval: int or float
+    :param executor: (optional) An executor, typically a
+        :class:`concurrent.futures.ProcessPoolExecutor`, where large payloads
+        are encoded and compressed, moving that work out of the
+        application's interpreter. The harvester does not shut it down.
+        (default None)
+    :type executor: concurrent.futures.Executor
+    :param offload_threshold_ms: (optional) Payloads are sent to the
+        ``executor`` when creating them in process is estimated to take at
+        least this many milliseconds. The estimate is the number of items
+        times the cost per item measured on payloads created in process.
+        (default 50)
+    :type offload_threshold_ms: int or float
+
+    A harvester running when the process forks is restarted in the child the
+    first time its batch's lock is acquired, such as when data is recorded
+    into the batch, or when it is stopped. The
+    ``executor`` is not used in the child, since its workers belong to the
+    parent process.
 
     :ivar client: The telemetry SDK client where the harvester sends data.
     :vartype client: Client
@@ -58,21 +81,63 @@ class Harvester(threading.Thread):
 
     EVENT_CLS = threading.Event
 
-    def __init__(self, client, batch, harvest_interval=5):
+    def __init__(self, client, batch, harvest_interval=5, *, executor=None, offload_threshold_ms=50):
         super().__init__()
         self.daemon = True
         self.client = client
         self.batch = batch
         self.harvest_interval = harvest_interval
+        self.executor = executor
+        self.offload_threshold_ms = offload_threshold_ms
+        self._item_cost_ms = _INITIAL_ITEM_COST_MS
+        self._harvest_interval_start = 0
+        self._shutdown = self.EVENT_CLS()
+        self._restart_lock = threading.Lock()
+        self._restart_pending = False
+        fork.register(self)
+
+    def _after_fork(self):
+        # Only the forking thread survives in the child. Harvesters which were
+        # running are reset so they can be started again once data arrives.
+        if self.ident is None or self._shutdown.is_set():
+            return
+        threading.Thread.__init__(self, name=self.name, daemon=True)
+        self.executor = None
         self._harvest_interval_start = 0
         self._shutdown = self.EVENT_CLS()
+        self._restart_lock = threading.Lock()
+        self._restart_pending = True
+        if hasattr(self.batch, "_lock"):
+            fork.call_on_acquire(self.batch, self._restart)
+
+    def _restart(self):
+        with self._restart_lock:
+            if not self._restart_pending:
+                return
+            self._restart_pending = False
+            self.start()
+
+    def _send_offloaded(self, items, common=None):
+        """Create the payload in process or on the executor, then send it"""
+        client = self.client
+        if len(items) * self._item_cost_ms < self.offload_threshold_ms:
+            start = time.perf_counter()
+            payload = client._create_payload(items, common)
+            item_cost_ms = (time.perf_counter() - start) * 1000.0 / len(items)
+            self._item_cost_ms += (item_cost_ms - self._item_cost_ms) * _ITEM_COST_WEIGHT
+        else:
+            payload = client._submit_payload(self.executor, items, common).result()
+        return client._send_payload(payload)
 
     def _send(self):
         """Send items through the harvester client, handling any exceptions"""
         flush_result = self.batch.flush()
         if flush_result and flush_result[0]:
             try:
-                response = self.client.send_batch(*flush_result)
+                if self.executor is None:
+                    response = self.client.send_batch(*flush_result)
+                else:
+                    response = self._send_offloaded(*flush_result)
                 if not response.ok:
                     _logger.error("New Relic send_batch failed with status code: %r", response.status)
             except Exception:
@@ -119,5 +184,6 @@ class Harvester(threading.Thread):
             to shut down or None to block until the thread exits (default: None)
         :type timeout: int or float
         """
+        self._restart()
         self._shutdown.set()
         self.join(timeout=timeout)
@@ -12,18 +12,195 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import builtins
+import collections
 import json
 import logging
+import threading
 import time
 import traceback
 
-try:
-    from cStringIO import StringIO
-except ImportError:
-    from io import StringIO
+from newrelic_telemetry_sdk import fork
 
 DEFAULT_LOG_RECORD_KEYS = frozenset(vars(logging.makeLogRecord({})))
 
+_CAUSE_MESSAGE = "\nThe above exception was the direct cause of the following exception:\n\n"
+_CONTEXT_MESSAGE = "\nDuring handling of the above exception, another exception occurred:\n\n"
+_EXCEPTION_GROUP_TYPES = getattr(builtins, "BaseExceptionGroup", ())
+
+
+class StackTraceCache:
+    """A bounded cache of rendered stack traces
+
+    Rendering a traceback reads source lines for every frame, which is costly
+    when the same exception is raised repeatedly. This cache renders the
+    frames of a traceback once per unique code path and reuses the result.
+    The exception messages are always rendered from the exception values.
+
+    The rendered output is identical to :func:`traceback.print_exception`.
+
+    :param maxsize: (optional) The maximum number of rendered tracebacks
+        kept in the cache. Default: 128
+    :type maxsize: int
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+        fork.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _format_tb(self, tb):
+        key = []
+        current = tb
+        while current is not None:
+            key.append((current.tb_frame.f_code, current.tb_lasti))
+            current = current.tb_next
+        key = tuple(key)
+
+        cache = self._cache
+        with self._lock:
+            rendered = cache.get(key)
+            if rendered is not None:
+                cache.move_to_end(key)
+                return rendered
+
+        rendered = "Traceback (most recent call last):\n" + "".join(traceback.format_tb(tb))
+
+        with self._lock:
+            cache[key] = rendered
+            if len(cache) > self.maxsize:
+                cache.popitem(last=False)
+
+        return rendered
+
+    def format_exception(self, error_cls, error_value, error_tb):
+        """Render an exception and its traceback as a string
+
+        :param error_cls: The exception type.
+        :type error_cls: type
+        :param error_value: The exception value.
+        :type error_value: BaseException
+        :param error_tb: The exception traceback.
+        :type error_tb: types.TracebackType
+
+        :rtype: str
+        """
+        # Walk the exception chain from the outermost exception inward
+        chain = [(error_cls, error_value, error_tb, None)]
+        seen = {id(error_value)}
+        value = error_value
+        while value is not None:
+            cause = getattr(value, "__cause__", None)
+            context = getattr(value, "__context__", None)
+            if cause is not None:
+                value, message = cause, _CAUSE_MESSAGE
+            elif context is not None and not value.__suppress_context__:
+                value, message = context, _CONTEXT_MESSAGE
+            else:
+                break
+
+            if id(value) in seen:
+                break
+            seen.add(id(value))
+            chain.append((type(value), value, value.__traceback__, message))
+
+        # Exception groups have their own layout; render them without caching
+        if any(isinstance(value, _EXCEPTION_GROUP_TYPES) for _, value, _, _ in chain):
+            return "".join(traceback.format_exception(error_cls, error_value, error_tb))
+
+        parts = []
+        for cls, value, tb, message in reversed(chain):
+            if tb is not None:
+                parts.append(self._format_tb(tb))
+            parts.extend(traceback.format_exception_only(cls, value))
+            if message:
+                parts.append(message)
+
+        return "".join(parts)
+
+    def clear(self):
+        """Remove all rendered tracebacks from the cache"""
+        with self._lock:
+            self._cache.clear()
+
+
+STACK_TRACE_CACHE = StackTraceCache()
+
+
+class LogRecordSnapshot:
+    """A lightweight copy of a :class:`logging.LogRecord`
+
+    A snapshot holds only the fields of a log record that are needed to
+    create a :class:`Log`. Taking a snapshot does not format the message or
+    the traceback; that work is done when the snapshot is converted with
+    :meth:`Log.from_record`.
+
+    Since the message is formatted later, arguments passed to the logging
+    call must not be mutated after the call is made.
+
+    :param record: The LogRecord to copy.
+    :type record: logging.LogRecord
+
+    Usage::
+
+        >>> import logging
+        >>> record = logging.makeLogRecord({"msg": "Hello %s", "args": ("World",)})
+        >>> snapshot = LogRecordSnapshot(record)
+        >>> Log.from_record(snapshot)["message"]
+        'Hello World'
+    """
+
+    __slots__ = (
+        "args",
+        "created",
+        "exc_info",
+        "extras",
+        "levelname",
+        "lineno",
+        "msg",
+        "name",
+        "pathname",
+        "process",
+        "processName",
+        "thread",
+        "threadName",
+    )
+
+    def __init__(self, record):
+        self.created = record.created
+        self.msg = record.msg
+        self.args = record.args
+        self.levelname = record.levelname
+        self.name = record.name
+        self.thread = record.thread
+        self.threadName = record.threadName
+        self.process = record.process
+        self.processName = record.processName
+        self.pathname = record.pathname
+        self.lineno = record.lineno
+        self.exc_info = record.exc_info
+
+        record_dict = record.__dict__
+        if len(record_dict) > len(DEFAULT_LOG_RECORD_KEYS):
+            default_keys = DEFAULT_LOG_RECORD_KEYS
+            self.extras = {key: value for key, value in record_dict.items() if key not in default_keys}
+        else:
+            self.extras = None
+
+    def getMessage(self):  # noqa: N802
+        """Return the message for this record, merging any arguments
+
+        :rtype: str
+        """
+        msg = str(self.msg)
+        if self.args:
+            msg = msg % self.args
+        return msg
+
 
 class Log(dict):
     """A log representing a log event in the New Relic logging UI
@@ -50,8 +227,11 @@ class Log(dict):
     def extract_record_data(record):
         """Extracts data from a logging.LogRecord into a flat dictionary
 
+        Rendered stack traces are cached in :data:`STACK_TRACE_CACHE` so
+        repeated exceptions are only rendered once.
+
         :param record: The LogRecord from which to extract data.
-        :type record: logging.LogRecord
+        :type record: logging.LogRecord or LogRecordSnapshot
 
         >>> import logging
         >>> record = logging.makeLogRecord({"msg": "Hello World"})
@@ -76,23 +256,26 @@ class Log(dict):
             "line.number": record.lineno,
         }
 
-        if len(record.__dict__) > len(DEFAULT_LOG_RECORD_KEYS):
+        if isinstance(record, LogRecordSnapshot):
+            extras = record.extras
+        elif len(record.__dict__) > len(DEFAULT_LOG_RECORD_KEYS):
             default_keys = DEFAULT_LOG_RECORD_KEYS
-            for key in record.__dict__:
-                if key not in default_keys:
-                    value = getattr(record, key)
-                    if not isinstance(value, (str, int, float, bool)) and value is not None:
-                        value = str(value)
+            extras = {key: value for key, value in record.__dict__.items() if key not in default_keys}
+        else:
+            extras = None
+
+        if extras:
+            for key, value in extras.items():
+                if isinstance(value, (str, int, float, bool)) or value is None:
                     output[key] = value
+                else:
+                    output[key] = str(value)
 
         if record.exc_info:
             error_cls, error_value, error_tb = record.exc_info
             output["error.class"] = getattr(error_cls, "__module__", "builtins") + "." + error_cls.__name__
             output["error.message"] = str(error_value)
-            s = StringIO()
-            traceback.print_exception(error_cls, error_value, error_tb, None, s)
-            output["error.stack"] = s.getvalue().rstrip()
-            s.close()
+            output["error.stack"] = STACK_TRACE_CACHE.format_exception(error_cls, error_value, error_tb).rstrip()
 
         return output
 
@@ -104,7 +287,7 @@ class Log(dict):
         :py:class:`Log`, extracting any dimensions/labels from the record.
 
         :param record: The LogRecord to convert.
-        :type record: logging.LogRecord
+        :type record: logging.LogRecord or LogRecordSnapshot
 
         >>> import logging
         >>> record = logging.makeLogRecord({"msg": "Hello World"})
@@ -151,3 +334,68 @@ class NewRelicLogFormatter(logging.Formatter):
         :rtype: str
         """
         return json.dumps(Log.extract_record_data(record), separators=(",", ":"))
+
+
+class NewRelicLogHandler(logging.Handler):
+    """New Relic Log Handler
+
+    The New Relic log handler records :class:`logging.LogRecord` objects into
+    a :class:`LogRecordBatch <newrelic_telemetry_sdk.batch.LogRecordBatch>`.
+    Emitting a record only appends it to the batch's bounded buffer; message
+    formatting and attribute extraction take place when the batch is flushed
+    by a :class:`Harvester <newrelic_telemetry_sdk.harvester.Harvester>`.
+
+    Unlike other handlers, the handler lock is not acquired when a record is
+    handled so the logging thread never blocks on the handler.
+
+    Since formatting is deferred, arguments passed to the logging call must
+    not be mutated after the call is made.
+
+    :param batch: The batch where records are buffered.
+    :type batch: LogRecordBatch
+    :param level: (optional) The minimum level of records handled.
+        Default: logging.NOTSET
+    :type level: int
+
+    Usage::
+
+        >>> import logging
+        >>> from newrelic_telemetry_sdk.batch import LogRecordBatch
+        >>> batch = LogRecordBatch()
+        >>> handler = NewRelicLogHandler(batch)
+        >>> handler.handle(logging.makeLogRecord({"msg": "Hello World"}))
+        True
+        >>> batch.flush()[0][0]["message"]
+        'Hello World'
+    """
+
+    def __init__(self, batch, level=logging.NOTSET):
+        super().__init__(level)
+        self.batch = batch
+
+    def handle(self, record):
+        """Conditionally emit the specified logging record without locking
+
+        :param record: The LogRecord to handle.
+        :type record: logging.LogRecord
+        """
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        """Buffer the specified logging record
+
+        Errors raised by the batch are reported with
+        :meth:`logging.Handler.handleError` rather than raised to the caller.
+
+        :param record: The LogRecord to buffer.
+        :type record: logging.LogRecord
+        """
+        try:
+            self.batch.record(record)
+        except Exception:  # noqa: BLE001
+            self.handleError(record)
@@ -12,9 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import threading
 import time
 
+from newrelic_telemetry_sdk import fork
+
 
 class MetricBatch:
     """Maps a metric identity to its aggregated value
@@ -33,10 +36,20 @@ class MetricBatch:
         self._lock = self.LOCK_CLS()
         self._batch = {}
         self._timestamps = {}
+        self._sets = {}
         tags = tags and dict(tags)
         self._common = {}
         if tags:
             self._common["attributes"] = tags
+        fork.register(self)
+
+    def _after_fork(self):
+        # Data recorded before the fork is sent by the parent process
+        self._lock = self.LOCK_CLS()
+        self._batch = {}
+        self._timestamps = {}
+        self._sets = {}
+        self._interval_start = int(time.time() * 1000.0)
 
     @staticmethod
     def create_identity(name, tags=None, typ=None):
@@ -67,10 +80,43 @@ class MetricBatch:
         :type tags: dict
         """
         identity = self.create_identity(name, tags)
+        self._merge_gauge(identity, value)
+
+    def _merge_gauge(self, identity, value):
         with self._lock:
             self._batch[identity] = value
             self._timestamps[identity] = int(time.time() * 1000.0)
 
+    def record_set(self, name, value, tags=None):
+        """Records a member of a set
+
+        The set is reported as a gauge metric holding the number of unique
+        members recorded since the last flush.
+
+        :param name: The name of the metric.
+        :type name: str
+        :param value: The set member. Members must be hashable.
+        :param tags: (optional) A set of tags that can be used to
+            filter this metric in the New Relic UI.
+        :type tags: dict
+
+        Usage::
+
+            >>> batch = MetricBatch()
+            >>> for user in ("a", "b", "a"):
+            ...     batch.record_set("users", user)
+            >>> batch.flush()[0][0]["value"]
+            2
+        """
+        identity = self.create_identity(name, tags)
+        with self._lock:
+            members = self._sets.get(identity)
+            if members is None:
+                members = self._sets[identity] = set()
+            members.add(value)
+            self._batch[identity] = len(members)
+            self._timestamps[identity] = int(time.time() * 1000.0)
+
     def record_count(self, name, value, tags=None):
         """Records a count metric
 
@@ -83,6 +129,9 @@ class MetricBatch:
         :type tags: dict
         """
         identity = self.create_identity(name, tags, "count")
+        self._merge_count(identity, value)
+
+    def _merge_count(self, identity, value):
         with self._lock:
             self._batch[identity] = self._batch.get(identity, 0) + value
 
@@ -98,17 +147,66 @@ class MetricBatch:
         :type tags: dict
         """
         identity = self.create_identity(name, tags, "summary")
+        self._merge_summary(identity, value)
+
+    def _merge_summary(self, identity, value):
         with self._lock:
-            if identity in self._batch:
-                merged_value = self._batch[identity]
+            merged_value = self._batch.get(identity)
+            if merged_value is not None:
                 merged_value["count"] += 1
                 merged_value["sum"] += value
-                merged_value["min"] = min(value, merged_value["min"])
-                merged_value["max"] = max(value, merged_value["max"])
+                if value < merged_value["min"]:
+                    merged_value["min"] = value
+                elif value > merged_value["max"]:
+                    merged_value["max"] = value
             else:
                 value = {"count": 1, "sum": value, "min": value, "max": value}
                 self._batch[identity] = value
 
+    def _merge_summary_values(self, identity, value):
+        with self._lock:
+            merged_value = self._batch.get(identity)
+            if merged_value is not None:
+                merged_value["count"] += value["count"]
+                merged_value["sum"] += value["sum"]
+                merged_value["min"] = min(merged_value["min"], value["min"])
+                merged_value["max"] = max(merged_value["max"], value["max"])
+            else:
+                self._batch[identity] = {key: value[key] for key in ("count", "sum", "min", "max")}
+
+    def timed(self, name, tags=None):
+        """Times a block of code or function, recording a summary metric
+
+        The returned timer can be used as either a context manager or a
+        decorator. Durations are measured with :func:`time.perf_counter_ns`
+        and recorded in milliseconds. The metric identity is computed once
+        when the timer is created, so timers should be created once and
+        reused.
+
+        A timer used as a context manager holds the start time of the block
+        it is timing and must not be shared across threads. Decorated
+        functions may be called concurrently.
+
+        :param name: The name of the metric.
+        :type name: str
+        :param tags: (optional) A set of tags that can be used to
+            filter this metric in the New Relic UI.
+        :type tags: dict
+
+        :rtype: SummaryTimer
+
+        Usage::
+
+            >>> batch = MetricBatch()
+            >>> @batch.timed("work.duration")
+            ... def work():
+            ...     pass
+            >>> work()
+            >>> with batch.timed("block.duration", {"step": 1}):
+            ...     pass
+        """
+        return SummaryTimer(self, self.create_identity(name, tags, "summary"))
+
     def flush(self):
         """Flush all metrics from the batch
 
@@ -147,6 +245,7 @@ class MetricBatch:
 
             batch.clear()
             timestamps.clear()
+            self._sets.clear()
 
             common = self._common.copy()
             common["timestamp"] = self._interval_start
@@ -157,3 +256,81 @@ class MetricBatch:
             self._interval_start = now
 
         return items, common
+
+
+class SummaryTimer:
+    """Records elapsed time in milliseconds into a summary metric
+
+    Instances are created by :meth:`MetricBatch.timed`.
+    """
+
+    __slots__ = ("_identity", "_merge_summary", "_start")
+
+    def __init__(self, batch, identity):
+        self._merge_summary = batch._merge_summary
+        self._identity = identity
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc, value, tb):
+        self._merge_summary(self._identity, (time.perf_counter_ns() - self._start) / 1e6)
+
+    def __call__(self, wrapped):
+        merge_summary = self._merge_summary
+        identity = self._identity
+        perf_counter_ns = time.perf_counter_ns
+
+        @functools.wraps(wrapped)
+        def wrapper(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return wrapped(*args, **kwargs)
+            finally:
+                merge_summary(identity, (perf_counter_ns() - start) / 1e6)
+
+        return wrapper
+
+
+class _SeriesCache:
+    """Caches values created for each metric series, such as identities
+
+    The cache is cleared when it holds ``max_series`` values, so memory
+    stays bounded when series have unbounded cardinality.
+    """
+
+    __slots__ = ("_create", "_values", "max_series")
+
+    def __init__(self, create, max_series):
+        self._create = create
+        self._values = {}
+        self.max_series = max_series
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, unhashable_key=None):
+        """Return the value of a series, creating it if it is not cached
+
+        :param key: The key of the series.
+        :param unhashable_key: (optional) The key used in place of an
+            unhashable key. By default, unhashable keys raise TypeError.
+        """
+        values = self._values
+        try:
+            value = values.get(key)
+        except TypeError:
+            if unhashable_key is None:
+                raise
+            # Unhashable attribute values are not tagged
+            key = unhashable_key
+            value = values.get(key)
+
+        if value is None:
+            value = self._create(key)
+            if len(values) >= self.max_series:
+                values.clear()
+            values[key] = value
+        return value
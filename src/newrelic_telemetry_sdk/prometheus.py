@@ -0,0 +1,409 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Scrapes Prometheus text exposition endpoints into a metric batch
+
+=============  ============================================================
+Prometheus     Recorded as
+=============  ============================================================
+``counter``    A count metric holding the increase since the previous
+               scrape
+``gauge``      A gauge metric
+``untyped``    A gauge metric
+``histogram``  A summary metric holding the observations since the previous
+               scrape
+``summary``    Gauge metrics for the quantiles, and count metrics for the
+               ``_count`` and ``_sum`` series
+=============  ============================================================
+"""
+
+import concurrent.futures
+import logging
+import math
+import re
+import threading
+
+import urllib3
+
+from newrelic_telemetry_sdk.metric_batch import _SeriesCache
+
+_logger = logging.getLogger(__name__)
+
+_LABEL = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"((?:[^"\\]|\\.)*)"\s*,?')
+_ESCAPES = re.compile(r"\\(.)")
+_ESCAPED = {"n": "\n", "\\": "\\", '"': '"'}
+_HISTOGRAM_SUFFIXES = ("_bucket", "_sum", "_count")
+_SUMMARY_SUFFIXES = ("_sum", "_count")
+_FAMILY_SUFFIXES = (*_HISTOGRAM_SUFFIXES, "_total", "_created")
+_CHUNK_SIZE = 1 << 16
+
+
+def _unescape(value):
+    if "\\" not in value:
+        return value
+    return _ESCAPES.sub(lambda match: _ESCAPED.get(match.group(1), match.group(0)), value)
+
+
+def _parse_series(series):
+    name, _, labels = series.partition("{")
+    if not labels:
+        return name, {}
+    return name, {key: _unescape(value) for key, value in _LABEL.findall(labels[:-1])}
+
+
+def _lines(response):
+    # Only complete lines are decoded, so characters split across chunks
+    # are decoded once the rest of their line has been received
+    pending = b""
+    for chunk in response.stream(_CHUNK_SIZE):
+        text, newline, pending = (pending + chunk).rpartition(b"\n")
+        if newline:
+            yield from text.decode("utf-8").split("\n")
+    if pending:
+        yield pending.decode("utf-8")
+
+
+def _integral(value):
+    if value.is_integer():
+        return int(value)
+    return value
+
+
+def _delta(previous, value):
+    # A decrease means the counter was reset and counted up from zero
+    if value >= previous:
+        return value - previous
+    return value
+
+
+def _family_type(name, types):
+    for suffix in _FAMILY_SUFFIXES:
+        if name.endswith(suffix):
+            typ = types.get(name[: -len(suffix)])
+            if typ is not None:
+                return typ
+    return None
+
+
+def _estimate_range(bounds, cumulative, mean):
+    # Bucket counts are cumulative: a bucket received observations when its
+    # count is larger than the count of the bucket below it
+    observed = [index for index, count in enumerate(cumulative) if count > (cumulative[index - 1] if index else 0)]
+    if not observed:
+        return mean, mean
+
+    low, high = observed[0], observed[-1]
+    minimum = bounds[low - 1] if low else bounds[low]
+    maximum = bounds[high]
+    if not math.isfinite(maximum):
+        maximum = bounds[high - 1] if high else mean
+    return min(minimum, mean), max(maximum, mean)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "count", "sum", "tags")
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.buckets = []
+        self.count = 0.0
+        self.sum = 0.0
+
+
+class _Target:
+    __slots__ = ("instance", "state", "url")
+
+    def __init__(self, url):
+        self.url = url
+        self.instance = url and urllib3.util.parse_url(url).netloc
+        # Maps each series to a tuple of (identity, last cumulative value)
+        self.state = {}
+
+
+class _Scrape:
+    __slots__ = ("batch", "histograms", "invalid", "previous", "scraper", "state", "target", "types")
+
+    def __init__(self, scraper, target):
+        self.scraper = scraper
+        self.batch = scraper.batch
+        self.target = target
+        self.previous = target.state
+        self.state = {}
+        self.types = {}
+        self.histograms = {}
+        self.invalid = 0
+
+    def _identity(self, entry, name, labels, typ):
+        if entry is not None and entry[0][0] == typ:
+            return entry[0]
+        if self.target.instance:
+            labels = dict(labels, instance=self.target.instance)
+        return self.batch.create_identity(name, labels or None, typ)
+
+    def add_type(self, line):
+        family, _, typ = line[len("# TYPE ") :].strip().partition(" ")
+        if typ:
+            self.types[family] = typ.strip()
+
+    def _record_line(self, line):
+        end = line.rfind("}")
+        if end == -1:
+            series, _, rest = line.partition(" ")
+        else:
+            series, rest = line[: end + 1], line[end + 1 :]
+        value = float(rest.split(None, 1)[0])
+        name, labels = self.scraper._series.get(series)
+
+        typ = self.types.get(name)
+        if typ is None:
+            typ = _family_type(name, self.types)
+
+        if typ == "histogram":
+            self._add_to_histogram(name, labels, value)
+        elif typ == "counter" or (typ == "summary" and name.endswith(_SUMMARY_SUFFIXES)):
+            if not name.endswith("_created"):
+                self._record_counter(series, name, labels, value)
+        elif not math.isnan(value):
+            entry = self.previous.get(series)
+            identity = self._identity(entry, name, labels, None)
+            self.state[series] = (identity, None)
+            self.batch._merge_gauge(identity, value)
+
+    def parse_line(self, line):
+        try:
+            self._record_line(line)
+        except (ValueError, IndexError):
+            self.invalid += 1
+
+    def _record_counter(self, series, name, labels, value):
+        entry = self.previous.get(series)
+        if math.isnan(value):
+            if entry is not None:
+                self.state[series] = entry
+            return
+
+        identity = self._identity(entry, name, labels, "count")
+        self.state[series] = (identity, value)
+        if entry is None or entry[1] is None:
+            return
+        delta = _delta(entry[1], value)
+        if delta:
+            self.batch._merge_count(identity, _integral(delta))
+
+    def _add_to_histogram(self, name, labels, value):
+        suffix = next((suffix for suffix in _HISTOGRAM_SUFFIXES if name.endswith(suffix)), None)
+        if suffix is None:
+            return
+
+        tags = labels
+        if suffix == "_bucket":
+            tags = {key: label for key, label in labels.items() if key != "le"}
+        key = (name[: -len(suffix)], frozenset(tags.items()))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = _Histogram(tags)
+
+        if suffix == "_bucket":
+            histogram.buckets.append((float(labels["le"]), value))
+        elif suffix == "_sum":
+            histogram.sum = value
+        else:
+            histogram.count = value
+
+    def _record_histogram(self, key, histogram):
+        histogram.buckets.sort()
+        bounds = [bound for bound, _ in histogram.buckets]
+        cumulative = tuple(count for _, count in histogram.buckets)
+        current = (histogram.count, histogram.sum, cumulative)
+
+        entry = self.previous.get(key)
+        identity = self._identity(entry, key[0], histogram.tags, "summary")
+        self.state[key] = (identity, current)
+        if entry is None or entry[1] is None:
+            return
+
+        last_count, last_sum, last_cumulative = entry[1]
+        count = _delta(last_count, histogram.count)
+        if not count:
+            return
+        if histogram.count < last_count or len(last_cumulative) != len(cumulative):
+            total = histogram.sum
+        else:
+            total = histogram.sum - last_sum
+            cumulative = [bucket - last for bucket, last in zip(cumulative, last_cumulative)]
+
+        minimum, maximum = _estimate_range(bounds, cumulative, total / count)
+        value = {"count": _integral(count), "sum": total, "min": minimum, "max": maximum}
+        self.batch._merge_summary_values(identity, value)
+
+    def finish(self):
+        for key, histogram in self.histograms.items():
+            self._record_histogram(key, histogram)
+        self.target.state = self.state
+
+    def abort(self):
+        # Counters already recorded keep their new value, so their increase
+        # is not recorded again by the next scrape. Histograms are only
+        # recorded by a complete scrape and keep their previous value.
+        self.target.state = {**self.previous, **self.state}
+
+
+class PrometheusScraper(threading.Thread):
+    """Scrapes Prometheus text exposition endpoints into a metric batch
+
+    The scraper is a thread implementation which fetches every URL
+    concurrently every ``scrape_interval`` seconds. Responses are parsed
+    line by line as they are received, without buffering the whole
+    response. The module documentation lists how each type of metric is
+    recorded.
+
+    The last value of each series is stored per endpoint, together with its
+    metric identity, and is replaced on every scrape so that series which
+    disappear from an endpoint are forgotten. Counters are first recorded on
+    their second scrape. A counter which decreases is treated as reset and
+    its new value is recorded as the increase. The minimum and maximum of a
+    histogram are estimated from the bounds of the lowest and highest
+    buckets which received observations.
+
+    Metrics scraped from a URL have an ``instance`` attribute holding the
+    host and port of the URL.
+
+    :param batch: The batch where metrics are recorded.
+    :type batch: MetricBatch
+    :param urls: The URLs of the endpoints to scrape.
+    :type urls: list
+    :param scrape_interval: (optional) The interval in seconds between
+        scrapes. Default: 15
+    :type scrape_interval: int or float
+    :param timeout: (optional) A timeout in seconds for each request.
+        Default: 5
+    :type timeout: int or float
+    :param max_workers: (optional) The maximum number of endpoints fetched
+        at the same time. Default: the number of URLs
+    :type max_workers: int
+    :param max_series: (optional) The maximum number of cached parsed
+        series. The cache is cleared when it is full. Default: 100000
+    :type max_series: int
+
+    :ivar invalid: The number of lines which could not be parsed.
+    :vartype invalid: int
+
+    Usage::
+
+        >>> from newrelic_telemetry_sdk import MetricBatch
+        >>> batch = MetricBatch()
+        >>> scraper = PrometheusScraper(batch, [])
+        >>> scraper.record(["# TYPE requests_total counter", 'requests_total{code="200"} 10'])
+        >>> scraper.record(["# TYPE requests_total counter", 'requests_total{code="200"} 25'])
+        >>> metric, = batch.flush()[0]
+        >>> metric["value"], metric["attributes"]
+        (15, {'code': '200'})
+    """
+
+    EVENT_CLS = threading.Event
+
+    def __init__(self, batch, urls, scrape_interval=15, *, timeout=5, max_workers=None, max_series=100000):
+        super().__init__(name="NewRelicPrometheusScraper")
+        self.daemon = True
+        self.batch = batch
+        self.scrape_interval = scrape_interval
+        self.timeout = timeout
+        self.max_workers = max_workers or max(len(urls), 1)
+        self.invalid = 0
+        self._urls = list(urls)
+        self._targets = {}
+        self._series = _SeriesCache(_parse_series, max_series)
+        self._lock = threading.Lock()
+        self._pool_manager = urllib3.PoolManager(
+            maxsize=self.max_workers, headers={"Accept": "text/plain;version=0.0.4"}, retries=urllib3.Retry(total=False)
+        )
+        self._shutdown = self.EVENT_CLS()
+
+    def _get_target(self, url):
+        with self._lock:
+            target = self._targets.get(url)
+            if target is None:
+                target = self._targets[url] = _Target(url)
+        return target
+
+    def record(self, lines, url=None):
+        """Record one scrape of an endpoint
+
+        The first scrape of a URL only records gauges. Later scrapes of the
+        same URL record the increase of counters and histograms since the
+        previous scrape. When ``lines`` raises an exception, such as when a
+        response is interrupted, the counters recorded so far are not
+        recorded again by the next scrape.
+
+        :param lines: The lines of the text exposition.
+        :type lines: iterable of str
+        :param url: (optional) The URL which was scraped.
+        :type url: str
+        """
+        scrape = _Scrape(self, self._get_target(url))
+        parse_line = scrape.parse_line
+        try:
+            for line in lines:
+                if line and line[0] != "#":
+                    parse_line(line)
+                elif line.startswith("# TYPE "):
+                    scrape.add_type(line)
+        except BaseException:
+            scrape.abort()
+            raise
+        scrape.finish()
+
+        if scrape.invalid:
+            with self._lock:
+                self.invalid += scrape.invalid
+
+    def _scrape_one(self, url):
+        response = self._pool_manager.request("GET", url, preload_content=False, timeout=self.timeout)
+        try:
+            if response.status != 200:  # noqa: PLR2004
+                _logger.error("Prometheus endpoint %s responded with status code: %r", url, response.status)
+                return
+            self.record(_lines(response), url)
+        finally:
+            response.release_conn()
+
+    def scrape(self):
+        """Scrape every endpoint once
+
+        Endpoints are fetched concurrently. A failed endpoint is logged and
+        does not prevent the other endpoints from being recorded.
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._scrape_one, url): url for url in self._urls}
+            for future in concurrent.futures.as_completed(futures):
+                exception = future.exception()
+                if exception is not None:
+                    _logger.error("Scraping Prometheus endpoint %s failed.", futures[future], exc_info=exception)
+
+    def run(self):
+        """Main loop of the scraper thread"""
+        self.scrape()
+        while not self._shutdown.wait(self.scrape_interval):
+            self.scrape()
+
+    def stop(self, timeout=None):
+        """Terminate the scraper
+
+        :param timeout: (optional) A timeout in seconds to wait for the thread
+            to shut down or None to block until the thread exits (default: None)
+        :type timeout: int or float
+        """
+        self._shutdown.set()
+        self.join(timeout=timeout)
+        self._pool_manager.clear()
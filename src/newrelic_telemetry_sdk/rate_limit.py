@@ -0,0 +1,245 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from newrelic_telemetry_sdk import fork
+from newrelic_telemetry_sdk.log import Log
+
+_MISSING = object()
+
+
+class TokenBucket:
+    """A token bucket rate limiter
+
+    Tokens are added to the bucket at a fixed rate up to its capacity. An
+    amount is allowed when there are enough tokens in the bucket, or when the
+    bucket is full so that amounts larger than the capacity can still pass.
+
+    This class is not thread safe.
+
+    :param rate: The number of tokens added per second.
+    :type rate: int or float
+    :param capacity: (optional) The maximum number of tokens held by the
+        bucket. Default: one second worth of tokens (at least 1).
+    :type capacity: int or float
+
+    Usage::
+
+        >>> bucket = TokenBucket(1, capacity=2)
+        >>> [bucket.consume(now=0) for _ in range(3)]
+        [True, True, False]
+        >>> bucket.consume(now=1)
+        True
+    """
+
+    __slots__ = ("_tokens", "_updated", "capacity", "rate")
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        if capacity is None:
+            capacity = max(rate, 1) if rate else 0
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = None
+
+    def consume(self, amount=1, now=None):
+        """Take tokens from the bucket
+
+        :param amount: (optional) The number of tokens to take. Default: 1
+        :type amount: int or float
+        :param now: (optional) The current time in seconds from a monotonic
+            clock. Defaults to time.monotonic()
+        :type now: float
+
+        :returns: True if the tokens were taken, False if the amount is over
+            the limit.
+        :rtype: bool
+        """
+        if now is None:
+            now = time.monotonic()
+
+        tokens = self._tokens
+        if self._updated is not None:
+            tokens = min(self.capacity, tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        if tokens >= amount or tokens >= self.capacity > 0:
+            self._tokens = tokens - amount
+            return True
+
+        self._tokens = tokens
+        return False
+
+    def refund(self, amount=1):
+        """Return tokens taken by :meth:`consume`
+
+        :param amount: (optional) The number of tokens to return. Default: 1
+        :type amount: int or float
+        """
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class LogRateLimiter:
+    """Applies token bucket limits to logs before they are batched
+
+    A log is suppressed when any of the configured limits is exceeded, and
+    then does not count against the other limits:
+
+    * ``logger_rate`` / ``logger_rates``: logs per second for each logger
+    * ``level_rates``: logs per second for each level, across all loggers
+    * ``bytes_per_second``: the size of all log messages per second
+
+    Message sizes are estimated from the length of the (unformatted) message
+    so the check stays cheap.
+
+    Suppressed logs are counted per logger and level. The counts are reported
+    as summary logs by :meth:`summaries`, which batches call when flushed.
+
+    :param logger_rate: (optional) The default rate applied to each logger.
+        Default: no limit
+    :type logger_rate: int or float
+    :param logger_rates: (optional) A mapping of logger name to rate,
+        overriding ``logger_rate`` for specific loggers. A rate of None
+        disables the limit for that logger.
+    :type logger_rates: dict
+    :param level_rates: (optional) A mapping of level name (such as
+        ``"DEBUG"``) to rate.
+    :type level_rates: dict
+    :param bytes_per_second: (optional) The global limit on message bytes
+        per second. Default: no limit
+    :type bytes_per_second: int or float
+
+    Usage::
+
+        >>> limiter = LogRateLimiter(level_rates={"DEBUG": 1})
+        >>> [limiter.allow("app", "DEBUG", 10) for _ in range(3)]
+        [True, False, False]
+        >>> limiter.allow("app", "INFO", 10)
+        True
+        >>> summary, = limiter.summaries()
+        >>> summary["attributes"]["suppressed.count"]
+        2
+    """
+
+    def __init__(self, logger_rate=None, logger_rates=None, level_rates=None, bytes_per_second=None):
+        self._lock = threading.Lock()
+        self._logger_rate = logger_rate
+        self._logger_rates = dict(logger_rates) if logger_rates else {}
+        self._logger_buckets = {}
+        self._level_buckets = {level: TokenBucket(rate) for level, rate in (level_rates or {}).items()}
+        self._bytes_bucket = None if bytes_per_second is None else TokenBucket(bytes_per_second)
+        self._suppressed = {}
+        fork.register(self)
+
+    def _after_fork(self):
+        # Suppressed records are reported by the parent process
+        self._lock = threading.Lock()
+        self._suppressed = {}
+
+    def _logger_bucket(self, logger_name):
+        bucket = self._logger_buckets.get(logger_name, _MISSING)
+        if bucket is _MISSING:
+            rate = self._logger_rates.get(logger_name, self._logger_rate)
+            bucket = self._logger_buckets[logger_name] = None if rate is None else TokenBucket(rate)
+        return bucket
+
+    def allow(self, logger_name, level, size=0):
+        """Check a log against the limits
+
+        :param logger_name: The name of the logger that emitted the log.
+        :type logger_name: str
+        :param level: The level name of the log.
+        :type level: str
+        :param size: (optional) The estimated size of the log in bytes.
+        :type size: int
+
+        :returns: True if the log should be recorded.
+        :rtype: bool
+        """
+        now = time.monotonic()
+        with self._lock:
+            limits = (
+                (self._logger_bucket(logger_name), 1),
+                (self._level_buckets.get(level), 1),
+                (self._bytes_bucket, size),
+            )
+            consumed = []
+            for bucket, amount in limits:
+                if bucket is None:
+                    continue
+                if not bucket.consume(amount, now):
+                    break
+                consumed.append((bucket, amount))
+            else:
+                return True
+
+            # A suppressed log does not use up the budget of the other limits
+            for bucket, amount in consumed:
+                bucket.refund(amount)
+            key = (logger_name, level)
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+
+        return False
+
+    def allow_log(self, log):
+        """Check a :class:`Log <newrelic_telemetry_sdk.log.Log>` against the limits
+
+        :param log: The log to check.
+        :type log: Log
+
+        :rtype: bool
+        """
+        attributes = log.get("attributes") or {}
+        message = log.get("message")
+        size = len(message) if isinstance(message, str) else 0
+        return self.allow(attributes.get("logger.name"), attributes.get("log.level"), size)
+
+    def allow_record(self, record):
+        """Check a :class:`logging.LogRecord` against the limits
+
+        :param record: The record to check.
+        :type record: logging.LogRecord
+
+        :rtype: bool
+        """
+        msg = record.msg
+        size = len(msg) if isinstance(msg, str) else 0
+        return self.allow(record.name, record.levelname, size)
+
+    def summaries(self):
+        """Report and reset the counts of suppressed logs
+
+        :returns: A list of logs, one for each logger and level that had logs
+            suppressed since the last call.
+        :rtype: list
+        """
+        with self._lock:
+            suppressed = self._suppressed
+            self._suppressed = {}
+
+        return [
+            Log(
+                f"{count} log records from logger {logger_name!r} at level {level} were suppressed by rate limits",
+                **{
+                    "log.level": "WARNING",
+                    "logger.name": __name__,
+                    "suppressed.logger.name": logger_name,
+                    "suppressed.log.level": level,
+                    "suppressed.count": count,
+                },
+            )
+            for (logger_name, level), count in suppressed.items()
+        ]
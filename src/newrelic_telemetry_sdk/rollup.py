@@ -0,0 +1,115 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+from newrelic_telemetry_sdk.metric_batch import _SeriesCache
+
+
+class EventRollup:
+    """Rolls up events of one type into metrics
+
+    Each event updates metrics in a :class:`MetricBatch
+    <newrelic_telemetry_sdk.metric_batch.MetricBatch>`, tagged with the
+    values of the selected ``attributes``:
+
+    * ``<name>.count``: a count of events
+    * ``<name>.<value>``: a summary of each numeric attribute in ``values``
+
+    A random subset of the events, chosen with probability ``sample_rate``,
+    is kept with a ``sampleRate`` attribute holding the probability. The
+    remaining events are dropped once they are counted.
+
+    Metric identities are cached per combination of tag values. At most
+    ``max_series`` combinations are cached.
+
+    Pass instances as the ``rollups`` argument of an :class:`EventBatch
+    <newrelic_telemetry_sdk.batch.EventBatch>`.
+
+    :param batch: The batch where metrics are recorded.
+    :type batch: MetricBatch
+    :param event_type: The type of event to roll up.
+    :type event_type: str
+    :param attributes: (optional) The event attributes added as metric tags.
+    :type attributes: tuple
+    :param values: (optional) The numeric event attributes summarized.
+    :type values: tuple
+    :param sample_rate: (optional) The probability of keeping an event.
+        Default: 0.0
+    :type sample_rate: float
+    :param name: (optional) The prefix of the metric names. Defaults to the
+        event type.
+    :type name: str
+    :param max_series: (optional) The maximum number of cached identities.
+        Default: 10000
+    :type max_series: int
+
+    Usage::
+
+        >>> from newrelic_telemetry_sdk import Event, MetricBatch
+        >>> metric_batch = MetricBatch()
+        >>> rollup = EventRollup(metric_batch, "PageView", attributes=("page",), values=("duration",))
+        >>> rollup.record(Event("PageView", {"page": "/", "duration": 0.5})) is None
+        True
+        >>> sorted(metric["name"] for metric in metric_batch.flush()[0])
+        ['PageView.count', 'PageView.duration']
+    """
+
+    def __init__(self, batch, event_type, attributes=(), values=(), *, sample_rate=0.0, name=None, max_series=10000):
+        if not 0 <= sample_rate <= 1:
+            msg = f"Invalid sample rate: {sample_rate!r}"
+            raise ValueError(msg)
+        self.batch = batch
+        self.event_type = event_type
+        self.attributes = tuple(attributes)
+        self.values = tuple(values)
+        self.sample_rate = sample_rate
+        self.name = name or event_type
+        self._identities = _SeriesCache(self._create_identities, max_series)
+
+    def _create_identities(self, key):
+        tags = {attribute: value for attribute, value in zip(self.attributes, key) if value is not None}
+        tags = tags or None
+        create_identity = self.batch.create_identity
+        name = self.name
+        return (
+            create_identity(f"{name}.count", tags, "count"),
+            tuple(create_identity(f"{name}.{value}", tags, "summary") for value in self.values),
+        )
+
+    def record(self, event):
+        """Roll up an event
+
+        :param event: The event to roll up.
+        :type event: Event or CompactEvent
+
+        :returns: The event to keep, with a ``sampleRate`` attribute, or None
+            if the event is dropped.
+        """
+        fields = event if isinstance(event, dict) else event.to_dict()
+        key = tuple(fields.get(attribute) for attribute in self.attributes)
+        count_identity, value_identities = self._identities.get(key, ())
+        batch = self.batch
+        batch._merge_count(count_identity, 1)
+        for attribute, identity in zip(self.values, value_identities):
+            value = fields.get(attribute)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                batch._merge_summary(identity, value)
+
+        if self.sample_rate and random.random() < self.sample_rate:  # noqa: S311
+            kept = dict(fields)
+            kept["sampleRate"] = self.sample_rate
+            return kept
+
+        return None
@@ -0,0 +1,253 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+import zlib
+
+from newrelic_telemetry_sdk import fork
+from newrelic_telemetry_sdk.compact import CompactSpan
+from newrelic_telemetry_sdk.span import NOOP_SPAN, Span
+
+_ID_SPACE = 1 << 64
+_HASH_SPACE = 1 << 32
+
+
+def _trace_id_value(trace_id):
+    """Map a trace ID to an integer in [0, 2 ** 64)"""
+    if isinstance(trace_id, int):
+        return trace_id % _ID_SPACE
+    try:
+        return int(trace_id[-16:], 16)
+    except ValueError:
+        return zlib.crc32(trace_id.encode("utf-8")) << 32
+
+
+def _span_ids(span):
+    if isinstance(span, CompactSpan):
+        return span.trace_id, span.guid
+    return span["trace.id"], span["id"]
+
+
+class HeadSampler:
+    """Decides whether to sample a trace when its spans are created
+
+    The decision is a deterministic function of the ``trace.id`` so every
+    span in a trace, including spans created by other processes using the
+    same rate, gets the same decision. Unsampled spans are the shared
+    :data:`NOOP_SPAN <newrelic_telemetry_sdk.span.NOOP_SPAN>` object, which
+    allocates nothing and is discarded by span batches.
+
+    Sampled spans carry a ``sampleRate`` attribute holding the sampling
+    probability when it is less than 1, so counts can be re-weighted by
+    dividing by the rate.
+
+    :param rate: The probability of sampling a trace, between 0 and 1.
+    :type rate: float
+    :param span_cls: (optional) The class used to create sampled spans.
+        Default: :class:`Span <newrelic_telemetry_sdk.span.Span>`
+    :type span_cls: type
+
+    Usage::
+
+        >>> sampler = HeadSampler(0.5)
+        >>> root = sampler.span("root", trace_id="0" * 16)
+        >>> root["attributes"]["sampleRate"]
+        0.5
+        >>> child = sampler.span("child", parent=root)
+        >>> child["trace.id"] == root["trace.id"]
+        True
+        >>> sampler.span("root", trace_id="f" * 16)
+        NOOP_SPAN
+    """
+
+    def __init__(self, rate, span_cls=Span):
+        if not 0 <= rate <= 1:
+            msg = f"Invalid sample rate: {rate!r}"
+            raise ValueError(msg)
+        self.rate = rate
+        self.span_cls = span_cls
+        self._threshold = int(rate * _ID_SPACE)
+
+    def is_sampled(self, trace_id):
+        """Return the sampling decision for a trace
+
+        :param trace_id: The trace ID.
+        :type trace_id: str or int
+
+        :rtype: bool
+        """
+        return _trace_id_value(trace_id) < self._threshold
+
+    def span(self, name, tags=None, parent=None, trace_id=None, parent_id=None, **kwargs):
+        """Create a span if its trace is sampled
+
+        :param name: The name of the span.
+        :type name: str
+        :param tags: (optional) A set of tags that can be used to filter this
+            span in the New Relic UI.
+        :type tags: dict
+        :param parent: (optional) The parent span. The new span inherits its
+            trace and its sampling decision.
+        :type parent: Span or CompactSpan or NoOpSpan
+        :param trace_id: (optional) The trace ID, used when no parent is
+            given. A new trace ID is generated when omitted.
+        :type trace_id: str
+        :param parent_id: (optional) The guid of the span that called this
+            span, used when no parent is given.
+        :type parent_id: str
+        :param \\**kwargs: Additional arguments passed to the span class.
+
+        :returns: A span, or :data:`NOOP_SPAN` if the trace is not sampled.
+        """
+        if parent is not None:
+            if parent is NOOP_SPAN:
+                return NOOP_SPAN
+            trace_id, parent_id = _span_ids(parent)
+        elif trace_id is None:
+            value = random.getrandbits(64)
+            if value >= self._threshold:
+                return NOOP_SPAN
+            trace_id = f"{value:016x}"
+        elif not self.is_sampled(trace_id):
+            return NOOP_SPAN
+
+        if self.rate < 1:
+            tags = dict(tags, sampleRate=self.rate) if tags else {"sampleRate": self.rate}
+
+        return self.span_cls(name, tags, trace_id=trace_id, parent_id=parent_id, **kwargs)
+
+
+class EventSampler:
+    """Samples events by the hash of an attribute
+
+    Each event type has a sampling rate. An event is kept when the hash of
+    its ``key`` attribute falls below the rate, so all events sharing a key
+    value are kept or dropped together. As a lower rate keeps a subset of the
+    values kept by a higher rate, the decisions stay consistent while the
+    rate changes. Events without the key attribute are sampled at random.
+
+    Kept events sampled at a rate below 1 are copied with a ``sampleRate``
+    attribute holding the rate, so counts can be re-weighted by dividing by
+    the rate.
+
+    When a ``budget`` is set, the rate of each event type is adjusted on
+    every harvest, by :meth:`adjust`, so that the number of events kept per
+    harvest stays close to the budget. The rate never exceeds ``rate``.
+
+    :param key: (optional) The attribute hashed for event types not listed
+        in ``keys``. Default: None (sample at random)
+    :type key: str
+    :param keys: (optional) A mapping of event type to the attribute hashed
+        for that type.
+    :type keys: dict
+    :param rate: (optional) The sampling rate, or the maximum sampling rate
+        when a budget is set. Default: 1.0
+    :type rate: float
+    :param budget: (optional) The number of events of each type to keep per
+        harvest. Default: None (fixed rate)
+    :type budget: int
+
+    Usage::
+
+        >>> from newrelic_telemetry_sdk import Event
+        >>> sampler = EventSampler(key="session.id", rate=0.5)
+        >>> kept = [sampler.sample(Event("PageView", {"session.id": i})) for i in range(100)]
+        >>> {event["sampleRate"] for event in kept if event is not None}
+        {0.5}
+    """
+
+    def __init__(self, key=None, keys=None, rate=1.0, budget=None):
+        if not 0 <= rate <= 1:
+            msg = f"Invalid sample rate: {rate!r}"
+            raise ValueError(msg)
+        self.key = key
+        self.keys = dict(keys) if keys else {}
+        self.rate = rate
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._rates = {}
+        self._seen = {}
+        fork.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def rate_for(self, event_type):
+        """Return the current sampling rate of an event type
+
+        :param event_type: The event type.
+        :type event_type: str
+
+        :rtype: float
+        """
+        return self._rates.get(event_type, self.rate)
+
+    @staticmethod
+    def _hash(value):
+        if not isinstance(value, bytes):
+            value = str(value).encode("utf-8")
+        # CRC32 is linear, so similar values have related checksums; the
+        # MurmurHash3 finalizer mixes them into a uniform position
+        h = zlib.crc32(value)
+        h ^= h >> 16
+        h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+        h ^= h >> 13
+        h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+        h ^= h >> 16
+        return h / _HASH_SPACE
+
+    def sample(self, event):
+        """Make the sampling decision for an event
+
+        :param event: The event to sample.
+        :type event: Event or CompactEvent
+
+        :returns: The event to keep, or None if the event is dropped.
+        """
+        fields = event if isinstance(event, dict) else event.to_dict()
+        event_type = fields["eventType"]
+
+        if self.budget is not None:
+            with self._lock:
+                self._seen[event_type] = self._seen.get(event_type, 0) + 1
+
+        rate = self._rates.get(event_type, self.rate)
+        if rate >= 1:
+            return event
+
+        value = fields.get(self.keys.get(event_type, self.key))
+        position = random.random() if value is None else self._hash(value)  # noqa: S311
+        if position >= rate:
+            return None
+
+        kept = dict(fields)
+        kept["sampleRate"] = rate
+        return kept
+
+    def adjust(self):
+        """Adjust the sampling rates to the budget
+
+        Event batches call this method when they are flushed. Each rate is
+        set so that the number of events seen since the last call, sampled
+        at the new rate, matches the budget.
+        """
+        if self.budget is None:
+            return
+
+        with self._lock:
+            seen = self._seen
+            self._seen = {}
+
+        self._rates = {event_type: min(self.rate, self.budget / count) for event_type, count in seen.items()}
@@ -0,0 +1,313 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import multiprocessing
+import operator
+import os
+import struct
+import time
+import zlib
+from multiprocessing import shared_memory
+
+from newrelic_telemetry_sdk.metric_batch import MetricBatch
+
+_MISSING = object()
+_EMPTY = 0
+_CLAIMED = 1
+
+# leader pid, interval start in milliseconds
+_HEADER = struct.Struct("<qq")
+# state, key length
+_SLOT_HEADER = struct.Struct("<BxH4x")
+# count, sum, min, max, gauge timestamp in milliseconds
+_SLOT_VALUES = struct.Struct("<qdddq")
+_SLOT_VALUES_OFFSET = _SLOT_HEADER.size
+_SLOT_KEY_OFFSET = _SLOT_VALUES_OFFSET + _SLOT_VALUES.size
+_RESET_VALUES = (0, 0.0, 0.0, 0.0, 0)
+_SUMMARY = "summary"
+_COUNT = "count"
+
+
+def _is_running(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _integral(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class SharedMemoryMetricBatch(MetricBatch):
+    """A metric batch shared by processes forked from the creating process
+
+    Series are aggregated in a :mod:`multiprocessing.shared_memory` region
+    holding a fixed number of slots, so every worker process records into the
+    same series. Each slot is protected by one of a set of striped
+    :func:`multiprocessing.Lock` locks. Worker processes look up the slot of
+    each series once and cache it, so recording costs one lock acquisition.
+
+    Only the elected leader process returns the shared series from
+    :meth:`flush`. The first process to flush becomes the leader and stays
+    the leader until it exits, when the next process to flush takes over.
+    Every process may therefore run a :class:`Harvester
+    <newrelic_telemetry_sdk.harvester.Harvester>` for the batch, and only one
+    of them sends the merged series.
+
+    Series which cannot be stored in the shared region are recorded in a
+    process local batch and returned by :meth:`flush` in the process which
+    recorded them. These are series recorded after all slots are claimed,
+    series whose name and tags encode to more than ``max_key_size`` bytes of
+    JSON and series with tags which cannot be encoded as JSON.
+
+    The batch must be created before the worker processes are forked. Call
+    :meth:`close` in the creating process once it is no longer used.
+
+    :param tags: (optional) A dictionary of tags to attach to all flushes.
+    :type tags: dict
+    :param capacity: (optional) The number of series slots in the shared
+        region. Default: 4096
+    :type capacity: int
+    :param max_key_size: (optional) The maximum size in bytes of the encoded
+        name and tags of a shared series. Default: 256
+    :type max_key_size: int
+    :param stripes: (optional) The number of locks protecting the slots.
+        Default: 64
+    :type stripes: int
+
+    Usage::
+
+        >>> batch = SharedMemoryMetricBatch(capacity=16)
+        >>> batch.record_count("jobs", 1)
+        >>> batch.record_count("jobs", 2)
+        >>> batch.record_summary("duration", 3.5)
+        >>> items, _ = batch.flush()
+        >>> sorted((item["name"], item["value"]) for item in items)[1]
+        ('jobs', 3)
+        >>> batch.close()
+    """
+
+    def __init__(self, tags=None, *, capacity=4096, max_key_size=256, stripes=64):
+        super().__init__(tags)
+        self.capacity = capacity
+        self.max_key_size = max_key_size
+        self._slot_size = -(-(_SLOT_KEY_OFFSET + max_key_size) // 8) * 8
+        self._memory = shared_memory.SharedMemory(create=True, size=_HEADER.size + capacity * self._slot_size)
+        self._buf = self._memory.buf
+        self._owner = os.getpid()
+        self._claim_lock = multiprocessing.Lock()
+        self._stripes = [multiprocessing.Lock() for _ in range(stripes)]
+        self._slots = {}
+        self._identities = {}
+        _HEADER.pack_into(self._buf, 0, 0, self._interval_start)
+
+    def _after_fork(self):
+        # Shared series belong to every process; only local series are
+        # cleared. Slots are looked up again under the local lock, so that
+        # recording a shared series also restarts the harvester of the batch.
+        super()._after_fork()
+        self._slots = {}
+
+    def _offset(self, index):
+        return _HEADER.size + index * self._slot_size
+
+    def _encode_key(self, identity):
+        typ, name, tags = identity
+        tags = sorted(tags, key=operator.itemgetter(0)) if tags else None
+        try:
+            key = json.dumps([typ, name, tags], separators=(",", ":")).encode()
+        except (TypeError, ValueError):
+            return None
+        if len(key) > self.max_key_size:
+            return None
+        return key
+
+    def _claim(self, identity):
+        key = self._encode_key(identity)
+        if key is None:
+            return None
+
+        buf = self._buf
+        capacity = self.capacity
+        start = zlib.crc32(key) % capacity
+        with self._claim_lock:
+            for probe in range(capacity):
+                index = (start + probe) % capacity
+                offset = self._offset(index)
+                state, length = _SLOT_HEADER.unpack_from(buf, offset)
+                key_offset = offset + _SLOT_KEY_OFFSET
+                if state == _EMPTY:
+                    buf[key_offset : key_offset + len(key)] = key
+                    _SLOT_VALUES.pack_into(buf, offset + _SLOT_VALUES_OFFSET, *_RESET_VALUES)
+                    _SLOT_HEADER.pack_into(buf, offset, _CLAIMED, len(key))
+                    return index
+                if length == len(key) and buf[key_offset : key_offset + length] == key:
+                    return index
+        return None
+
+    def _slot(self, identity):
+        index = self._slots.get(identity, _MISSING)
+        if index is _MISSING:
+            index = self._claim(identity)
+            with self._lock:
+                self._slots[identity] = index
+        return index
+
+    def _merge_gauge(self, identity, value):
+        index = self._slot(identity)
+        if index is None:
+            super()._merge_gauge(identity, value)
+            return
+
+        values = (1, value, value, value, int(time.time() * 1000.0))
+        with self._stripes[index % len(self._stripes)]:
+            _SLOT_VALUES.pack_into(self._buf, self._offset(index) + _SLOT_VALUES_OFFSET, *values)
+
+    def _merge_count(self, identity, value):
+        index = self._slot(identity)
+        if index is None:
+            super()._merge_count(identity, value)
+            return
+
+        buf = self._buf
+        offset = self._offset(index) + _SLOT_VALUES_OFFSET
+        with self._stripes[index % len(self._stripes)]:
+            count, total, _, _, _ = _SLOT_VALUES.unpack_from(buf, offset)
+            _SLOT_VALUES.pack_into(buf, offset, count + 1, total + value, 0.0, 0.0, 0)
+
+    def _merge_summary(self, identity, value):
+        index = self._slot(identity)
+        if index is None:
+            super()._merge_summary(identity, value)
+            return
+
+        buf = self._buf
+        offset = self._offset(index) + _SLOT_VALUES_OFFSET
+        with self._stripes[index % len(self._stripes)]:
+            count, total, minimum, maximum, _ = _SLOT_VALUES.unpack_from(buf, offset)
+            if count:
+                minimum = min(minimum, value)
+                maximum = max(maximum, value)
+            else:
+                minimum = maximum = value
+            _SLOT_VALUES.pack_into(buf, offset, count + 1, total + value, minimum, maximum, 0)
+
+    def is_leader(self):
+        """Return whether this process flushes the shared series
+
+        This process becomes the leader when there is no leader or the
+        leader process has exited.
+
+        :rtype: bool
+        """
+        pid = os.getpid()
+        with self._claim_lock:
+            leader, interval_start = _HEADER.unpack_from(self._buf, 0)
+            if leader != pid and not _is_running(leader):
+                leader = pid
+                _HEADER.pack_into(self._buf, 0, leader, interval_start)
+        return leader == pid
+
+    def _identity(self, index, offset, length):
+        identity = self._identities.get(index)
+        if identity is None:
+            key_offset = offset + _SLOT_KEY_OFFSET
+            typ, name, tags = json.loads(bytes(self._buf[key_offset : key_offset + length]))
+            identity = self._identities[index] = (typ, name, dict(tags) if tags else None)
+        return identity
+
+    def _drain(self, index, offset):
+        stripe = self._stripes[index % len(self._stripes)]
+        values_offset = offset + _SLOT_VALUES_OFFSET
+        with stripe:
+            values = _SLOT_VALUES.unpack_from(self._buf, values_offset)
+            if values[0]:
+                _SLOT_VALUES.pack_into(self._buf, values_offset, *_RESET_VALUES)
+        return values
+
+    def _flush_shared(self):
+        buf = self._buf
+        items = []
+        for index in range(self.capacity):
+            offset = self._offset(index)
+            state, length = _SLOT_HEADER.unpack_from(buf, offset)
+            if state != _CLAIMED:
+                continue
+
+            count, total, minimum, maximum, timestamp = self._drain(index, offset)
+            if not count:
+                continue
+
+            typ, name, tags = self._identity(index, offset, length)
+            metric = {"name": name}
+            if typ == _SUMMARY:
+                metric["type"] = typ
+                value = {"count": count, "sum": total, "min": minimum, "max": maximum}
+            elif typ == _COUNT:
+                metric["type"] = typ
+                value = _integral(total)
+            else:
+                metric["timestamp"] = timestamp
+                value = total
+
+            if tags:
+                metric["attributes"] = tags
+
+            metric["value"] = value
+            items.append(metric)
+        return items
+
+    def flush(self):
+        """Flush all metrics from the batch
+
+        In the leader process, this method returns the shared series and
+        any series recorded locally by this process. In other processes, it
+        only returns the locally recorded series.
+
+        :returns: A tuple of (metrics, common)
+        :rtype: tuple
+        """
+        items, common = super().flush()
+        if not self.is_leader():
+            return items, common
+
+        items = items + tuple(self._flush_shared())
+
+        now = int(time.time() * 1000.0)
+        with self._claim_lock:
+            leader, interval_start = _HEADER.unpack_from(self._buf, 0)
+            _HEADER.pack_into(self._buf, 0, leader, now)
+        common["timestamp"] = interval_start
+        common["interval.ms"] = now - interval_start
+        return items, common
+
+    def close(self):
+        """Detach from the shared region
+
+        In the process which created the batch, the shared region is also
+        destroyed.
+        """
+        self._buf = None
+        self._memory.close()
+        if os.getpid() == self._owner:
+            self._memory.unlink()
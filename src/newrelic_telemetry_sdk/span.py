@@ -16,6 +16,10 @@ import random
 import time
 
 
+def _is_error(attributes):
+    return bool(attributes.get("error")) or "error.class" in attributes or "error.message" in attributes
+
+
 class Span(dict):
     """A span represented in the New Relic Distributed Tracing UI
 
@@ -82,3 +86,75 @@ class Span(dict):
 
     def __exit__(self, exc, value, tb):
         self.finish()
+
+
+class NoOpSpan:
+    """A span which is never recorded
+
+    A single shared instance, :data:`NOOP_SPAN`, is returned for spans which
+    are not sampled. It supports the same methods as :class:`Span`, all of
+    which do nothing, and span batches discard it when it is recorded.
+
+    Like a span, it can be used as a mapping with no keys. Keys read as
+    None, except ``attributes`` which reads as a new empty dict, so
+    attributes set on it are discarded. Keys set on it are discarded too.
+
+    Usage::
+
+        >>> NOOP_SPAN["attributes"]["user.id"] = 1
+        >>> NOOP_SPAN["attributes"], NOOP_SPAN["id"]
+        ({}, None)
+    """
+
+    __slots__ = ()
+
+    def finish(self, finish_time_ms=None):
+        """Do nothing"""
+
+    def __getitem__(self, key):
+        if key == "attributes":
+            return {}
+        return None
+
+    def get(self, key, default=None):
+        """Return an empty dict for ``attributes`` and the default otherwise"""
+        if key == "attributes":
+            return {}
+        return default
+
+    def __setitem__(self, key, value):
+        pass
+
+    def __contains__(self, key):
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def keys(self):
+        """Return no keys"""
+        return ()
+
+    def items(self):
+        """Return no items"""
+        return ()
+
+    def values(self):
+        """Return no values"""
+        return ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, tb):
+        pass
+
+    def __repr__(self):
+        return "NOOP_SPAN"
+
+
+#: The shared span returned for traces which are not sampled
+NOOP_SPAN = NoOpSpan()
@@ -0,0 +1,107 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import operator
+
+from newrelic_telemetry_sdk.metric_batch import _SeriesCache
+from newrelic_telemetry_sdk.span import _is_error
+
+
+def _name_key(attributes):
+    return (attributes["name"],)
+
+
+class SpanMetrics:
+    """Derives rate, error and duration metrics from spans
+
+    Each recorded span updates three metrics in a :class:`MetricBatch
+    <newrelic_telemetry_sdk.metric_batch.MetricBatch>`, tagged with the span
+    name and the values of the selected ``attributes``:
+
+    * ``<prefix>.count``: a count of spans
+    * ``<prefix>.errors``: a count of spans with an error
+    * ``<prefix>.duration``: a summary of span durations in milliseconds
+
+    A span has an error when it has an ``error`` attribute set to a true
+    value, or an ``error.class`` or ``error.message`` attribute.
+
+    Metric identities are cached per combination of tag values so recording
+    a span only merges values into the batch. At most ``max_series``
+    combinations are cached.
+
+    Pass an instance as the ``metrics`` argument of a span batch to record
+    every span merged into the batch, before any sampling by the batch.
+
+    :param batch: The batch where metrics are recorded.
+    :type batch: MetricBatch
+    :param attributes: (optional) The span attributes added as metric tags.
+    :type attributes: tuple
+    :param prefix: (optional) The prefix of the metric names.
+        Default: ``"span"``
+    :type prefix: str
+    :param max_series: (optional) The maximum number of cached identities.
+        Default: 10000
+    :type max_series: int
+
+    Usage::
+
+        >>> from newrelic_telemetry_sdk import MetricBatch, Span
+        >>> metric_batch = MetricBatch()
+        >>> span_metrics = SpanMetrics(metric_batch, attributes=("db",))
+        >>> span_metrics.record(Span("query", {"db": "users"}, duration_ms=5))
+        >>> sorted(metric["name"] for metric in metric_batch.flush()[0])
+        ['span.count', 'span.duration']
+    """
+
+    def __init__(self, batch, attributes=(), prefix="span", max_series=10000):
+        self.batch = batch
+        self.attributes = tuple(attributes)
+        self.prefix = prefix
+        self._keys = ("name", *self.attributes)
+        # itemgetter only returns a tuple when it gets several keys
+        self._get_key = operator.itemgetter(*self._keys) if self.attributes else _name_key
+        self._identities = _SeriesCache(self._create_identities, max_series)
+
+    def _create_identities(self, key):
+        name, *values = key
+        tags = {"span.name": name}
+        tags.update((attribute, value) for attribute, value in zip(self.attributes, values) if value is not None)
+        create_identity = self.batch.create_identity
+        prefix = self.prefix
+        return (
+            create_identity(f"{prefix}.count", tags, "count"),
+            create_identity(f"{prefix}.errors", tags, "count"),
+            create_identity(f"{prefix}.duration", tags, "summary"),
+        )
+
+    def record(self, span):
+        """Update the metrics from a finished span
+
+        :param span: The span to record.
+        :type span: Span or CompactSpan
+        """
+        attributes = (span if isinstance(span, dict) else span.to_dict())["attributes"]
+        try:
+            key = self._get_key(attributes)
+        except KeyError:
+            # Missing attributes are not tagged
+            key = tuple(map(attributes.get, self._keys))
+        count_identity, error_identity, duration_identity = self._identities.get(key, key[:1])
+        batch = self.batch
+        batch._merge_count(count_identity, 1)
+        if _is_error(attributes):
+            batch._merge_count(error_identity, 1)
+        duration = attributes.get("duration.ms")
+        if duration is not None:
+            batch._merge_summary(duration_identity, duration)
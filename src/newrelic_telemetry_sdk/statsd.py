@@ -0,0 +1,364 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Receives StatsD and DogStatsD metrics over UDP
+
+Lines have the format ``<name>:<value>|<type>[|@<sample rate>][|#<tags>]``,
+where tags are comma separated ``key:value`` pairs. Several lines may be
+sent in one datagram, separated by newlines, and several values may be sent
+in one line, separated by colons.
+
+=============  ============================================================
+StatsD type    Recorded as
+=============  ============================================================
+``c``          A count metric, divided by the sample rate
+``g``          A gauge metric. Values with a sign change the last value.
+``ms``         A summary metric
+``h``, ``d``   A summary metric
+``s``          A gauge metric counting the unique members of the set
+=============  ============================================================
+
+DogStatsD events and service checks are ignored. Tags without a value are
+recorded as attributes with an empty string value.
+
+Run a listener sending metrics to New Relic, as a replacement for a StatsD
+relay, with::
+
+    NEW_RELIC_LICENSE_KEY=... python -m newrelic_telemetry_sdk.statsd
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import selectors
+import signal
+import socket
+import threading
+
+from newrelic_telemetry_sdk.client import MetricClient
+from newrelic_telemetry_sdk.harvester import Harvester
+from newrelic_telemetry_sdk.metric_batch import MetricBatch, _SeriesCache
+
+_logger = logging.getLogger(__name__)
+
+_COUNT = "c"
+_GAUGE = "g"
+_SET = "s"
+_SUMMARY_TYPES = frozenset(("ms", "h", "d"))
+_POLL_INTERVAL = 0.2
+
+
+def _number(text):
+    if "." in text or "e" in text or "E" in text or "n" in text:
+        return float(text)
+    return int(text)
+
+
+class StatsdParser:
+    """Parses StatsD lines and records them into a metric batch
+
+    The identity of each combination of name, type and tags is cached, so
+    repeated series are recorded without parsing their tags again. The last
+    value of each gauge is kept apart from the cache, so relative gauge
+    values apply to it even after the cache is cleared. At most
+    ``max_series`` gauge values are kept: the gauge updated least recently
+    is forgotten first.
+
+    A parser may be shared by several threads.
+
+    :param batch: The batch where metrics are recorded.
+    :type batch: MetricBatch
+    :param max_series: (optional) The maximum number of cached series and
+        of gauge values kept. The cache is cleared when it is full.
+        Default: 10000
+    :type max_series: int
+
+    :ivar invalid: The number of lines which could not be parsed.
+    :vartype invalid: int
+
+    Usage::
+
+        >>> batch = MetricBatch()
+        >>> parser = StatsdParser(batch)
+        >>> parser.parse(b"requests:1|c|#status:200\\nrequests:3|c|@0.5|#status:200")
+        >>> metric, = batch.flush()[0]
+        >>> metric["value"], metric["attributes"]
+        (7.0, {'status': '200'})
+    """
+
+    def __init__(self, batch, max_series=10000):
+        self.batch = batch
+        self.invalid = 0
+        self._max_gauges = max_series
+        self._series = _SeriesCache(self._create_series, max_series)
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def _create_series(self, key):
+        name, typ, tags_text = key
+        tags = None
+        if tags_text:
+            tags = {}
+            for tag in tags_text.split(","):
+                key, _, value = tag.partition(":")
+                tags[key] = value
+
+        if typ == _COUNT:
+            identity = self.batch.create_identity(name, tags, "count")
+        elif typ in _SUMMARY_TYPES:
+            identity = self.batch.create_identity(name, tags, "summary")
+        elif typ in (_GAUGE, _SET):
+            identity = self.batch.create_identity(name, tags)
+        else:
+            msg = f"Invalid metric type: {typ!r}"
+            raise ValueError(msg)
+        return typ, identity, name, tags
+
+    def _record_line(self, line):
+        if line.startswith(("_e{", "_sc|")):
+            return
+
+        name, _, rest = line.partition(":")
+        values, _, rest = rest.partition("|")
+        typ, _, extensions = rest.partition("|")
+        if not name or not values:
+            msg = f"Invalid line: {line!r}"
+            raise ValueError(msg)
+
+        rate = 1.0
+        tags_text = ""
+        if extensions:
+            for extension in extensions.split("|"):
+                if extension[:1] == "@":
+                    rate = float(extension[1:])
+                elif extension[:1] == "#":
+                    tags_text = extension[1:]
+
+        self._record_values(self._series.get((name, typ, tags_text)), values, rate)
+
+    def _record_values(self, entry, values, rate):
+        typ, identity, name, tags = entry
+        batch = self.batch
+        for value in values.split(":"):
+            if typ == _COUNT:
+                number = _number(value)
+                batch._merge_count(identity, number if rate == 1.0 else number / rate)
+            elif typ == _GAUGE:
+                number = _number(value)
+                with self._lock:
+                    gauges = self._gauges
+                    # Gauges are kept in the order they were last updated
+                    last = gauges.pop(identity, 0)
+                    if value[0] in "+-":
+                        number += last
+                    if len(gauges) >= self._max_gauges:
+                        del gauges[next(iter(gauges))]
+                    gauges[identity] = number
+                    batch._merge_gauge(identity, number)
+            elif typ == _SET:
+                batch.record_set(name, value, tags)
+            elif rate == 1.0:
+                batch._merge_summary(identity, _number(value))
+            else:
+                number = _number(value)
+                count = max(1, round(1 / rate))
+                summary = {"count": count, "sum": number * count, "min": number, "max": number}
+                batch._merge_summary_values(identity, summary)
+
+    def _parse_line(self, line):
+        try:
+            self._record_line(line)
+        except (ValueError, ZeroDivisionError):
+            with self._lock:
+                self.invalid += 1
+
+    def parse(self, data):
+        """Parse newline separated lines and record them into the batch
+
+        :param data: One or more datagrams joined by newlines.
+        :type data: bytes
+        """
+        parse_line = self._parse_line
+        for line in data.decode("utf-8", "replace").split("\n"):
+            if line:
+                parse_line(line.rstrip("\r"))
+
+
+class StatsdListener:
+    """Receives StatsD datagrams on UDP sockets and records them into a batch
+
+    Each socket is served by its own thread. When a socket becomes readable,
+    all waiting datagrams, up to ``max_datagrams``, are received without
+    blocking and parsed together. This keeps the kernel receive buffer
+    drained under load. Use several sockets to spread the load across more
+    receive buffers: they are bound to the same address with
+    ``SO_REUSEPORT`` and the kernel distributes senders between them.
+
+    Parsing runs with the GIL held, so additional sockets add buffering
+    rather than parallel parsing.
+
+    :param batch: The batch where metrics are recorded.
+    :type batch: MetricBatch
+    :param host: (optional) The address to listen on. Default: 127.0.0.1
+    :type host: str
+    :param port: (optional) The port to listen on. Use 0 to pick a free
+        port. Default: 8125
+    :type port: int
+    :param sockets: (optional) The number of sockets bound to the address.
+        More than one requires ``SO_REUSEPORT``. Default: 1
+    :type sockets: int
+    :param receive_buffer_size: (optional) The ``SO_RCVBUF`` size requested
+        for each socket, in bytes. Default: the system default
+    :type receive_buffer_size: int
+    :param max_datagrams: (optional) The maximum number of datagrams received
+        and parsed together. Default: 256
+    :type max_datagrams: int
+
+    :raises ValueError: if several sockets are requested on a platform
+        without ``SO_REUSEPORT``
+
+    :ivar address: The address the sockets are bound to.
+    :vartype address: tuple
+    :ivar parser: The parser recording metrics into the batch.
+    :vartype parser: StatsdParser
+
+    Usage::
+
+        >>> batch = MetricBatch()
+        >>> listener = StatsdListener(batch, port=0)
+        >>> listener.start()
+        >>> listener.stop()
+    """
+
+    MAX_DATAGRAM_SIZE = 65535
+
+    def __init__(self, batch, host="127.0.0.1", port=8125, *, sockets=1, receive_buffer_size=None, max_datagrams=256):
+        if sockets > 1 and not hasattr(socket, "SO_REUSEPORT"):
+            msg = "Multiple sockets require SO_REUSEPORT"
+            raise ValueError(msg)
+
+        self.parser = StatsdParser(batch)
+        self.max_datagrams = max_datagrams
+        self._received = [0] * sockets
+        self._stopped = threading.Event()
+        self._threads = []
+        self._sockets = []
+
+        family = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0][0]
+        for _ in range(sockets):
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            self._sockets.append(sock)
+            if sockets > 1:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            if receive_buffer_size:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer_size)
+            sock.bind((host, port))
+            sock.settimeout(0.0)
+            # Further sockets bind to the port picked for the first one
+            port = sock.getsockname()[1]
+
+        self.address = self._sockets[0].getsockname()
+
+    def _drain(self, sock):
+        datagrams = []
+        recv = sock.recv
+        size = self.MAX_DATAGRAM_SIZE
+        # Datagrams received before the socket would block are kept
+        with contextlib.suppress(BlockingIOError, InterruptedError):
+            datagrams.extend(recv(size) for _ in range(self.max_datagrams))
+        return datagrams
+
+    @property
+    def received(self):
+        """The number of datagrams received
+
+        :rtype: int
+        """
+        return sum(self._received)
+
+    def _serve(self, index, sock):
+        parse = self.parser.parse
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            while not self._stopped.is_set():
+                if selector.select(_POLL_INTERVAL):
+                    datagrams = self._drain(sock)
+                    self._received[index] += len(datagrams)
+                    parse(b"\n".join(datagrams))
+
+    def start(self):
+        """Start receiving datagrams"""
+        for index, sock in enumerate(self._sockets):
+            thread = threading.Thread(
+                target=self._serve, args=(index, sock), name="NewRelicStatsdListener", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop receiving datagrams and close the sockets
+
+        :param timeout: (optional) A timeout in seconds to wait for each
+            thread to exit, or None to wait until they exit.
+        :type timeout: int or float
+        """
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        for sock in self._sockets:
+            sock.close()
+
+
+def main(argv=None):
+    """Receive StatsD metrics and send them to New Relic until interrupted
+
+    The license key is read from the ``NEW_RELIC_LICENSE_KEY`` environment
+    variable.
+
+    :param argv: (optional) Command line arguments. Defaults to
+        :data:`sys.argv`.
+    :type argv: list
+    """
+    parser = argparse.ArgumentParser(prog="python -m newrelic_telemetry_sdk.statsd", description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8125, help="the port to listen on (default: %(default)s)")
+    parser.add_argument("--sockets", type=int, default=1, help="the number of sockets (default: %(default)s)")
+    parser.add_argument("--harvest-interval", type=float, default=5, help="seconds between harvests (default: 5)")
+    args = parser.parse_args(argv)
+
+    license_key = os.environ.get("NEW_RELIC_LICENSE_KEY")
+    if not license_key:
+        parser.error("the NEW_RELIC_LICENSE_KEY environment variable is required")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    batch = MetricBatch()
+    harvester = Harvester(MetricClient(license_key), batch, args.harvest_interval)
+    listener = StatsdListener(batch, args.host, args.port, sockets=args.sockets)
+    harvester.start()
+    listener.start()
+    _logger.info("Listening for StatsD metrics on %s:%d", *listener.address[:2])
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+        harvester.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextvars
+import functools
+import os
+import threading
+
+from newrelic_telemetry_sdk import fork
+from newrelic_telemetry_sdk.compact import CompactSpan
+from newrelic_telemetry_sdk.sampling import _span_ids
+from newrelic_telemetry_sdk.span import NOOP_SPAN, Span
+
+_CURRENT_SPAN = contextvars.ContextVar("newrelic_telemetry_sdk.current_span", default=None)
+
+
+class IdPool:
+    """A pool of pre-generated random 64 bit IDs formatted as hex strings
+
+    IDs are generated in bulk from :func:`os.urandom` whenever the pool is
+    empty, which is much cheaper per ID than generating and formatting each
+    ID separately.
+
+    :param size: (optional) The number of IDs generated per refill.
+        Default: 1024
+    :type size: int
+
+    Usage::
+
+        >>> pool = IdPool(size=2)
+        >>> len({pool.next_id() for _ in range(5)})
+        5
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self._lock = threading.Lock()
+        self._ids = []
+        fork.register(self)
+
+    def _after_fork(self):
+        # IDs generated before the fork are also used by the parent process
+        self._lock = threading.Lock()
+        self._ids = []
+
+    def _refill(self):
+        with self._lock:
+            if not self._ids:
+                hexed = os.urandom(8 * self.size).hex()
+                self._ids.extend([hexed[i : i + 16] for i in range(0, len(hexed), 16)])
+
+    def next_id(self):
+        """Take an ID from the pool
+
+        :rtype: str
+        """
+        try:
+            return self._ids.pop()
+        except IndexError:
+            self._refill()
+            return self.next_id()
+
+
+class ActiveSpan:
+    """Makes a span the current span while the block it wraps runs
+
+    Instances are created by :meth:`Tracer.start_span`. On exit, the span is
+    finished, recorded into the tracer's batch and the previous span is
+    restored as the current span. Exceptions are recorded on the span as
+    ``error.class`` and ``error.message`` attributes.
+    """
+
+    __slots__ = ("_batch", "_token", "span")
+
+    def __init__(self, batch, span):
+        self._batch = batch
+        self.span = span
+        self._token = None
+
+    def __enter__(self):
+        self._token = _CURRENT_SPAN.set(self.span)
+        return self.span
+
+    def __exit__(self, exc, value, tb):
+        _CURRENT_SPAN.reset(self._token)
+        span = self.span
+        if span is NOOP_SPAN:
+            return
+
+        if exc is not None:
+            error_class = getattr(exc, "__module__", "builtins") + "." + exc.__name__
+            if isinstance(span, CompactSpan):
+                if span.tags is None:
+                    span.tags = {}
+                attributes = span.tags
+            else:
+                attributes = span["attributes"]
+            attributes["error.class"] = error_class
+            attributes["error.message"] = str(value)
+
+        span.finish()
+        self._batch.record(span)
+
+
+class Tracer:
+    """Creates spans linked to the current span
+
+    The current span is tracked in a :mod:`contextvars` variable, so each
+    thread and each asyncio task has its own current span. Spans started
+    while another span is current become its children; other spans start a
+    new trace. Finished spans are recorded into ``batch``.
+
+    New threads start with an empty context. To continue a trace in another
+    thread, run the thread's target with :func:`contextvars.copy_context`.
+
+    Span and trace IDs are taken from an :class:`IdPool`.
+
+    :param batch: The batch where finished spans are recorded.
+    :type batch: SpanBatch
+    :param sampler: (optional) Decides whether new traces are sampled.
+        Default: every trace is sampled.
+    :type sampler: HeadSampler
+    :param span_cls: (optional) The class used to create spans when no
+        sampler is given. Default: :class:`Span <newrelic_telemetry_sdk.span.Span>`
+    :type span_cls: type
+    :param id_pool: (optional) The source of span and trace IDs.
+    :type id_pool: IdPool
+
+    Usage::
+
+        >>> from newrelic_telemetry_sdk import SpanBatch
+        >>> batch = SpanBatch()
+        >>> tracer = Tracer(batch)
+        >>> with tracer.start_span("parent") as parent:
+        ...     with tracer.start_span("child") as child:
+        ...         pass
+        >>> child["attributes"]["parent.id"] == parent["id"]
+        True
+        >>> len(batch.flush()[0])
+        2
+    """
+
+    def __init__(self, batch, sampler=None, span_cls=Span, id_pool=None):
+        self.batch = batch
+        self.sampler = sampler
+        self.span_cls = span_cls
+        self.id_pool = id_pool or IdPool()
+
+    @staticmethod
+    def current_span():
+        """Return the current span
+
+        :returns: The current span, or None when no span is active.
+        """
+        return _CURRENT_SPAN.get()
+
+    def start_span(self, name, tags=None):
+        """Start a span as a child of the current span
+
+        :param name: The name of the span.
+        :type name: str
+        :param tags: (optional) A set of tags that can be used to filter this
+            span in the New Relic UI.
+        :type tags: dict
+
+        :returns: A context manager which returns the span when entered.
+        :rtype: ActiveSpan
+        """
+        parent = _CURRENT_SPAN.get()
+        next_id = self.id_pool.next_id
+        sampler = self.sampler
+
+        if parent is NOOP_SPAN:
+            span = NOOP_SPAN
+        elif parent is not None:
+            trace_id, parent_id = _span_ids(parent)
+            if sampler is None:
+                span = self.span_cls(name, tags, guid=next_id(), trace_id=trace_id, parent_id=parent_id)
+            else:
+                span = sampler.span(name, tags, parent=parent, guid=next_id())
+        elif sampler is None:
+            span = self.span_cls(name, tags, guid=next_id(), trace_id=next_id())
+        else:
+            span = sampler.span(name, tags, trace_id=next_id(), guid=next_id())
+
+        return ActiveSpan(self.batch, span)
+
+    def traced(self, name=None, tags=None):
+        """Decorate a function so each call runs in a new span
+
+        :param name: (optional) The name of the span. Defaults to the
+            qualified name of the function.
+        :type name: str
+        :param tags: (optional) A set of tags that can be used to filter the
+            span in the New Relic UI.
+        :type tags: dict
+        """
+
+        def decorator(wrapped):
+            span_name = name or wrapped.__qualname__
+            start_span = self.start_span
+
+            @functools.wraps(wrapped)
+            def wrapper(*args, **kwargs):
+                with start_span(span_name, tags):
+                    return wrapped(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
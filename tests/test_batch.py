@@ -12,10 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import random
+import time
+
 import pytest
 from utils import CustomMapping
 
-from newrelic_telemetry_sdk.batch import Batch, EventBatch
+from newrelic_telemetry_sdk.batch import Batch, EventBatch, LogBatch, SpanBatch, TailSamplingSpanBatch, TopKEventBatch
+from newrelic_telemetry_sdk.compact import CompactEvent, CompactSpan, EncodedItems
+from newrelic_telemetry_sdk.event import Event
+from newrelic_telemetry_sdk.log import Log
+from newrelic_telemetry_sdk.rate_limit import LogRateLimiter
+from newrelic_telemetry_sdk.span import NOOP_SPAN, Span
 
 
 class VerifyLockBatch(Batch):
@@ -72,3 +81,342 @@ def test_batch_simple(batch_cls):
         batch.record(item)
 
         assert batch.flush()[0] == (item,)
+
+
+def test_span_batch_timed(monkeypatch, freeze_time):
+    ticks = iter((0, 250_000_000, 0, 500_000_000))
+    monkeypatch.setattr(time, "perf_counter_ns", lambda: next(ticks))
+
+    batch = SpanBatch()
+    timer = batch.timed("work", {"foo": "bar"})
+
+    with timer:
+        pass
+
+    @timer
+    def work():
+        return 42
+
+    assert work() == 42
+
+    spans, _ = batch.flush()
+    assert len(spans) == 2
+    for span, duration in zip(spans, (250, 500)):
+        assert span["attributes"] == {"name": "work", "foo": "bar", "duration.ms": duration}
+        assert span["timestamp"] == 2000 - duration
+
+
+@pytest.mark.parametrize("span_cls", (Span, CompactSpan))
+def test_span_batch_compress(span_cls):
+    batch = SpanBatch({"foo": "bar"}, compress=True)
+    for start, duration in ((1000, 5), (1010, 3), (1020, 9)):
+        batch.record(
+            span_cls(
+                "query", {"db": "users"}, trace_id="t", parent_id="root", start_time_ms=start, duration_ms=duration
+            )
+        )
+    other = Span("query", {"db": "orders"}, trace_id="t", parent_id="root", duration_ms=1)
+    batch.record(other)
+    last = Span("query", {"db": "users"}, trace_id="t", parent_id="root", duration_ms=1)
+    batch.record(last)
+    root = Span("root", trace_id="t", guid="root", duration_ms=100)
+    batch.record(root)
+
+    items, common = batch.flush()
+    assert common == {"attributes": {"foo": "bar"}}
+    composite, *rest = items
+    assert rest == [other, last, root]
+    assert composite["trace.id"] == "t"
+    assert composite["timestamp"] == 1000
+    assert composite["attributes"] == {
+        "name": "query",
+        "db": "users",
+        "parent.id": "root",
+        "duration.ms": 29,
+        "composite.count": 3,
+        "composite.duration.sum.ms": 17,
+        "composite.duration.min.ms": 3,
+        "composite.duration.max.ms": 9,
+    }
+
+    assert batch.flush()[0] == ()
+
+
+def test_span_batch_compress_separates_parents():
+    batch = SpanBatch(compress=True)
+    spans = [
+        Span("query", trace_id="t", parent_id="a", duration_ms=1),
+        Span("query", trace_id="t", parent_id="b", duration_ms=1),
+        Span("query", trace_id="u", parent_id="a", duration_ms=1),
+    ]
+    for span in spans:
+        batch.record(span)
+    assert batch.flush()[0] == tuple(spans)
+
+
+def test_span_batch_compress_skips_spans_with_children():
+    batch = SpanBatch(compress=True)
+    spans = []
+    for guid in ("a", "b"):
+        spans.append(Span("child", trace_id="t", parent_id=guid, duration_ms=1))
+        spans.append(Span("query", trace_id="t", guid=guid, parent_id="root", duration_ms=2))
+    for span in spans:
+        batch.record(span)
+    assert batch.flush()[0] == tuple(spans)
+
+
+@pytest.mark.parametrize("child_attributes", ({}, {"args": [1]}))
+def test_span_batch_compress_child_after_parent(child_attributes):
+    batch = SpanBatch(compress=True)
+    spans = [Span("query", trace_id="t", guid=guid, parent_id="root", duration_ms=2) for guid in ("a0", "a1")]
+    spans.append(Span("child", child_attributes, trace_id="t", parent_id="a1", duration_ms=1))
+    for span in spans:
+        batch.record(span)
+
+    items = batch.flush()[0]
+    assert items == tuple(spans)
+    ids = {item["id"] for item in items}
+    assert all(item["attributes"]["parent.id"] in ids | {"root"} for item in items)
+
+
+def test_span_batch_compress_unhashable_attributes():
+    batch = SpanBatch(compress=True)
+    spans = [Span("query", {"args": [1]}, trace_id="t", parent_id="root") for _ in range(2)]
+    for span in spans:
+        batch.record(span)
+    assert batch.flush()[0] == tuple(spans)
+
+
+def test_log_batch_dedup():
+    batch = LogBatch({"foo": "bar"}, dedup=True)
+    attributes = {"logger.name": "app", "log.level": "ERROR", "error.class": "builtins.ValueError"}
+    for timestamp in (3000, 1000, 2000):
+        batch.record(Log("connection failed", timestamp, **attributes))
+    batch.record(Log("connection failed", 1500, **dict(attributes, **{"log.level": "WARNING"})))
+    batch.record(Log("other message", 1500))
+
+    items, common = batch.flush()
+    assert common == {"attributes": {"foo": "bar"}}
+    assert len(items) == 3
+
+    collapsed, warning, other = items
+    assert collapsed["message"] == "connection failed"
+    assert collapsed["timestamp"] == 3000
+    assert collapsed["attributes"] == dict(
+        attributes, **{"occurrences": 3, "first.timestamp": 3000, "last.timestamp": 3000}
+    )
+
+    # Logs that only occurred once are unchanged
+    assert warning["attributes"]["log.level"] == "WARNING"
+    assert "occurrences" not in warning["attributes"]
+    assert other == Log("other message", 1500)
+
+    # The dedup state is reset at flush
+    assert batch.flush() == ((), {"attributes": {"foo": "bar"}})
+
+
+def test_log_batch_dedup_unhashable_values():
+    batch = LogBatch(dedup=True)
+    for timestamp in (1000, 2000):
+        batch.record(Log({"a": 1}, timestamp, **{"logger.name": ["app"], "error.class": {"ValueError"}}))
+    batch.record(Log({"a": 2}, 3000))
+
+    collapsed, other = batch.flush()[0]
+    assert collapsed["message"] == {"a": 1}
+    assert collapsed["attributes"]["occurrences"] == 2
+    assert other["message"] == {"a": 2}
+
+
+def test_log_batch_without_dedup_keeps_duplicates():
+    batch = LogBatch()
+    log = Log("message")
+    batch.record(log)
+    batch.record(log)
+    assert batch.flush()[0] == (log, log)
+
+
+@pytest.fixture
+def monotonic(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_trace(trace_id, duration_ms=10, child_tags=None):
+    return (
+        Span("child", child_tags, trace_id=trace_id, parent_id="root", duration_ms=duration_ms),
+        Span("root", trace_id=trace_id, guid="root", duration_ms=duration_ms),
+    )
+
+
+@pytest.mark.parametrize(
+    "kwargs,trace_kwargs,kept",
+    (
+        ({}, {}, False),
+        ({}, {"child_tags": {"error": True}}, True),
+        ({}, {"child_tags": {"error.class": "ValueError"}}, True),
+        ({"keep_errors": False}, {"child_tags": {"error": True}}, False),
+        ({"latency_threshold_ms": 100}, {"duration_ms": 99}, False),
+        ({"latency_threshold_ms": 100}, {"duration_ms": 100}, True),
+        ({"sample_rate": 1.0}, {}, True),
+    ),
+)
+def test_tail_sampling_policies(kwargs, trace_kwargs, kept):
+    batch = TailSamplingSpanBatch(**kwargs)
+    spans = make_trace("trace", **trace_kwargs)
+    for span in spans:
+        batch.record(span)
+
+    assert batch.flush()[0] == (spans if kept else ())
+
+
+def test_tail_sampling_budget(monotonic):
+    batch = TailSamplingSpanBatch(sample_rate=1.0, max_sampled_per_second=2)
+    for i in range(5):
+        for span in make_trace(str(i)):
+            batch.record(span)
+
+    assert len(batch.flush()[0]) == 4
+
+
+def test_tail_sampling_holds_incomplete_traces(monotonic):
+    batch = TailSamplingSpanBatch(trace_timeout=10, latency_threshold_ms=100)
+    child, root = make_trace("trace", duration_ms=500)
+
+    batch.record(child)
+    assert batch.flush()[0] == ()
+
+    # The trace is decided once it times out
+    monotonic[0] += 10
+    assert batch.flush()[0] == (child,)
+
+    # Late spans follow the decision for their trace
+    batch.record(root)
+    assert batch.flush()[0] == (root,)
+    assert not batch._pending
+
+
+def test_tail_sampling_late_spans_of_dropped_traces():
+    batch = TailSamplingSpanBatch()
+    child, root = make_trace("trace")
+    batch.record(root)
+    batch.record(child)
+    assert batch.flush()[0] == ()
+    assert not batch._pending
+
+
+@pytest.mark.parametrize("limits", ({"max_traces": 2}, {"max_spans": 2}))
+def test_tail_sampling_memory_bounds(limits):
+    batch = TailSamplingSpanBatch(latency_threshold_ms=100, max_decisions=1, **limits)
+    children = [make_trace(str(i), duration_ms=i * 100)[0] for i in range(4)]
+    for child in children:
+        batch.record(child)
+
+    # The oldest traces are decided early to stay within the limits
+    assert len(batch._pending) == 2
+    assert batch._pending_spans == 2
+    assert batch.flush()[0] == (children[1],)
+    assert len(batch._decisions) == 1
+
+
+def zipf_stream(n, distinct, seed=0):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    return rng.choices([f"/page/{i}" for i in range(distinct)], weights, k=n)
+
+
+@pytest.mark.parametrize("value", (None, "size"))
+def test_top_k_event_batch_matches_exact(value):
+    stream = zipf_stream(50000, 5000)
+    exact = collections.Counter()
+    batch = TopKEventBatch("url", k=10, value=value, capacity=200)
+    for i, url in enumerate(stream):
+        weight = 1 if value is None else i % 7
+        exact[url] += weight
+        batch.record(Event("PageView", {"url": url, "size": weight}))
+
+    weight_name = "count" if value is None else "size.sum"
+    (items,) = batch.flush()
+    assert len(items) == 10
+    assert [item["rank"] for item in items] == list(range(1, 11))
+
+    for item in items:
+        assert item["eventType"] == "PageViewTopK"
+        assert item[f"{weight_name}.total"] == sum(exact.values())
+        true_weight = exact[item["url"]]
+        assert item[weight_name] - item[f"{weight_name}.error"] <= true_weight <= item[weight_name]
+
+    top = {url for url, _ in exact.most_common(5)}
+    assert top <= {item["url"] for item in items}
+
+    assert len(batch._tables) == 0
+
+
+def test_top_k_event_batch_constant_memory():
+    batch = TopKEventBatch("id", k=5, capacity=50)
+    for i in range(10000):
+        batch.record(Event("Request", {"id": i}))
+    assert len(batch._tables["Request"].weights) <= 100
+
+
+def test_top_k_event_batch_exact_when_small():
+    batch = TopKEventBatch("url", k=2)
+    for url in ("/a", "/b", "/b", "/c", "/c", "/c"):
+        batch.record(CompactEvent("PageView", {"url": url}))
+    batch.record(Event("Login", {"url": "/login"}))
+
+    (items,) = batch.flush()
+    summary = [(item["eventType"], item["url"], item["count"], item["count.error"]) for item in items]
+    assert summary == [("PageViewTopK", "/c", 3, 0), ("PageViewTopK", "/b", 2, 0), ("LoginTopK", "/login", 1, 0)]
+
+
+def test_top_k_event_batch_ignores_invalid():
+    batch = TopKEventBatch("url", value="size")
+    batch.record(Event("PageView", {"size": 1}))
+    batch.record(Event("PageView", {"url": "/", "size": "big"}))
+    batch.record(Event("PageView", {"url": "/", "size": True}))
+    batch.record(Event("PageView", {"url": ["/"], "size": 1}))
+    batch.record(Event("PageView", {"url": "/", "size": 2.5}))
+
+    (items,) = batch.flush()
+    assert [(item["url"], item["size.sum"], item["size.sum.total"]) for item in items] == [("/", 2.5, 2.5)]
+
+
+def test_span_batch_encode():
+    batch = SpanBatch({"foo": "bar"}, encode=True)
+    assert not batch.flush()[0]
+
+    spans = [Span("a", start_time_ms=1000), CompactSpan("b", start_time_ms=1000)]
+    for span in spans:
+        batch.record(span)
+    batch.record(NOOP_SPAN)
+
+    items, common = batch.flush()
+    assert isinstance(items, EncodedItems)
+    assert len(items) == 2
+    assert list(items) == [dict(span) for span in spans]
+    assert common == {"attributes": {"foo": "bar"}}
+    assert not batch.flush()[0]
+
+
+def test_span_batch_encode_and_compress():
+    with pytest.raises(ValueError, match="cannot be compressed"):
+        SpanBatch(compress=True, encode=True)
+
+
+def test_log_batch_encode():
+    limiter = LogRateLimiter(level_rates={"DEBUG": 1})
+    batch = LogBatch(encode=True, rate_limiter=limiter)
+    for _ in range(2):
+        batch.record(Log("message", 1000, **{"log.level": "DEBUG"}))
+
+    items, common = batch.flush()
+    assert common is None
+    logs = list(items)
+    assert logs[0] == {"message": "message", "timestamp": 1000, "attributes": {"log.level": "DEBUG"}}
+    assert logs[1]["attributes"]["suppressed.count"] == 1
+
+
+def test_log_batch_encode_and_dedup():
+    with pytest.raises(ValueError, match="cannot be deduplicated"):
+        LogBatch(dedup=True, encode=True)
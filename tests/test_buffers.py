@@ -0,0 +1,107 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import zlib
+
+import pytest
+from urllib3 import HTTPConnectionPool
+from urllib3 import HTTPResponse as URLLib3HTTPResponse
+
+from newrelic_telemetry_sdk.buffers import BufferPool, PayloadBuffer
+from newrelic_telemetry_sdk.client import SpanClient
+
+
+def test_payload_buffer_reuses_capacity():
+    buffer = PayloadBuffer()
+    buffer.write(b"a" * 100)
+    data = buffer.data
+
+    buffer.size = 0
+    buffer.write(b"b" * 10)
+    assert bytes(buffer.view()) == b"b" * 10
+    assert buffer.data is data
+    assert len(data) == 100
+
+
+def test_buffer_pool_reuse():
+    pool = BufferPool()
+    buffer = pool.acquire()
+    buffer.write(b"payload")
+    view = buffer.view()
+    pool.release(view)
+
+    reused = pool.acquire()
+    assert reused is buffer
+    assert reused.size == 0
+
+    # The buffer can grow once the view is released
+    reused.write(b"x" * 1000)
+    assert bytes(reused.view()) == b"x" * 1000
+
+
+def test_buffer_pool_ignores_foreign_views():
+    pool = BufferPool()
+    pool.release(memoryview(bytearray(b"foreign")))
+    pool.release(memoryview(b"bytes"))
+    assert pool._idle == []
+
+
+def test_buffer_pool_limits():
+    pool = BufferPool(max_buffers=1, max_buffer_size=10)
+    small, large, other = pool.acquire(), pool.acquire(), pool.acquire()
+    small.write(b"small")
+    large.write(b"x" * 100)
+
+    pool.release(large.view())
+    assert pool._idle == []
+    pool.release(small.view())
+    pool.release(other.view())
+    assert pool._idle == [small]
+
+
+def test_client_sends_pooled_buffers(monkeypatch):
+    bodies = []
+
+    def urlopen(pool, method, url, body=None, headers=None, **kwargs):
+        assert isinstance(body, memoryview)
+        bodies.append(json.loads(zlib.decompress(body, 31)))
+        return URLLib3HTTPResponse(status=202)
+
+    monkeypatch.setattr(HTTPConnectionPool, "urlopen", urlopen)
+    pool = BufferPool()
+    client = SpanClient("test-key", buffer_pool=pool)
+
+    spans = [{"id": str(i), "attributes": {"n": i}} for i in range(1000)]
+    for _ in range(3):
+        assert client.send_batch(spans).ok
+    client.close()
+
+    assert bodies == [[{"spans": spans}]] * 3
+    assert len(pool._idle) == 1
+    assert pool._in_use == {}
+
+
+def test_client_releases_buffer_on_error(monkeypatch):
+    def urlopen(*args, **kwargs):
+        raise ConnectionError
+
+    monkeypatch.setattr(HTTPConnectionPool, "urlopen", urlopen)
+    pool = BufferPool()
+    client = SpanClient("test-key", buffer_pool=pool, max_pause_ms=1)
+    with pytest.raises(ConnectionError):
+        client.send_batch([{"id": "1"}])
+    client.close()
+
+    assert len(pool._idle) == 1
@@ -13,6 +13,8 @@
 # limitations under the License.
 
 import functools
+import gzip
+import itertools
 import json
 import os
 import sys
@@ -25,7 +27,18 @@ from newrelic_telemetry_sdk.version import version
 from urllib3 import HTTPConnectionPool, Retry
 from urllib3 import HTTPResponse as URLLib3HTTPResponse
 
-from newrelic_telemetry_sdk.client import EventClient, HTTPError, HTTPResponse, LogClient, MetricClient, SpanClient
+from newrelic_telemetry_sdk.batch import SpanBatch
+from newrelic_telemetry_sdk.client import (
+    EventClient,
+    HTTPError,
+    HTTPResponse,
+    LogClient,
+    MetricClient,
+    SpanClient,
+    _create_payload,
+)
+from newrelic_telemetry_sdk.compact import CompactSpan
+from newrelic_telemetry_sdk.span import Span
 
 SPAN = {
     "id": str(uuid.uuid4()),
@@ -431,3 +444,156 @@ def test_client_connection_pool_kwargs(client_class):
 def test_client_invalid_license_key(client_class, license_key):
     with pytest.raises(ValueError, match="Invalid license key"):
         client_class(license_key)
+
+
+def expand_payload(payload_type, payload):
+    """Apply each common block to its items, as the backend would"""
+    expanded = []
+    for entry in payload:
+        common_attributes = entry.get("common", {}).get("attributes", {})
+        for item in entry[payload_type]:
+            attributes = dict(common_attributes, **item.get("attributes", {}))
+            expanded.append(dict(item, attributes=attributes))
+    return sorted(expanded, key=lambda item: item["id"])
+
+
+def test_common_attributes_factoring():
+    client = SpanClient("test-key", common_attributes=("service.name", "thread.name"))
+    spans = [
+        {"id": "1", "attributes": {"name": "a", "service.name": "web", "thread.name": "main"}},
+        {"id": "2", "attributes": {"name": "b", "service.name": "web", "thread.name": "main"}},
+        {"id": "3", "attributes": {"name": "c", "service.name": "web"}},
+        {"id": "4", "attributes": {"name": "d", "service.name": "web"}},
+        {"id": "5", "attributes": {"name": "e", "service.name": "worker"}},
+        {"id": "6", "attributes": {"name": "f", "service.name": ["unhashable"]}},
+        {"id": "7"},
+    ]
+    common = {"attributes": {"host": "localhost", "service.name": "default"}}
+
+    payload = json.loads(decompress(client._create_payload(spans, common)))
+
+    # Ungrouped items are sent first with the original common block
+    assert payload[0]["common"] == common
+    assert sorted(payload[0]["spans"], key=lambda span: span["id"]) == spans[4:]
+    assert payload[1] == {
+        "spans": [{"id": "1", "attributes": {"name": "a"}}, {"id": "2", "attributes": {"name": "b"}}],
+        "common": {"attributes": {"host": "localhost", "service.name": "web", "thread.name": "main"}},
+    }
+    assert payload[2]["common"] == {"attributes": {"host": "localhost", "service.name": "web"}}
+    assert len(payload) == 3
+
+    # The original items are not modified
+    assert spans[0]["attributes"]["service.name"] == "web"
+
+    expected = [dict(span, attributes=dict(common["attributes"], **span.get("attributes", {}))) for span in spans]
+    assert expand_payload("spans", payload) == expected
+
+
+def test_common_attributes_factoring_without_common():
+    client = LogClient("test-key", common_attributes=LogClient.COMMON_ATTRIBUTES)
+    logs = [{"id": str(i), "message": "m", "attributes": {"logger.name": "app", "n": i}} for i in range(2)]
+
+    payload = json.loads(decompress(client._create_payload(logs, None)))
+    assert payload == [
+        {
+            "logs": [
+                {"id": "0", "message": "m", "attributes": {"n": 0}},
+                {"id": "1", "message": "m", "attributes": {"n": 1}},
+            ],
+            "common": {"attributes": {"logger.name": "app"}},
+        }
+    ]
+
+
+@pytest.mark.parametrize("common", (None, {"attributes": {"service.name": "web"}}))
+def test_encoded_items_payload(common):
+    batch = SpanBatch(encode=True)
+    spans = [Span("a", guid="1", trace_id="t", start_time_ms=1000), CompactSpan("b", guid=2, start_time_ms=1000)]
+    for span in spans:
+        batch.record(span)
+    items, _ = batch.flush()
+
+    client = SpanClient("test-key", common_attributes=SpanClient.COMMON_ATTRIBUTES)
+    payload = json.loads(decompress(client._create_payload(items, common)))
+    expected = {"spans": [dict(span) for span in spans]}
+    if common:
+        expected["common"] = common
+    assert payload == [expected]
+    assert payload == json.loads(decompress(SpanClient("test-key")._create_payload(spans, common)))
+
+
+@pytest.mark.parametrize("client_cls", (SpanClient, MetricClient, LogClient, EventClient))
+@pytest.mark.parametrize("count", (0, 1, 1000))
+def test_chunked_payload(client_cls, count):
+    items = [{"id": str(i), "attributes": {"n": i}} for i in range(count)]
+    common = {"attributes": {"service.name": "web"}}
+    client = client_cls("test-key", max_pause_ms=0.01)
+    expected = json.loads(decompress(client_cls("test-key")._create_payload(items, common)))
+
+    assert json.loads(decompress(client._create_payload(items, common))) == expected
+    assert json.loads(decompress(client._create_payload(iter(items), common))) == expected
+
+
+@pytest.mark.parametrize("client_cls", (SpanClient, MetricClient, LogClient, EventClient))
+@pytest.mark.parametrize("common_attributes", (None, ("service.name",)))
+def test_worker_payload_matches_client(client_cls, common_attributes):
+    items = [{"id": str(i), "attributes": {"n": i, "service.name": "web"}} for i in range(3)]
+    common = None if client_cls is EventClient else {"attributes": {"host": "a"}}
+    client = client_cls("test-key", common_attributes=common_attributes)
+
+    payload = _create_payload(client_cls.PAYLOAD_TYPE, common_attributes, items, common)
+    assert decompress(payload) == decompress(client._create_payload(items, common))
+
+
+def test_chunked_payload_adapts_chunk_size(monkeypatch):
+    ticks = itertools.count(step=0.001)
+    monkeypatch.setattr(time, "perf_counter", lambda: next(ticks))
+    client = SpanClient("test-key", max_pause_ms=4)
+    chunks = list(client._encode_chunks([{"id": i} for i in range(1000)]))
+
+    # Each chunk takes 1ms, so the chunk size quadruples each time
+    assert [chunk.count(b"{") for chunk in chunks] == [256, 744]
+    assert client._chunk_size == 4096
+
+
+@pytest.mark.parametrize("max_pause_ms", (None, 1))
+def test_parallel_compression(max_pause_ms):
+    items = [{"id": str(i), "attributes": {"n": i, "padding": "x" * (i % 50)}} for i in range(5000)]
+    common = {"attributes": {"service.name": "web"}}
+    client = SpanClient("test-key", compression_threads=4, max_pause_ms=max_pause_ms)
+    client.COMPRESSION_CHUNK_SIZE = 4096
+    try:
+        payload = client._create_payload(items, common)
+    finally:
+        client.close()
+
+    # Each chunk is a separate gzip member
+    assert payload.count(b"\x1f\x8b\x08") > 10
+    assert json.loads(gzip.decompress(payload)) == [{"spans": items, "common": common}]
+
+
+def test_parallel_compression_small_payload():
+    client = EventClient("test-key", compression_threads=2)
+    try:
+        payload = client._create_payload([{"eventType": "a"}], None)
+    finally:
+        client.close()
+
+    assert payload.count(b"\x1f\x8b\x08") == 1
+    assert json.loads(gzip.decompress(payload)) == [{"eventType": "a"}]
+
+
+def test_parallel_compression_encoded_items():
+    batch = SpanBatch(encode=True)
+    for i in range(2000):
+        batch.record(Span("span", {"n": i}, guid=str(i), trace_id="t", start_time_ms=1000))
+    items, _ = batch.flush()
+
+    client = SpanClient("test-key", compression_threads=2)
+    client.COMPRESSION_CHUNK_SIZE = 1024
+    try:
+        payload = client._create_payload(items, None)
+    finally:
+        client.close()
+
+    assert json.loads(gzip.decompress(payload)) == [{"spans": list(items)}]
@@ -0,0 +1,243 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pathlib
+import socket
+import stat
+import tempfile
+import threading
+
+import pytest
+
+from newrelic_telemetry_sdk.batch import SpanBatch
+from newrelic_telemetry_sdk.collector import _FRAME_HEADER, Collector, ForwardingClient, default_socket_path, main
+from newrelic_telemetry_sdk.event import Event
+from newrelic_telemetry_sdk.log import Log
+from newrelic_telemetry_sdk.metric_batch import MetricBatch
+from newrelic_telemetry_sdk.span import Span
+
+
+class Response:
+    status = 202
+    ok = True
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []
+
+    def send_batch(self, items, common=None):
+        self.sent.append((items, common))
+        return Response()
+
+    def close(self):
+        pass
+
+    def items(self):
+        return [item for items, _ in self.sent for item in items]
+
+
+@pytest.fixture
+def clients():
+    return {kind: FakeClient() for kind in ("span_client", "event_client", "log_client", "metric_client")}
+
+
+@pytest.fixture
+def collector(tmp_path, clients):
+    collector = Collector(str(tmp_path / "collector.sock"), harvest_interval=60, **clients)
+    thread = threading.Thread(target=collector.serve_forever)
+    thread.start()
+    yield collector
+    collector.shutdown()
+    thread.join()
+
+
+def close(collector):
+    collector.shutdown()
+    collector.server_close()
+
+
+def test_forward_spans_events_and_logs(collector, clients):
+    span = Span("span", {"foo": "bar"})
+    ForwardingClient("spans", collector.path).send_batch((span,), {"attributes": {"service.name": "cron", "foo": "x"}})
+    ForwardingClient("events", collector.path).send(Event("Job", {"count": 1}))
+    ForwardingClient("logs", collector.path).send_batch((Log("hello"),), {"attributes": {"host": "a"}})
+    close(collector)
+
+    (forwarded_span,) = clients["span_client"].items()
+    assert forwarded_span["id"] == span["id"]
+    assert forwarded_span["attributes"] == {"name": "span", "foo": "bar", "service.name": "cron"}
+
+    (event,) = clients["event_client"].items()
+    assert event["eventType"] == "Job"
+    assert event["count"] == 1
+
+    (log,) = clients["log_client"].items()
+    assert log["message"] == "hello"
+    assert log["attributes"] == {"host": "a"}
+
+
+def test_forward_metrics_are_aggregated(collector, clients):
+    for process in ("a", "b"):
+        batch = MetricBatch({"process": process})
+        batch.record_count("jobs", 2)
+        batch.record_summary("duration", 1 if process == "a" else 3)
+        batch.record_summary("duration", 2)
+        batch.record_gauge("queue", 5)
+        ForwardingClient("metrics", collector.path).send_batch(*batch.flush())
+
+    batch = MetricBatch()
+    batch.record_count("jobs", 3, {"process": "a"})
+    ForwardingClient("metrics", collector.path).send_batch(*batch.flush())
+    close(collector)
+
+    metrics = {(item["name"], item["attributes"]["process"]): item for item in clients["metric_client"].items()}
+    assert metrics["jobs", "a"]["value"] == 5
+    assert metrics["jobs", "b"]["value"] == 2
+    assert metrics["duration", "a"]["value"] == {"count": 2, "sum": 3, "min": 1, "max": 2}
+    assert metrics["duration", "b"]["value"] == {"count": 2, "sum": 5, "min": 2, "max": 3}
+    assert metrics["queue", "b"]["value"] == 5
+
+
+def test_forward_encoded_items(collector, clients):
+    batch = SpanBatch(encode=True)
+    batch.record(Span("one"))
+    batch.record(Span("two"))
+    ForwardingClient("spans", collector.path).send_batch(*batch.flush())
+    close(collector)
+
+    assert [span["attributes"]["name"] for span in clients["span_client"].items()] == ["one", "two"]
+
+
+def test_malformed_frames_are_dropped(collector, clients, caplog):
+    body = b'{"items":[{"eventType":"Job"}]}'
+    frames = (
+        _FRAME_HEADER.pack(1, 3) + b"bad",
+        _FRAME_HEADER.pack(9, 2) + b"{}",
+        _FRAME_HEADER.pack(2, len(body)) + body,
+    )
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(collector.path)
+        sock.sendall(b"".join(frames))
+    close(collector)
+
+    assert "Dropping a malformed frame." in caplog.text
+    assert [event["eventType"] for event in clients["event_client"].items()] == ["Job"]
+
+
+def test_kinds_without_client_are_dropped(tmp_path):
+    span_client = FakeClient()
+    collector = Collector(str(tmp_path / "collector.sock"), span_client=span_client, harvest_interval=60)
+    thread = threading.Thread(target=collector.serve_forever)
+    thread.start()
+    ForwardingClient("events", collector.path).send(Event("Job"))
+    ForwardingClient("spans", collector.path).send(Span("span"))
+    close(collector)
+    thread.join()
+
+    assert len(collector.harvesters) == 1
+    assert len(span_client.items()) == 1
+
+
+def test_collector_replaces_stale_socket(tmp_path):
+    path = str(tmp_path / "collector.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    collector = Collector(path)
+    collector.server_close()
+    assert not (tmp_path / "collector.sock").exists()
+
+
+def test_collector_keeps_live_socket(collector, clients):
+    with pytest.raises(OSError, match="in use"):
+        Collector(collector.path)
+
+    # The running collector still receives data
+    ForwardingClient("spans", collector.path).send(Span("span"))
+    close(collector)
+    assert len(clients["span_client"].items()) == 1
+
+
+@pytest.mark.parametrize("mode", (None, 0o660))
+def test_collector_socket_mode(tmp_path, mode):
+    kwargs = {} if mode is None else {"mode": mode}
+    collector = Collector(str(tmp_path / "collector.sock"), **kwargs)
+    try:
+        assert stat.S_IMODE((tmp_path / "collector.sock").stat().st_mode) == (mode or 0o600)
+    finally:
+        collector.server_close()
+
+
+def test_forwarding_client_checks_socket_owner(collector, clients):
+    client = ForwardingClient("spans", collector.path, owner=os.getuid() + 1)
+    with pytest.raises(PermissionError, match="owned by user ID"):
+        client.send(Span("span"))
+    close(collector)
+    assert clients["span_client"].items() == []
+
+
+def test_forwarding_client_invalid_kind():
+    with pytest.raises(ValueError, match="Invalid kind"):
+        ForwardingClient("traces")
+
+
+def test_forwarding_client_without_collector(tmp_path):
+    client = ForwardingClient("spans", str(tmp_path / "missing.sock"))
+    with pytest.raises(OSError):
+        client.send(Span("span"))
+
+
+def test_default_socket_path(monkeypatch):
+    monkeypatch.setenv("NEW_RELIC_COLLECTOR_SOCKET", "/run/collector.sock")
+    assert default_socket_path() == "/run/collector.sock"
+    assert ForwardingClient("spans").path == "/run/collector.sock"
+
+
+@pytest.fixture
+def private_tmp(monkeypatch):
+    monkeypatch.delenv("NEW_RELIC_COLLECTOR_SOCKET", raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    # Socket paths are limited to about 100 bytes, so tmp_path is too long
+    with tempfile.TemporaryDirectory() as directory:
+        monkeypatch.setattr(tempfile, "tempdir", directory)
+        yield pathlib.Path(directory, f"newrelic-telemetry-sdk-{os.getuid()}")
+
+
+def test_default_socket_path_is_private(private_tmp, monkeypatch):
+    assert default_socket_path() == str(private_tmp / "newrelic-telemetry-sdk.sock")
+    collector = Collector()
+    try:
+        assert stat.S_IMODE(private_tmp.stat().st_mode) == 0o700
+        assert collector.path == default_socket_path()
+    finally:
+        collector.server_close()
+
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert default_socket_path() == "/run/user/1000/newrelic-telemetry-sdk.sock"
+
+
+def test_default_socket_directory_must_be_private(private_tmp):
+    private_tmp.mkdir(mode=0o777)
+    private_tmp.chmod(0o777)
+    with pytest.raises(PermissionError, match="not a directory private"):
+        Collector()
+
+
+def test_main_requires_license_key(monkeypatch):
+    monkeypatch.delenv("NEW_RELIC_LICENSE_KEY", raising=False)
+    with pytest.raises(SystemExit):
+        main([])
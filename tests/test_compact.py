@@ -0,0 +1,149 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import tracemalloc
+import zlib
+
+import pytest
+from utils import CustomMapping
+
+from newrelic_telemetry_sdk.client import SpanClient
+from newrelic_telemetry_sdk.compact import (
+    CompactCountMetric,
+    CompactEvent,
+    CompactGaugeMetric,
+    CompactLog,
+    CompactMapping,
+    CompactSpan,
+    CompactSummaryMetric,
+    serialize,
+)
+from newrelic_telemetry_sdk.event import Event
+from newrelic_telemetry_sdk.log import Log
+from newrelic_telemetry_sdk.metric import CountMetric, GaugeMetric, SummaryMetric
+from newrelic_telemetry_sdk.span import Span
+
+
+@pytest.mark.parametrize(
+    "compact_cls,dict_cls,args,kwargs",
+    (
+        (
+            CompactSpan,
+            Span,
+            ("name",),
+            {"tags": CustomMapping(), "guid": "g", "trace_id": "t", "parent_id": "p", "duration_ms": 1.5},
+        ),
+        (CompactSpan, Span, ("name",), {"guid": "g", "trace_id": "t"}),
+        (CompactEvent, Event, ("Purchase",), {"tags": {"amount": 1}}),
+        (CompactEvent, Event, ("Purchase",), {}),
+        (CompactLog, Log, ("message",), {"foo": "bar"}),
+        (CompactLog, Log, ("message",), {}),
+        (CompactGaugeMetric, GaugeMetric, ("name", 1), {"tags": {"foo": "bar"}}),
+        (CompactGaugeMetric, GaugeMetric, ("name", 1), {"end_time_ms": None}),
+        (CompactCountMetric, CountMetric, ("name", 1, 1000), {}),
+        (CompactSummaryMetric, SummaryMetric, ("name", 1, 2, 2, 2), {"interval_ms": 1000, "tags": {"foo": "bar"}}),
+    ),
+)
+def test_compact_matches_dict_format(freeze_time, compact_cls, dict_cls, args, kwargs):
+    compact = compact_cls(*args, **kwargs)
+    expected = dict_cls(*args, **kwargs)
+
+    assert compact.to_dict() == expected
+    assert dict(compact) == expected
+    for key, value in expected.items():
+        assert compact[key] == value
+    assert "missing" not in compact
+    assert compact == expected
+    assert len(compact) == len(expected)
+    assert json.loads(json.dumps(compact, default=serialize)) == json.loads(json.dumps(expected))
+    assert not hasattr(compact, "__dict__")
+
+
+def test_compact_mapping_is_abstract():
+    class Incomplete(CompactMapping):
+        __slots__ = ()
+
+        def __getitem__(self, key):
+            raise KeyError(key)
+
+        def __iter__(self):
+            return iter(())
+
+        def __len__(self):
+            return 0
+
+    with pytest.raises(TypeError, match="to_dict"):
+        Incomplete()
+
+
+def test_compact_span_ids():
+    span = CompactSpan("name")
+    span_dict = span.to_dict()
+
+    assert span.guid == span_dict["id"]
+    assert span.trace_id == span_dict["trace.id"]
+    for value in (span.guid, span.trace_id):
+        assert len(value) == 16
+        int(value, 16)
+
+
+def test_compact_span_context_manager(freeze_time):
+    with CompactSpan("name", start_time_ms=1000.0) as span:
+        pass
+
+    assert span.duration_ms == 1000
+    assert span["attributes"]["duration.ms"] == 1000
+
+
+def test_compact_metric_times(freeze_time):
+    metric = CompactCountMetric("name", 1, 500)
+    assert metric.start_time_ms == 1500
+    assert metric.end_time_ms == 2000
+
+    assert CompactGaugeMetric("name", 1, end_time_ms=None).end_time_ms is None
+
+
+def test_compact_log_from_record():
+    record = logging.makeLogRecord({"msg": "Hello %s", "args": ("World",)})
+    log = CompactLog.from_record(record)
+    assert log == Log.from_record(record)
+
+
+def test_serialize_unknown_type():
+    with pytest.raises(TypeError, match="object is not JSON serializable"):
+        json.dumps(object(), default=serialize)
+
+
+def test_client_serializes_compact_items():
+    client = SpanClient("test-key")
+    span = CompactSpan("name", tags={"foo": "bar"})
+
+    payload = client._create_payload((span,), None)
+    payload = json.loads(zlib.decompress(payload, 31))
+
+    assert payload == [{"spans": [span.to_dict()]}]
+
+
+def test_compact_span_uses_less_memory():
+    def measure(cls):
+        tracemalloc.start()
+        spans = [cls("name") for _ in range(1000)]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del spans
+        return size
+
+    assert measure(CompactSpan) * 2 < measure(Span)
@@ -0,0 +1,219 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+
+import pytest
+
+from newrelic_telemetry_sdk import fork
+from newrelic_telemetry_sdk.batch import SpanBatch, TailSamplingSpanBatch
+from newrelic_telemetry_sdk.buffers import BufferPool
+from newrelic_telemetry_sdk.client import SpanClient
+from newrelic_telemetry_sdk.harvester import Harvester
+from newrelic_telemetry_sdk.metric_batch import MetricBatch
+from newrelic_telemetry_sdk.span import Span
+from newrelic_telemetry_sdk.tracer import IdPool
+
+
+class Response:
+    status = 202
+    ok = True
+
+
+class PipeClient:
+    """Writes the names of sent spans to a file descriptor"""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def send_batch(self, items, common=None):
+        names = [item.get("name") or item["attributes"]["name"] for item in items]
+        os.write(self.fd, json.dumps(names).encode() + b"\n")
+        return Response()
+
+    def close(self):
+        os.close(self.fd)
+
+
+@pytest.mark.parametrize("batch_cls", (SpanBatch, TailSamplingSpanBatch))
+def test_reinit_clears_batch(batch_cls):
+    batch = batch_cls()
+    batch.record(Span("parent", parent_id="0" * 16))
+    batch._lock.acquire()
+
+    fork.reinit()
+
+    root = Span("child", {"error": True})
+    batch.record(root)
+    assert batch.flush()[0] == (root,)
+
+
+def test_reinit_clears_metric_batch():
+    batch = MetricBatch()
+    batch.record_count("parent", 1)
+    batch._lock.acquire()
+
+    fork.reinit()
+
+    batch.record_count("child", 1)
+    assert [metric["name"] for metric in batch.flush()[0]] == ["child"]
+
+
+def test_reinit_id_pool():
+    pool = IdPool(size=4)
+    first = pool.next_id()
+    pool._lock.acquire()
+
+    fork.reinit()
+
+    assert not pool._ids
+    assert pool.next_id() != first
+
+
+def test_reinit_buffer_pool():
+    pool = BufferPool()
+    pool.acquire()
+    pool._lock.acquire()
+
+    fork.reinit()
+
+    buffer = pool.acquire()
+    pool.release(buffer.view())
+    assert pool.acquire() is buffer
+
+
+def test_reinit_client():
+    client = SpanClient("license-key", compression_threads=2)
+    client.add_version_info("product", "1.0")
+    pool = client._pool
+    executor = client._compression_executor
+
+    fork.reinit()
+
+    assert client._pool is not pool
+    assert client._pool.host == pool.host
+    assert client._pool.headers["user-agent"].endswith(" product/1.0")
+    assert client._compression_executor is not executor
+    client.close()
+    executor.shutdown()
+
+
+def test_reinit_errors_are_logged(caplog):
+    class Broken:
+        def _after_fork(self):
+            raise RuntimeError("oops")
+
+    broken = Broken()
+    batch = SpanBatch()
+    fork.register(broken)
+    batch._lock.acquire()
+
+    fork.reinit()
+
+    assert "Failed to reinitialize" in caplog.text
+    batch.record(Span("span"))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="os.fork is not available")
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_harvester_restarts_in_child():
+    read_fd, write_fd = os.pipe()
+    batch = SpanBatch()
+    harvester = Harvester(PipeClient(write_fd), batch, harvest_interval=60)
+    harvester.start()
+    batch.record(Span("parent"))
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.close(read_fd)
+            batch.record(Span("child"))
+            restarted = harvester.is_alive()
+            harvester.stop(timeout=5)
+            code = 0 if restarted else 1
+        finally:
+            os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    harvester.stop(timeout=5)
+    with os.fdopen(read_fd, "rb") as pipe:
+        sent = [json.loads(line) for line in pipe]
+    assert sorted(sent) == [["child"], ["parent"]]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="os.fork is not available")
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_harvester_stop_in_child_without_records():
+    read_fd, write_fd = os.pipe()
+    harvester = Harvester(PipeClient(write_fd), MetricBatch(), harvest_interval=60)
+    harvester.start()
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            harvester.stop(timeout=5)
+            code = 0 if not harvester.is_alive() else 1
+        finally:
+            os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    harvester.stop(timeout=5)
+    os.close(read_fd)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="os.fork is not available")
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_harvesters_restart_in_child_recording_through_timers():
+    read_fd, write_fd = os.pipe()
+    span_batch = SpanBatch()
+    metric_batch = MetricBatch()
+    harvesters = [
+        Harvester(PipeClient(write_fd), span_batch, harvest_interval=60),
+        Harvester(PipeClient(os.dup(write_fd)), metric_batch, harvest_interval=60),
+    ]
+    for harvester in harvesters:
+        harvester.start()
+    span_timer = span_batch.timed("span.timer")
+    metric_timer = metric_batch.timed("metric.timer")
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.close(read_fd)
+            with span_timer:
+                pass
+            with metric_timer:
+                pass
+            restarted = all(harvester.is_alive() for harvester in harvesters)
+            for harvester in harvesters:
+                harvester.stop(timeout=5)
+            code = 0 if restarted else 1
+        finally:
+            os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    for harvester in harvesters:
+        harvester.stop(timeout=5)
+    with os.fdopen(read_fd, "rb") as pipe:
+        sent = [json.loads(line) for line in pipe]
+    assert sorted(sent) == [["metric.timer"], ["span.timer"]]
@@ -12,11 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
+import json
 import logging
 import time
+import zlib
 
 import pytest
 
+from newrelic_telemetry_sdk.client import EventClient, SpanClient
 from newrelic_telemetry_sdk.harvester import Harvester
 
 
@@ -217,3 +221,81 @@ def test_harvest_timing(harvester, monkeypatch):
 def test_defaults(harvester):
     assert harvester.daemon is True
     assert harvester.harvest_interval == 5
+
+
+class PayloadClient(SpanClient):
+    def __init__(self):
+        super().__init__("test-key")
+        self.payloads = []
+
+    def _send_payload(self, payload, timeout=None):
+        self.payloads.append(payload)
+        return Response()
+
+
+class PayloadEventClient(EventClient, PayloadClient):
+    pass
+
+
+class CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+    submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+def decompress(payload):
+    return json.loads(zlib.decompress(payload, 31))
+
+
+def test_offload_to_process_pool():
+    client = PayloadClient()
+    batch = FakeBatch()
+    items = [{"id": str(i), "attributes": {"n": i}} for i in range(100)]
+    for item in items:
+        batch.record(item)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+        harvester = Harvester(client, batch, executor=executor, offload_threshold_ms=0)
+        response = harvester._send()
+
+    assert response.ok
+    assert decompress(client.payloads[0]) == [{"spans": items}]
+
+
+def test_offload_cost_model():
+    client = PayloadClient()
+    batch = FakeBatch()
+
+    with CountingExecutor(max_workers=1) as executor:
+        harvester = Harvester(client, batch, executor=executor, offload_threshold_ms=10)
+        harvester._item_cost_ms = 0.001
+
+        # Small batches stay in process and refine the cost estimate
+        batch.record({"id": "1"})
+        harvester._send()
+        assert executor.submitted == 0
+        assert harvester._item_cost_ms != 0.001
+
+        harvester._item_cost_ms = 0.001
+        for i in range(10000):
+            batch.record({"id": str(i)})
+        harvester._send()
+        assert executor.submitted == 1
+        assert harvester._item_cost_ms == 0.001
+
+    assert [len(decompress(payload)[0]["spans"]) for payload in client.payloads] == [1, 10000]
+
+
+def test_offload_event_batch():
+    client = PayloadEventClient()
+    batch = FakeEventBatch()
+    batch.record({"eventType": "a"})
+
+    with CountingExecutor(max_workers=1) as executor:
+        harvester = Harvester(client, batch, executor=executor, offload_threshold_ms=0)
+        assert harvester._send().ok
+        assert executor.submitted == 1
+
+    assert decompress(client.payloads[0]) == [{"eventType": "a"}]
@@ -12,15 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import json
 import logging
 import os
 import sys
 import threading
+import traceback
 
 import pytest
 
-from newrelic_telemetry_sdk import Log, NewRelicLogFormatter
+from newrelic_telemetry_sdk import Log, LogRecordBatch, NewRelicLogFormatter, NewRelicLogHandler
+from newrelic_telemetry_sdk.log import LogRecordSnapshot, StackTraceCache
 
 
 class MyError(Exception):
@@ -156,3 +159,206 @@ def test_log_format(extras):
     }
     expected_output.update(extras)
     assert json.loads(output) == expected_output
+
+
+def test_log_handler_defers_conversion():
+    batch = LogRecordBatch()
+    logger = logging.getLogger("test_log_handler_defers_conversion")
+    logger.propagate = False
+    handler = NewRelicLogHandler(batch)
+    logger.addHandler(handler)
+    try:
+        logger.warning("Hello %s", "World", extra={"foo": "bar"})
+    finally:
+        logger.removeHandler(handler)
+
+    # Records are buffered as-is until the batch is flushed
+    (record,) = batch._records
+    assert isinstance(record, logging.LogRecord)
+
+    items, common = batch.flush()
+    assert common is None
+    (log,) = items
+    assert log["message"] == "Hello World"
+    assert log["attributes"]["foo"] == "bar"
+    assert log["attributes"]["log.level"] == "WARNING"
+    assert not batch._records
+
+
+def test_log_handler_filters():
+    batch = LogRecordBatch()
+    handler = NewRelicLogHandler(batch, level=logging.ERROR)
+    record = logging.makeLogRecord({"msg": "message", "levelno": logging.ERROR})
+
+    handler.addFilter(lambda r: r.msg != "filtered")
+    assert handler.handle(record)
+    assert not handler.handle(logging.makeLogRecord({"msg": "filtered"}))
+    assert len(batch.flush()[0]) == 1
+
+
+def test_log_handler_reports_batch_errors(capsys):
+    class BrokenBatch:
+        def record(self, record):
+            raise RuntimeError("broken batch")
+
+    handler = NewRelicLogHandler(BrokenBatch())
+    assert handler.handle(logging.makeLogRecord({"msg": "message"}))
+    assert "RuntimeError: broken batch" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "overflow,expected_messages", ((LogRecordBatch.DROP_NEWEST, ["0", "1"]), (LogRecordBatch.DROP_OLDEST, ["2", "3"]))
+)
+def test_log_record_batch_overflow(overflow, expected_messages):
+    batch = LogRecordBatch(tags={"foo": "bar"}, capacity=2, overflow=overflow)
+    for i in range(4):
+        batch.record(logging.makeLogRecord({"msg": str(i)}))
+
+    assert batch.dropped == 2
+
+    items, common = batch.flush()
+    assert common == {"attributes": {"foo": "bar"}}
+    assert [log["message"] for log in items[:-1]] == expected_messages
+
+    # Drops are reported once as a log message
+    assert items[-1]["attributes"]["dropped.count"] == 2
+    assert batch.flush()[0] == ()
+
+
+def test_log_record_batch_conversion_error():
+    batch = LogRecordBatch()
+    batch.record(logging.makeLogRecord({"msg": "%d", "args": ("not a number",)}))
+
+    (log,) = batch.flush()[0]
+    assert log["attributes"]["dropped.count"] == 1
+    assert batch.dropped == 1
+
+
+def test_log_record_batch_invalid_overflow():
+    with pytest.raises(ValueError, match="Invalid overflow policy"):
+        LogRecordBatch(overflow="block")
+
+
+def raise_error(message):
+    raise MyError(message)
+
+
+def raise_chained(style):
+    try:
+        raise_error("inner")
+    except MyError as e:
+        if style == "cause":
+            raise ValueError("outer") from e
+        if style == "suppressed":
+            raise ValueError("outer") from None
+        raise ValueError("outer")
+
+
+@pytest.mark.parametrize("style", ("simple", "cause", "context", "suppressed"))
+def test_stack_trace_cache_matches_traceback(style):
+    cache = StackTraceCache()
+    for _ in range(2):
+        try:
+            if style == "simple":
+                raise_error("uh oh")
+            raise_chained(style)
+        except Exception:
+            exc_info = sys.exc_info()
+
+        expected = io.StringIO()
+        traceback.print_exception(*exc_info, file=expected)
+        assert cache.format_exception(*exc_info) == expected.getvalue()
+
+
+def test_stack_trace_cache_reuses_rendered_frames(monkeypatch):
+    format_tb_calls = []
+    format_tb = traceback.format_tb
+
+    def _format_tb(tb):
+        format_tb_calls.append(tb)
+        return format_tb(tb)
+
+    monkeypatch.setattr(traceback, "format_tb", _format_tb)
+
+    def render(fn, message):
+        try:
+            fn(message)
+        except MyError:
+            return cache.format_exception(*sys.exc_info())
+
+    cache = StackTraceCache(maxsize=1)
+    stacks = [render(raise_error, "first"), render(raise_error, "second")]
+
+    assert len(format_tb_calls) == 1
+    assert stacks[0].endswith("MyError: first\n")
+    assert stacks[1].endswith("MyError: second\n")
+
+    # A different code path evicts the least recently used entry
+    try:
+        raise MyError("direct")
+    except MyError:
+        cache.format_exception(*sys.exc_info())
+
+    assert len(format_tb_calls) == 2
+    assert len(cache._cache) == 1
+
+    cache.clear()
+    assert not cache._cache
+
+
+def test_log_record_snapshot():
+    try:
+        raise_error("uh oh")
+    except MyError:
+        exc_info = sys.exc_info()
+
+    record_dict = dict(BASE_RECORD_DICT, msg="Hello %s", args=("World",), exc_info=exc_info, extra="extra")
+    record = logging.makeLogRecord(record_dict)
+    snapshot = LogRecordSnapshot(record)
+
+    assert not hasattr(snapshot, "__dict__")
+    assert Log.extract_record_data(snapshot) == Log.extract_record_data(record)
+    assert LogRecordSnapshot(logging.makeLogRecord({})).extras is None
+
+
+def test_log_record_batch_snapshot():
+    batch = LogRecordBatch(snapshot=True)
+    batch.record(logging.makeLogRecord({"msg": "Hello %s", "args": ("World",)}))
+
+    (snapshot,) = batch._records
+    assert isinstance(snapshot, LogRecordSnapshot)
+
+    (log,) = batch.flush()[0]
+    assert log["message"] == "Hello World"
+
+
+@pytest.mark.parametrize("snapshot", (False, True))
+def test_log_record_batch_dedup(snapshot):
+    batch = LogRecordBatch(capacity=2, dedup=True, snapshot=snapshot)
+    for i in range(5):
+        record = logging.makeLogRecord({"msg": "attempt %d failed", "args": (i,), "created": 1.0 + i})
+        batch.record(record)
+    batch.record(logging.makeLogRecord({"msg": "different", "created": 10.0}))
+    batch.record(logging.makeLogRecord({"msg": "over capacity", "created": 10.0}))
+
+    assert batch.dropped == 1
+
+    collapsed, different, dropped = batch.flush()[0]
+    assert collapsed["message"] == "attempt 0 failed"
+    assert collapsed["timestamp"] == 1000
+    assert collapsed["attributes"]["occurrences"] == 5
+    assert collapsed["attributes"]["first.timestamp"] == 1000
+    assert collapsed["attributes"]["last.timestamp"] == 5000
+    assert different["message"] == "different"
+    assert "occurrences" not in different["attributes"]
+    assert dropped["attributes"]["dropped.count"] == 1
+
+
+def test_log_record_batch_dedup_unhashable_message():
+    batch = LogRecordBatch(dedup=True)
+    for _ in range(2):
+        batch.record(logging.makeLogRecord({"msg": {"a": 1}}))
+
+    (log,) = batch.flush()[0]
+    assert log["message"] == "{'a': 1}"
+    assert log["attributes"]["occurrences"] == 2
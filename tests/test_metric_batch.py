@@ -17,7 +17,7 @@ import time
 import pytest
 from utils import CustomMapping
 
-from newrelic_telemetry_sdk.metric_batch import MetricBatch
+from newrelic_telemetry_sdk.metric_batch import MetricBatch, _SeriesCache
 
 
 class VerifyLockMetricBatch(MetricBatch):
@@ -168,3 +168,55 @@ def test_flush(monkeypatch, tags):
 
     # Verify that we don't return the same objects twice
     assert batch.flush()[1] is not common
+
+
+def test_timed_context_manager(monkeypatch):
+    ticks = iter((1_000_000, 3_500_000))
+    monkeypatch.setattr(time, "perf_counter_ns", lambda: next(ticks))
+
+    batch = VerifyLockMetricBatch()
+    with batch.timed("duration", {"foo": "bar"}):
+        pass
+
+    identity = MetricBatch.create_identity("duration", {"foo": "bar"}, "summary")
+    assert batch._internal_batch == {identity: {"count": 1, "sum": 2.5, "min": 2.5, "max": 2.5}}
+
+
+def test_timed_decorator(monkeypatch):
+    ticks = iter((0, 1_000_000, 0, 3_000_000))
+    monkeypatch.setattr(time, "perf_counter_ns", lambda: next(ticks))
+
+    batch = VerifyLockMetricBatch()
+
+    @batch.timed("duration")
+    def work(value):
+        if value is None:
+            raise ValueError("oops")
+        return value
+
+    assert work(1) == 1
+    with pytest.raises(ValueError):
+        work(None)
+
+    identity = MetricBatch.create_identity("duration", None, "summary")
+    assert batch._internal_batch == {identity: {"count": 2, "sum": 4.0, "min": 1.0, "max": 3.0}}
+
+
+def test_series_cache():
+    created = []
+
+    def create(key):
+        created.append(key)
+        return len(created)
+
+    cache = _SeriesCache(create, max_series=2)
+    assert cache.get("a") == cache.get("a") == 1
+    assert cache.get("b") == 2
+    # The cache is full, so it is cleared before c is added
+    assert cache.get("c") == 3
+    assert len(cache) == 1
+    assert cache.get("a") == 4
+
+    assert cache.get(("x", {}), ("x",)) == cache.get(("x",)) == 5
+    with pytest.raises(TypeError):
+        cache.get(("x", {}))
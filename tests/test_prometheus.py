@@ -0,0 +1,229 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.server
+import threading
+
+import pytest
+
+from newrelic_telemetry_sdk.metric_batch import MetricBatch
+from newrelic_telemetry_sdk.prometheus import PrometheusScraper, _lines
+
+HISTOGRAM = """\
+# HELP latency_seconds Request latency.
+# TYPE latency_seconds histogram
+latency_seconds_bucket{{route="/",le="0.1"}} {0}
+latency_seconds_bucket{{route="/",le="0.5"}} {1}
+latency_seconds_bucket{{route="/",le="1"}} {2}
+latency_seconds_bucket{{route="/",le="+Inf"}} {3}
+latency_seconds_sum{{route="/"}} {4}
+latency_seconds_count{{route="/"}} {3}
+"""
+
+
+def flush(batch):
+    return {(item["name"], item.get("type")): item for item in batch.flush()[0]}
+
+
+def record(scraper, text):
+    scraper.record(text.splitlines())
+
+
+def test_counter_deltas():
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, [])
+    text = '# TYPE requests_total counter\nrequests_total{{code="200"}} {}\nrequests_total{{code="500"}} 3\n'
+
+    record(scraper, text.format(10))
+    assert flush(batch) == {}
+
+    record(scraper, text.format(25.5))
+    metrics = flush(batch)
+    assert list(metrics) == [("requests_total", "count")]
+    assert metrics["requests_total", "count"]["value"] == 15.5
+    assert metrics["requests_total", "count"]["attributes"] == {"code": "200"}
+
+    # The counter was reset and counted up to 4 since the last scrape
+    record(scraper, text.format(4))
+    assert flush(batch)["requests_total", "count"]["value"] == 4
+
+
+def test_gauges_and_untyped():
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, [])
+    record(scraper, "# TYPE temperature gauge\ntemperature 21.5 1600000000000\nuptime 30\nbroken NaN\n")
+    metrics = flush(batch)
+    assert metrics["temperature", None]["value"] == 21.5
+    assert metrics["uptime", None]["value"] == 30
+    assert ("broken", None) not in metrics
+
+
+def test_label_escapes():
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, [])
+    record(scraper, 'info{path="C:\\\\temp",quote="say \\"hi\\"",brace="}",empty=""} 1\n')
+    (item,) = batch.flush()[0]
+    assert item["attributes"] == {"path": "C:\\temp", "quote": 'say "hi"', "brace": "}", "empty": ""}
+
+
+def test_histogram_summary():
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, [])
+    record(scraper, HISTOGRAM.format(1, 2, 2, 2, 0.4))
+    assert flush(batch) == {}
+
+    # One observation in (0.1, 0.5] and two in (1, +Inf)
+    record(scraper, HISTOGRAM.format(1, 3, 3, 5, 3.9))
+    metrics = flush(batch)
+    assert list(metrics) == [("latency_seconds", "summary")]
+    summary = metrics["latency_seconds", "summary"]
+    assert summary["attributes"] == {"route": "/"}
+    # The maximum is at least the mean when the +Inf bucket received observations
+    assert summary["value"] == {"count": 3, "sum": pytest.approx(3.5), "min": 0.1, "max": pytest.approx(3.5 / 3)}
+
+    # No observations
+    record(scraper, HISTOGRAM.format(1, 3, 3, 5, 3.9))
+    assert flush(batch) == {}
+
+
+def test_summary_type():
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, [])
+    text = (
+        "# TYPE rpc_seconds summary\n"
+        'rpc_seconds{{quantile="0.5"}} 0.2\n'
+        'rpc_seconds{{quantile="0.99"}} 0.9\n'
+        "rpc_seconds_sum {0}\n"
+        "rpc_seconds_count {1}\n"
+    )
+    record(scraper, text.format(10, 20))
+    record(scraper, text.format(12, 30))
+    items = batch.flush()[0]
+    gauges = {item["attributes"]["quantile"]: item["value"] for item in items if item["name"] == "rpc_seconds"}
+    assert gauges == {"0.5": 0.2, "0.99": 0.9}
+    counts = {item["name"]: item["value"] for item in items if item.get("type") == "count"}
+    assert counts == {"rpc_seconds_sum": 2, "rpc_seconds_count": 10}
+
+
+def test_invalid_lines():
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, [])
+    record(scraper, 'good 1\nno_value\nbad_value{a="b"} x\n# a comment\n\ngood_too 2\n')
+    assert scraper.invalid == 2
+    assert {item["name"] for item in batch.flush()[0]} == {"good", "good_too"}
+
+
+def test_state_forgets_missing_series():
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, [])
+    record(scraper, "# TYPE a counter\na 1\nb 1\n")
+    record(scraper, "b 1\n")
+    assert set(scraper._targets[None].state) == {"b"}
+
+    # a is recorded again from its next scrape, not from its old value
+    record(scraper, "# TYPE a counter\na 5\n")
+    assert ("a", "count") not in flush(batch)
+    record(scraper, "# TYPE a counter\na 7\n")
+    assert flush(batch)["a", "count"]["value"] == 2
+
+
+def test_interrupted_scrape_is_not_recorded_twice():
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, [])
+    record(scraper, "# TYPE a_total counter\na_total 10\n# TYPE b_total counter\nb_total 10\n")
+
+    def interrupted():
+        yield "# TYPE a_total counter"
+        yield "a_total 20"
+        raise ConnectionResetError
+
+    with pytest.raises(ConnectionResetError):
+        scraper.record(interrupted())
+    assert flush(batch)["a_total", "count"]["value"] == 10
+
+    record(scraper, "# TYPE a_total counter\na_total 30\n# TYPE b_total counter\nb_total 15\n")
+    assert {name: item["value"] for (name, _), item in flush(batch).items()} == {"a_total": 10, "b_total": 5}
+
+
+class FakeResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def stream(self, amt):
+        return iter(self.chunks)
+
+
+def test_lines_are_split_across_chunks():
+    data = 'temperature{city="Zürich"} 21\nuptime 30'.encode()
+    split = data.index(b"\xc3") + 1
+    chunks = [data[:5], data[5:split], data[split:]]
+    assert list(_lines(FakeResponse(chunks))) == ['temperature{city="Zürich"} 21', "uptime 30"]
+
+
+EXPOSITIONS = {"/a": "# TYPE jobs_total counter\njobs_total 1\n", "/b": "# TYPE jobs_total counter\njobs_total 2\n"}
+
+
+class ExpositionHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = EXPOSITIONS.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ExpositionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_scrape(server, caplog, monkeypatch):
+    host, port = server.server_address
+    urls = [f"http://{host}:{port}/{path}" for path in ("a", "b", "missing")]
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, urls)
+
+    scraper.scrape()
+    monkeypatch.setitem(EXPOSITIONS, "/a", "# TYPE jobs_total counter\njobs_total 4\n")
+    scraper.scrape()
+
+    items = batch.flush()[0]
+    assert [(item["name"], item["value"], item["attributes"]) for item in items] == [
+        ("jobs_total", 3, {"instance": f"{host}:{port}"})
+    ]
+    assert "status code: 404" in caplog.text
+
+
+def test_scraper_thread(server):
+    host, port = server.server_address
+    batch = MetricBatch()
+    scraper = PrometheusScraper(batch, [f"http://{host}:{port}/b"], scrape_interval=0.01)
+    scraper.start()
+    scraper.stop(timeout=5)
+    assert not scraper.is_alive()
+    assert scraper._targets[f"http://{host}:{port}/b"].state
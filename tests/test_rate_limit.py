@@ -0,0 +1,142 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import time
+
+import pytest
+
+from newrelic_telemetry_sdk.batch import LogBatch, LogRecordBatch
+from newrelic_telemetry_sdk.log import Log
+from newrelic_telemetry_sdk.rate_limit import LogRateLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(2)
+    assert bucket.capacity == 2
+    assert [bucket.consume(now=0) for _ in range(3)] == [True, True, False]
+
+    # Half a second adds one token
+    assert bucket.consume(now=0.5)
+    assert not bucket.consume(now=0.5)
+
+    # Tokens never exceed the capacity
+    assert [bucket.consume(now=60) for _ in range(3)] == [True, True, False]
+
+
+def test_token_bucket_large_amount_passes_when_full():
+    bucket = TokenBucket(10)
+    assert bucket.consume(25, now=0)
+    assert not bucket.consume(1, now=0)
+
+    # The debt is paid back before more tokens are available
+    assert not bucket.consume(1, now=1.5)
+    assert bucket.consume(1, now=2.6)
+
+
+def test_token_bucket_zero_rate():
+    bucket = TokenBucket(0)
+    assert not bucket.consume(now=0)
+    assert not bucket.consume(now=100)
+
+
+def test_logger_rates(clock):
+    limiter = LogRateLimiter(logger_rate=1, logger_rates={"chatty": 2, "trusted": None})
+
+    assert [limiter.allow("app", "INFO") for _ in range(2)] == [True, False]
+    assert [limiter.allow("chatty", "INFO") for _ in range(3)] == [True, True, False]
+    assert all(limiter.allow("trusted", "INFO") for _ in range(10))
+
+    # Each logger has its own bucket
+    assert limiter.allow("other", "INFO")
+
+    clock[0] += 1
+    assert limiter.allow("app", "INFO")
+
+
+def test_level_and_bytes_rates(clock):
+    limiter = LogRateLimiter(level_rates={"DEBUG": 1}, bytes_per_second=100)
+
+    assert limiter.allow("a", "DEBUG", 10)
+    assert not limiter.allow("b", "DEBUG", 10)
+    assert limiter.allow("a", "INFO", 90)
+    assert not limiter.allow("a", "INFO", 10)
+
+
+def test_suppressed_logs_do_not_drain_other_limits(clock):
+    limiter = LogRateLimiter(logger_rate=5, level_rates={"DEBUG": 1}, bytes_per_second=100)
+
+    # A DEBUG flood is suppressed by the level limit only
+    assert [limiter.allow("app", "DEBUG", 10) for _ in range(20)] == [True] + [False] * 19
+    # A message over the byte limit is suppressed
+    assert limiter.allow("app", "INFO", 90)
+    assert not limiter.allow("app", "INFO", 90)
+
+    # The logger and bytes budgets still have room for the rest
+    assert [limiter.allow("app", "ERROR") for _ in range(4)] == [True, True, True, False]
+
+
+def test_token_bucket_refund():
+    bucket = TokenBucket(1, capacity=2)
+    assert bucket.consume(2, now=0)
+    bucket.refund(2)
+    assert bucket.consume(2, now=0)
+
+    # Refunds never fill the bucket over its capacity
+    bucket.refund(5)
+    assert bucket.consume(2, now=0)
+    assert not bucket.consume(1, now=0)
+
+
+def test_summaries(clock):
+    limiter = LogRateLimiter(logger_rate=1)
+    for _ in range(3):
+        limiter.allow("app", "INFO")
+    limiter.allow("app", "ERROR")
+
+    summaries = sorted(limiter.summaries(), key=lambda log: log["attributes"]["suppressed.log.level"])
+    assert [log["attributes"]["suppressed.count"] for log in summaries] == [1, 2]
+    assert summaries[0]["attributes"]["suppressed.logger.name"] == "app"
+    assert summaries[0]["attributes"]["suppressed.log.level"] == "ERROR"
+    assert not limiter.summaries()
+
+
+def test_log_batch_rate_limit(clock):
+    batch = LogBatch(rate_limiter=LogRateLimiter(logger_rate=1))
+    for message in ("first", "second"):
+        batch.record(Log(message, **{"logger.name": "app", "log.level": "INFO"}))
+
+    first, summary = batch.flush()[0]
+    assert first["message"] == "first"
+    assert summary["attributes"]["suppressed.count"] == 1
+
+
+@pytest.mark.parametrize("dedup", (False, True))
+def test_log_record_batch_rate_limit(clock, dedup):
+    batch = LogRecordBatch(rate_limiter=LogRateLimiter(level_rates={"DEBUG": 1}), dedup=dedup)
+    for message in ("first", "second"):
+        batch.record(logging.makeLogRecord({"msg": message, "levelname": "DEBUG"}))
+    batch.record(logging.makeLogRecord({"msg": "info", "levelname": "INFO"}))
+
+    first, info, summary = batch.flush()[0]
+    assert first["message"] == "first"
+    assert info["message"] == "info"
+    assert summary["attributes"]["suppressed.log.level"] == "DEBUG"
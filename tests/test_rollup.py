@@ -0,0 +1,94 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from newrelic_telemetry_sdk.batch import EventBatch
+from newrelic_telemetry_sdk.compact import CompactEvent
+from newrelic_telemetry_sdk.event import Event
+from newrelic_telemetry_sdk.metric_batch import MetricBatch
+from newrelic_telemetry_sdk.rollup import EventRollup
+
+
+def flush_metrics(batch):
+    return {
+        (metric["name"], tuple(sorted(metric.get("attributes", {}).items()))): metric["value"]
+        for metric in batch.flush()[0]
+    }
+
+
+@pytest.mark.parametrize("event_cls", (Event, CompactEvent))
+def test_event_rollup(event_cls):
+    metric_batch = MetricBatch()
+    rollup = EventRollup(
+        metric_batch, "CacheLookup", attributes=("cache", "missing"), values=("duration", "size"), name="cache"
+    )
+
+    for duration in (1, 5, 3):
+        assert rollup.record(event_cls("CacheLookup", {"cache": "users", "duration": duration})) is None
+    assert rollup.record(event_cls("CacheLookup", {"cache": "orders", "duration": "slow", "size": True})) is None
+
+    users = (("cache", "users"),)
+    orders = (("cache", "orders"),)
+    assert flush_metrics(metric_batch) == {
+        ("cache.count", users): 3,
+        ("cache.duration", users): {"count": 3, "sum": 9, "min": 1, "max": 5},
+        ("cache.count", orders): 1,
+    }
+
+
+def test_event_rollup_sampling():
+    rollup = EventRollup(MetricBatch(), "PageView", sample_rate=0.25)
+    event = Event("PageView", {"page": "/"}, timestamp_ms=1000)
+    kept = [rollup.record(event) for _ in range(10000)]
+    kept = [item for item in kept if item is not None]
+
+    assert abs(len(kept) / 10000 - 0.25) < 0.05
+    assert kept[0] == {"eventType": "PageView", "timestamp": 1000, "page": "/", "sampleRate": 0.25}
+    assert "sampleRate" not in event
+
+
+def test_event_rollup_keeps_all():
+    event = Event("PageView")
+    assert EventRollup(MetricBatch(), "PageView", sample_rate=1).record(event)["sampleRate"] == 1
+
+
+@pytest.mark.parametrize("rate", (-0.1, 1.1))
+def test_event_rollup_invalid_rate(rate):
+    with pytest.raises(ValueError, match="Invalid sample rate"):
+        EventRollup(MetricBatch(), "PageView", sample_rate=rate)
+
+
+def test_event_rollup_unhashable_attribute():
+    metric_batch = MetricBatch()
+    rollup = EventRollup(metric_batch, "PageView", attributes=("page",))
+    rollup.record(Event("PageView", {"page": ["/"]}))
+    assert flush_metrics(metric_batch) == {("PageView.count", ()): 1}
+
+
+def test_event_batch_rollups():
+    metric_batch = MetricBatch()
+    batch = EventBatch(
+        rollups=[EventRollup(metric_batch, "PageView"), EventRollup(metric_batch, "CacheLookup", sample_rate=1)]
+    )
+    purchase = Event("Purchase")
+    batch.record(Event("PageView"))
+    batch.record(purchase)
+    batch.record(Event("CacheLookup"))
+
+    (items,) = batch.flush()
+    assert len(items) == 2
+    assert items[0] is purchase
+    assert items[1]["sampleRate"] == 1
+    assert flush_metrics(metric_batch) == {("PageView.count", ()): 1, ("CacheLookup.count", ()): 1}
@@ -0,0 +1,177 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from newrelic_telemetry_sdk.batch import EventBatch, SpanBatch, TailSamplingSpanBatch
+from newrelic_telemetry_sdk.compact import CompactEvent, CompactSpan
+from newrelic_telemetry_sdk.event import Event
+from newrelic_telemetry_sdk.metric_batch import MetricBatch
+from newrelic_telemetry_sdk.rollup import EventRollup
+from newrelic_telemetry_sdk.sampling import EventSampler, HeadSampler
+from newrelic_telemetry_sdk.span import NOOP_SPAN, Span
+
+
+@pytest.mark.parametrize("rate", (0.0, 0.1, 0.5, 1.0))
+def test_head_sampler_rate(rate):
+    sampler = HeadSampler(rate)
+    sampled = sum(sampler.span("name") is not NOOP_SPAN for _ in range(10000))
+    assert abs(sampled / 10000 - rate) < 0.05
+
+
+@pytest.mark.parametrize("trace_id", ("0123456789abcdef", "00000000000000000123456789abcdef", "not-hex", 12345))
+def test_head_sampler_is_deterministic(trace_id):
+    decisions = {HeadSampler(0.5).is_sampled(trace_id) for _ in range(10)}
+    assert len(decisions) == 1
+
+
+def test_head_sampler_threshold():
+    sampler = HeadSampler(0.25)
+    assert sampler.is_sampled("3fffffffffffffff")
+    assert not sampler.is_sampled("4000000000000000")
+    assert not HeadSampler(0).is_sampled("0000000000000000")
+    assert HeadSampler(1).is_sampled("ffffffffffffffff")
+
+
+@pytest.mark.parametrize("span_cls", (Span, CompactSpan))
+def test_head_sampler_children_inherit(span_cls):
+    sampler = HeadSampler(0.5, span_cls=span_cls)
+    root = sampler.span("root", {"foo": "bar"}, trace_id="0" * 16, start_time_ms=1000)
+    assert isinstance(root, span_cls)
+    assert root["attributes"] == {"name": "root", "foo": "bar", "sampleRate": 0.5}
+    assert root["timestamp"] == 1000
+
+    child = sampler.span("child", parent=root)
+    assert child["trace.id"] == root["trace.id"]
+    assert child["attributes"]["parent.id"] == root["id"]
+
+    unsampled = sampler.span("root", trace_id="f" * 16)
+    assert unsampled is NOOP_SPAN
+    assert sampler.span("child", parent=unsampled) is NOOP_SPAN
+
+
+def test_head_sampler_full_rate_omits_sample_rate():
+    span = HeadSampler(1.0).span("name")
+    assert "sampleRate" not in span["attributes"]
+
+
+@pytest.mark.parametrize("rate", (-0.1, 1.1))
+def test_head_sampler_invalid_rate(rate):
+    with pytest.raises(ValueError, match="Invalid sample rate"):
+        HeadSampler(rate)
+
+
+def test_noop_span():
+    with NOOP_SPAN as span:
+        span.finish()
+    assert not span
+    assert not hasattr(span, "__dict__")
+
+
+def test_noop_span_mapping():
+    NOOP_SPAN["attributes"]["error"] = True
+    NOOP_SPAN["attributes"] = {"error": True}
+    NOOP_SPAN["timestamp"] = 1
+    assert NOOP_SPAN["attributes"] == {}
+    assert NOOP_SPAN.get("attributes") == {}
+    assert NOOP_SPAN["timestamp"] is None
+    assert NOOP_SPAN["id"] is None
+    assert NOOP_SPAN.get("id") is None
+    assert NOOP_SPAN.get("id", "default") == "default"
+
+
+def test_noop_span_is_empty():
+    assert "id" not in NOOP_SPAN
+    assert "attributes" not in NOOP_SPAN
+    assert dict(NOOP_SPAN) == {}
+    assert len(NOOP_SPAN) == 0
+    assert list(NOOP_SPAN) == []
+    assert list(NOOP_SPAN.items()) == []
+    assert list(NOOP_SPAN.keys()) == list(NOOP_SPAN.values()) == []
+    assert {**NOOP_SPAN} == {}
+
+
+@pytest.mark.parametrize("batch_cls", (SpanBatch, TailSamplingSpanBatch))
+def test_span_batches_discard_noop_span(batch_cls):
+    batch = batch_cls()
+    batch.record(NOOP_SPAN)
+    assert batch.flush()[0] == ()
+
+
+def test_event_sampler_consistent():
+    sampler = EventSampler(key="session.id", rate=0.5)
+    sessions = [f"session-{i}" for i in range(1000)]
+    first = {session for session in sessions if sampler.sample(Event("PageView", {"session.id": session}))}
+    second = {session for session in sessions if sampler.sample(Event("Click", {"session.id": session}))}
+    assert first == second
+    assert abs(len(first) / 1000 - 0.5) < 0.05
+
+    lower = EventSampler(key="session.id", rate=0.25)
+    assert {session for session in sessions if lower.sample(Event("PageView", {"session.id": session}))} < first
+
+
+def test_event_sampler_annotates_copy():
+    sampler = EventSampler(keys={"PageView": "page"}, rate=0.5)
+    event = Event("PageView", {"page": "/a"}, timestamp_ms=1000)
+    kept = next(
+        filter(None, (sampler.sample(Event("PageView", {"page": f"/{i}"}, timestamp_ms=1000)) for i in range(100)))
+    )
+    assert kept["sampleRate"] == 0.5
+    assert "sampleRate" not in event
+
+    sampler = EventSampler(key="page")
+    assert sampler.sample(event) is event
+
+
+def test_event_sampler_missing_key_is_random():
+    sampler = EventSampler(key="session.id", rate=0.5)
+    kept = sum(sampler.sample(CompactEvent("PageView")) is not None for _ in range(10000))
+    assert abs(kept / 10000 - 0.5) < 0.05
+
+
+@pytest.mark.parametrize("rate", (-0.1, 1.1))
+def test_event_sampler_invalid_rate(rate):
+    with pytest.raises(ValueError, match="Invalid sample rate"):
+        EventSampler(rate=rate)
+
+
+def test_event_sampler_budget():
+    sampler = EventSampler(key="id", budget=100)
+    batch = EventBatch(sampler=sampler)
+
+    for harvest in range(3):
+        for i in range(1000):
+            batch.record(Event("Request", {"id": f"{harvest}-{i}"}))
+        batch.record(Event("Rare"))
+        (items,) = batch.flush()
+        requests = [item for item in items if item["eventType"] == "Request"]
+        if harvest == 0:
+            assert len(requests) == 1000
+        else:
+            assert 70 < len(requests) < 130
+            assert all(item["sampleRate"] == 0.1 for item in requests)
+        assert sum(item["eventType"] == "Rare" for item in items) == 1
+
+    assert sampler.rate_for("Request") == 0.1
+    assert sampler.rate_for("Rare") == 1.0
+    assert sampler.rate_for("Other") == 1.0
+
+
+def test_event_batch_rollup_before_sampler():
+    metric_batch = MetricBatch()
+    batch = EventBatch(rollups=[EventRollup(metric_batch, "PageView")], sampler=EventSampler(rate=0))
+    batch.record(Event("PageView"))
+    batch.record(Event("Click"))
+    assert batch.flush() == ((),)
+    assert len(metric_batch.flush()[0]) == 1
@@ -0,0 +1,130 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import os
+
+import pytest
+
+from newrelic_telemetry_sdk.shared_metric_batch import SharedMemoryMetricBatch
+
+fork_only = pytest.mark.skipif(not hasattr(os, "fork"), reason="os.fork is not available")
+
+
+@pytest.fixture
+def batch():
+    batch = SharedMemoryMetricBatch({"host": "a"}, capacity=8, max_key_size=64, stripes=4)
+    yield batch
+    batch.close()
+
+
+def by_name(items):
+    return {item["name"]: item for item in items}
+
+
+def test_record_and_flush(batch):
+    batch.record_count("count", 1, {"foo": "bar"})
+    batch.record_count("count", 2.5, {"foo": "bar"})
+    batch.record_gauge("gauge", 1)
+    batch.record_gauge("gauge", 7)
+    batch.record_summary("summary", 2)
+    batch.record_summary("summary", 1)
+    batch.record_summary("summary", 4)
+    with batch.timed("timed"):
+        pass
+
+    items, common = batch.flush()
+    items = by_name(items)
+    assert items["count"] == {"name": "count", "type": "count", "attributes": {"foo": "bar"}, "value": 3.5}
+    assert items["gauge"]["value"] == 7
+    assert "timestamp" in items["gauge"]
+    assert items["summary"]["value"] == {"count": 3, "sum": 7, "min": 1, "max": 4}
+    assert items["timed"]["value"]["count"] == 1
+    assert common["attributes"] == {"host": "a"}
+    assert common["interval.ms"] >= 0
+
+    assert batch.flush()[0] == ()
+
+
+def test_overflow_is_recorded_locally(batch):
+    for i in range(10):
+        batch.record_count(f"count.{i}", 1)
+    batch.record_count("x" * 100, 1)
+    batch.record_count("tagged", 1, {"value": object()})
+
+    items = batch.flush()[0]
+    assert len(items) == 12
+    assert all(item["value"] == 1 for item in items)
+
+
+def record(batch, worker):
+    for _ in range(1000):
+        batch.record_count("requests", 1)
+        batch.record_summary("duration", worker)
+    batch.record_gauge(f"worker.{worker}", worker)
+
+
+@fork_only
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_workers_share_series(batch):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=record, args=(batch, worker)) for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    items = by_name(batch.flush()[0])
+    assert items["requests"]["value"] == 4000
+    assert items["duration"]["value"] == {"count": 4000, "sum": 6000, "min": 0, "max": 3}
+    assert {name for name in items if name.startswith("worker.")} == {f"worker.{i}" for i in range(4)}
+
+
+def flush_in_child(batch, queue):
+    batch.record_count("child", 1)
+    queue.put((batch.is_leader(), [item["name"] for item in batch.flush()[0]]))
+
+
+@fork_only
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_only_leader_flushes_shared_series(batch):
+    batch.record_count("parent", 1)
+    assert batch.is_leader()
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    worker = context.Process(target=flush_in_child, args=(batch, queue))
+    worker.start()
+    is_leader, names = queue.get(timeout=10)
+    worker.join()
+
+    assert not is_leader
+    assert names == []
+    assert sorted(item["name"] for item in batch.flush()[0]) == ["child", "parent"]
+
+
+@fork_only
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_leader_is_replaced_after_exit(batch):
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    worker = context.Process(target=flush_in_child, args=(batch, queue))
+    worker.start()
+    is_leader, names = queue.get(timeout=10)
+    worker.join()
+
+    assert is_leader
+    assert names == ["child"]
+    assert batch.is_leader()
@@ -0,0 +1,90 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from newrelic_telemetry_sdk.batch import SpanBatch, TailSamplingSpanBatch
+from newrelic_telemetry_sdk.compact import CompactSpan
+from newrelic_telemetry_sdk.metric_batch import MetricBatch
+from newrelic_telemetry_sdk.span import NOOP_SPAN, Span
+from newrelic_telemetry_sdk.span_metrics import SpanMetrics
+
+
+def flush_metrics(batch):
+    return {
+        (metric["name"], tuple(sorted(metric["attributes"].items()))): metric["value"] for metric in batch.flush()[0]
+    }
+
+
+@pytest.mark.parametrize("span_cls", (Span, CompactSpan))
+def test_span_metrics(span_cls):
+    metric_batch = MetricBatch()
+    span_metrics = SpanMetrics(metric_batch, attributes=("db", "missing"), prefix="db")
+
+    span_metrics.record(span_cls("query", {"db": "users"}, duration_ms=5))
+    span_metrics.record(span_cls("query", {"db": "users", "error.class": "builtins.ValueError"}, duration_ms=1))
+    span_metrics.record(span_cls("query", {"db": "users", "error": True}, duration_ms=9))
+    span_metrics.record(span_cls("query", {"db": "users", "error": False}, duration_ms=3))
+    span_metrics.record(span_cls("query", {"db": "orders"}))
+
+    users = (("db", "users"), ("span.name", "query"))
+    orders = (("db", "orders"), ("span.name", "query"))
+    assert flush_metrics(metric_batch) == {
+        ("db.count", users): 4,
+        ("db.errors", users): 2,
+        ("db.duration", users): {"count": 4, "sum": 18, "min": 1, "max": 9},
+        ("db.count", orders): 1,
+    }
+
+
+def test_span_metrics_unhashable_attribute():
+    metric_batch = MetricBatch()
+    span_metrics = SpanMetrics(metric_batch, attributes=("args",))
+    span_metrics.record(Span("query", {"args": [1]}, duration_ms=1))
+    span_metrics.record(Span("query", {"args": 1}, duration_ms=1))
+
+    metrics = flush_metrics(metric_batch)
+    assert metrics[("span.count", (("span.name", "query"),))] == 1
+    assert metrics[("span.count", (("args", 1), ("span.name", "query")))] == 1
+
+
+def test_span_metrics_max_series():
+    metric_batch = MetricBatch()
+    span_metrics = SpanMetrics(metric_batch, max_series=2)
+    for name in ("a", "b", "c", "a"):
+        span_metrics.record(Span(name, duration_ms=1))
+
+    assert len(span_metrics._identities) <= 2
+    metrics = flush_metrics(metric_batch)
+    assert metrics[("span.count", (("span.name", "a"),))] == 2
+
+
+def test_span_batch_metrics():
+    metric_batch = MetricBatch()
+    batch = SpanBatch(metrics=SpanMetrics(metric_batch))
+    batch.record(Span("work", duration_ms=1))
+    batch.record(NOOP_SPAN)
+
+    assert len(batch.flush()[0]) == 1
+    assert flush_metrics(metric_batch)[("span.count", (("span.name", "work"),))] == 1
+
+
+def test_tail_sampling_span_batch_metrics():
+    metric_batch = MetricBatch()
+    batch = TailSamplingSpanBatch(metrics=SpanMetrics(metric_batch))
+    for _ in range(3):
+        batch.record(Span("work", duration_ms=1))
+
+    assert batch.flush()[0] == ()
+    assert flush_metrics(metric_batch)[("span.count", (("span.name", "work"),))] == 3
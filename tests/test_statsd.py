@@ -0,0 +1,175 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+from newrelic_telemetry_sdk.metric_batch import MetricBatch
+from newrelic_telemetry_sdk.statsd import StatsdListener, StatsdParser
+
+
+def parse(*lines):
+    batch = MetricBatch()
+    parser = StatsdParser(batch)
+    parser.parse("\n".join(lines).encode())
+    items = batch.flush()[0]
+    return parser, {(item["name"], item.get("type")): item for item in items}
+
+
+def test_parse_types():
+    _, metrics = parse(
+        "hits:1|c",
+        "hits:2|c",
+        "temperature:21.5|g",
+        "latency:10|ms",
+        "latency:30|ms",
+        "size:5|h",
+        "size:7|d",
+        "users:a|s",
+        "users:b|s",
+        "users:a|s",
+    )
+    assert metrics["hits", "count"]["value"] == 3
+    assert metrics["temperature", None]["value"] == 21.5
+    assert metrics["latency", "summary"]["value"] == {"count": 2, "sum": 40, "min": 10, "max": 30}
+    assert metrics["size", "summary"]["value"] == {"count": 2, "sum": 12, "min": 5, "max": 7}
+    assert metrics["users", None]["value"] == 2
+
+
+def test_parse_tags():
+    _, metrics = parse("hits:1|c|#env:prod,canary", "hits:1|c|#env:prod,canary|c:container")
+    item = metrics["hits", "count"]
+    assert item["value"] == 2
+    assert item["attributes"] == {"env": "prod", "canary": ""}
+
+
+def test_parse_sample_rate():
+    _, metrics = parse("hits:1|c|@0.1", "latency:10|ms|@0.25|#env:prod")
+    assert metrics["hits", "count"]["value"] == 10
+    assert metrics["latency", "summary"]["value"] == {"count": 4, "sum": 40, "min": 10, "max": 10}
+
+
+def test_parse_multiple_values():
+    _, metrics = parse("latency:1:2:3|ms", "hits:1:1|c")
+    assert metrics["latency", "summary"]["value"]["count"] == 3
+    assert metrics["hits", "count"]["value"] == 2
+
+
+def test_parse_relative_gauge():
+    batch = MetricBatch()
+    parser = StatsdParser(batch)
+    parser.parse(b"queue:10|g\nqueue:+5|g\nqueue:-3|g")
+    assert batch.flush()[0][0]["value"] == 12
+    parser.parse(b"queue:-2|g")
+    assert batch.flush()[0][0]["value"] == 10
+
+
+def test_parse_invalid_lines():
+    parser, metrics = parse(
+        "hits:1|c", "no value", "hits:x|c", "hits:1|unknown", "hits:1|c|@0", "_e{5,4}:title|text", "_sc|check|0", ""
+    )
+    assert parser.invalid == 4
+    assert metrics["hits", "count"]["value"] == 1
+
+
+def test_parser_series_cache_is_bounded():
+    batch = MetricBatch()
+    parser = StatsdParser(batch, max_series=2)
+    parser.parse(b"a:1|c\nb:1|c\nc:1|c\na:1|c")
+    assert len(parser._series) <= 2
+    assert {item["name"]: item["value"] for item in batch.flush()[0]} == {"a": 2, "b": 1, "c": 1}
+
+
+def test_parser_cache_keeps_gauges():
+    batch = MetricBatch()
+    parser = StatsdParser(batch, max_series=1)
+    parser.parse(b"queue:10|g\nother:1|c\nqueue:+5|g")
+    assert {item["name"]: item["value"] for item in batch.flush()[0]} == {"queue": 15, "other": 1}
+
+
+def test_parser_gauges_are_bounded():
+    batch = MetricBatch()
+    parser = StatsdParser(batch, max_series=2)
+    parser.parse(b"a:1|g\nb:1|g\na:+1|g\nc:1|g")
+    assert len(parser._gauges) == 2
+    batch.flush()
+
+    # b was updated least recently, so it was forgotten
+    parser.parse(b"a:+1|g\nb:+1|g")
+    assert {item["name"]: item["value"] for item in batch.flush()[0]} == {"a": 3, "b": 1}
+    assert len(parser._gauges) == 2
+
+
+def test_parser_shared_by_threads():
+    batch = MetricBatch()
+    parser = StatsdParser(batch)
+    parser.parse(b"queue:0|g")
+    data = b"\n".join([b"queue:+1|g", b"invalid"] * 2000)
+    threads = [threading.Thread(target=parser.parse, args=(data,)) for _ in range(4)]
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert batch.flush()[0][0]["value"] == 8000
+    assert parser.invalid == 8000
+
+
+def wait_for(batch, name, expected):
+    deadline = time.monotonic() + 5
+    total = 0
+    while time.monotonic() < deadline:
+        for item in batch.flush()[0]:
+            if item["name"] == name:
+                total += item["value"]
+        if total >= expected:
+            return total
+        time.sleep(0.01)
+    return total
+
+
+@pytest.mark.parametrize("sockets", (1, 4))
+def test_listener(sockets):
+    if sockets > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        pytest.skip("SO_REUSEPORT is not available")
+
+    batch = MetricBatch()
+    listener = StatsdListener(batch, port=0, sockets=sockets)
+    listener.start()
+    try:
+        senders = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(8)]
+        for sender in senders:
+            for _ in range(10):
+                sender.sendto(b"hits:1|c\nhits:1|c", listener.address)
+        assert wait_for(batch, "hits", 160) == 160
+        assert listener.received == 80
+    finally:
+        for sender in senders:
+            sender.close()
+        listener.stop()
+
+
+def test_listener_requires_reuse_port(monkeypatch):
+    monkeypatch.delattr(socket, "SO_REUSEPORT", raising=False)
+    with pytest.raises(ValueError, match="SO_REUSEPORT"):
+        StatsdListener(MetricBatch(), port=0, sockets=2)
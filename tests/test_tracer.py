@@ -0,0 +1,187 @@
+# Copyright 2019 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from newrelic_telemetry_sdk.batch import SpanBatch
+from newrelic_telemetry_sdk.compact import CompactSpan
+from newrelic_telemetry_sdk.sampling import HeadSampler
+from newrelic_telemetry_sdk.span import NOOP_SPAN, Span
+from newrelic_telemetry_sdk.tracer import IdPool, Tracer
+
+
+def test_id_pool_refills():
+    pool = IdPool(size=4)
+    ids = [pool.next_id() for _ in range(10)]
+    assert len(set(ids)) == 10
+    for value in ids:
+        assert len(value) == 16
+        int(value, 16)
+
+
+def test_id_pool_threads():
+    pool = IdPool(size=8)
+    ids = []
+
+    def take():
+        ids.extend(pool.next_id() for _ in range(1000))
+
+    threads = [threading.Thread(target=take) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(ids)) == 4000
+
+
+@pytest.mark.parametrize("span_cls", (Span, CompactSpan))
+def test_tracer_links_spans(span_cls):
+    batch = SpanBatch()
+    tracer = Tracer(batch, span_cls=span_cls)
+
+    assert tracer.current_span() is None
+    with tracer.start_span("root", {"foo": "bar"}) as root:
+        assert tracer.current_span() is root
+        with tracer.start_span("child") as child:
+            assert tracer.current_span() is child
+        assert tracer.current_span() is root
+        with tracer.start_span("sibling") as sibling:
+            pass
+    assert tracer.current_span() is None
+
+    assert isinstance(root, span_cls)
+    assert root["attributes"]["foo"] == "bar"
+    assert "parent.id" not in root["attributes"]
+    for span in (child, sibling):
+        assert span["trace.id"] == root["trace.id"]
+        assert span["attributes"]["parent.id"] == root["id"]
+    assert len({root["id"], child["id"], sibling["id"]}) == 3
+
+    items = batch.flush()[0]
+    assert items == (child, sibling, root)
+    assert all("duration.ms" in span["attributes"] for span in items)
+
+
+def test_tracer_new_trace_per_root():
+    tracer = Tracer(SpanBatch())
+    with tracer.start_span("one") as one:
+        pass
+    with tracer.start_span("two") as two:
+        pass
+    assert one["trace.id"] != two["trace.id"]
+
+
+def test_tracer_records_errors():
+    batch = SpanBatch()
+    tracer = Tracer(batch)
+    with pytest.raises(ValueError, match="oops"), tracer.start_span("root"):
+        raise ValueError("oops")
+
+    (span,) = batch.flush()[0]
+    assert span["attributes"]["error.class"] == "builtins.ValueError"
+    assert span["attributes"]["error.message"] == "oops"
+    assert tracer.current_span() is None
+
+
+def test_tracer_records_errors_compact():
+    batch = SpanBatch()
+    tracer = Tracer(batch, span_cls=CompactSpan)
+    with pytest.raises(KeyError), tracer.start_span("root"):
+        raise KeyError("key")
+
+    (span,) = batch.flush()[0]
+    assert span["attributes"]["error.class"] == "builtins.KeyError"
+
+
+def test_tracer_sampler():
+    batch = SpanBatch()
+    tracer = Tracer(batch, sampler=HeadSampler(0))
+    with tracer.start_span("root") as root:
+        assert tracer.current_span() is NOOP_SPAN
+        with tracer.start_span("child") as child:
+            pass
+    assert root is NOOP_SPAN
+    assert child is NOOP_SPAN
+    assert batch.flush()[0] == ()
+
+    tracer = Tracer(batch, sampler=HeadSampler(1))
+    with tracer.start_span("root") as root, tracer.start_span("child") as child:
+        pass
+    assert child["attributes"]["parent.id"] == root["id"]
+    assert len(batch.flush()[0]) == 2
+
+
+def test_tracer_traced():
+    batch = SpanBatch()
+    tracer = Tracer(batch)
+
+    @tracer.traced()
+    def inner():
+        return tracer.current_span()
+
+    @tracer.traced("outer", {"foo": "bar"})
+    def outer():
+        return tracer.current_span(), inner()
+
+    outer_span, inner_span = outer()
+    assert outer.__name__ == "outer"
+    assert outer_span["attributes"]["name"] == "outer"
+    assert outer_span["attributes"]["foo"] == "bar"
+    assert inner_span["attributes"]["name"] == "test_tracer_traced.<locals>.inner"
+    assert inner_span["attributes"]["parent.id"] == outer_span["id"]
+
+
+def test_tracer_threads_are_isolated():
+    tracer = Tracer(SpanBatch())
+    seen = {}
+
+    def target(key):
+        seen[key] = tracer.current_span()
+
+    with tracer.start_span("root") as root:
+        thread = threading.Thread(target=target, args=("plain",))
+        thread.start()
+        thread.join()
+
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(target, "copied"))
+        thread.start()
+        thread.join()
+
+    assert seen["plain"] is None
+    assert seen["copied"] is root
+
+
+def test_tracer_asyncio_tasks():
+    tracer = Tracer(SpanBatch())
+
+    async def child(name):
+        with tracer.start_span(name) as span:
+            await asyncio.sleep(0)
+            assert tracer.current_span() is span
+        return span
+
+    async def main():
+        with tracer.start_span("root") as root:
+            spans = await asyncio.gather(child("a"), child("b"))
+        return root, spans
+
+    root, spans = asyncio.run(main())
+    for span in spans:
+        assert span["attributes"]["parent.id"] == root["id"]